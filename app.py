@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 from aws_cdk import core
+from ecs_elk.network_stack import NetworkStack
 from ecs_elk.ecr_stack import ECRStack
 from ecs_elk.auth_stack import CognitoStack
-from ecs_elk.search_stack import ElasticSearchVPCStack
-from ecs_elk.ecs_stack import ECSStack
+from ecs_elk.search_stack import DOMAIN_CAPACITY_DEFAULTS, ElasticSearchVPCStack
+from ecs_elk.capacity_planner import plan_capacity
+from ecs_elk.ecs_stack import AUTOSCALING_DEFAULTS, ECSStack
 from ecs_elk.firehose_stack import KinesisFirehoseStack
+from ecs_elk.es_cluster_stack import ElasticSearchECSStack
+from ecs_elk.monitoring_stack import MonitoringStack
+from ecs_elk.throughput_budget import (
+    annotate_budget, budget_stages, peak_records_per_second, plan_budget, render_budget_table,
+)
 
 account = os.environ["CDK_ACCOUNT"]
 region = os.environ["CDK_REGION"]
@@ -16,9 +24,56 @@ es_type_name = os.environ["ES_TYPE_NAME"]
 vpc_id = os.environ["VPC_ID"]
 security_group_id = os.environ["SECURITY_GROUP_ID"]
 repo_name = os.environ["REPO_NAME"]
+firehose_profile = os.environ.get("FIREHOSE_PROFILE", "balanced")
+firehose_s3_backup_mode = os.environ.get("FIREHOSE_S3_BACKUP_MODE")
+firehose_log_processing = os.environ.get("FIREHOSE_LOG_PROCESSING", "false").lower() == "true"
+firelens_output = os.environ.get("FIRELENS_OUTPUT", "cloudwatch")
+firehose_source_shards = int(os.environ.get("FIREHOSE_SOURCE_SHARDS", "0"))
+firehose_source_max_shards = int(os.environ.get("FIREHOSE_SOURCE_MAX_SHARDS", "16"))
+firehose_archive = os.environ.get("FIREHOSE_ARCHIVE", "false").lower() == "true"
+firehose_stream_shards = int(os.environ.get("FIREHOSE_STREAM_SHARDS", "1"))
+firelens_edge_filter = os.environ.get("FIRELENS_EDGE_FILTER", "false").lower() == "true"
+nginx_service_name = "nginx-test"
+if firehose_source_shards and firelens_output == "kinesis_firehose":
+    raise ValueError("a Firehose with a Kinesis source rejects direct puts, use FIRELENS_OUTPUT=kinesis_streams")
+index_lifecycle = os.environ.get("INDEX_LIFECYCLE", "rollover")
+es_version = os.environ.get("ES_VERSION", "7.7")
+ultrawarm_nodes = int(os.environ.get("ULTRAWARM_NODES", "0"))
+ultrawarm = {
+    "nodes": ultrawarm_nodes,
+    "warm_after": os.environ.get("ULTRAWARM_AFTER", "24h"),
+    "cold_after": os.environ.get("COLD_STORAGE_AFTER"),
+} if ultrawarm_nodes else None
+es_rollups = os.environ.get("ES_ROLLUPS", "false").lower() == "true"
+es_snapshots = os.environ.get("ES_SNAPSHOTS", "false").lower() == "true"
+ecs_es_nodes = int(os.environ.get("ECS_ES_NODES", "0"))
+# arm64 runs Graviton domain nodes (ES 7.9+), Kibana proxies and Fargate tasks
+architecture = os.environ.get("ARCHITECTURE", "x86_64")
+fargate_spot_weight = int(os.environ.get("FARGATE_SPOT_WEIGHT", "0"))
+ingest_gb_per_day = float(os.environ.get("INGEST_GB_PER_DAY", "0"))
+retention_days = int(os.environ.get("RETENTION_DAYS", "30"))
+capacity_plan = plan_capacity(
+    ingest_gb_per_day,
+    retention_days,
+    replicas=int(os.environ.get("ES_REPLICAS", "1")),
+    query_concurrency=int(os.environ.get("QUERY_CONCURRENCY", "10")),
+) if ingest_gb_per_day else None
+firehose_records_quota = int(os.environ.get("FIREHOSE_RECORDS_QUOTA", "100000"))
+# expected peak records per second, derived from INGEST_GB_PER_DAY when not given
+ingest_peak = float(os.environ.get("INGEST_PEAK_RECORDS_PER_SECOND", "0")) or (
+    peak_records_per_second(ingest_gb_per_day) if ingest_gb_per_day else 0
+)
 
 app = core.App()
 
+network = NetworkStack(
+    app,
+    "Network",
+    vpc_id=vpc_id,
+    security_group_id=security_group_id,
+    env={"account": account, "region": region}
+)
+
 ECRStack(
     app,
     "ECRStack",
@@ -32,23 +87,34 @@ CognitoStack(
     region=region,
     account=account,
     es_domain_name=es_domain_name,
-    vpc_id=vpc_id,
-    security_group_id=security_group_id,
     env={"account": account, "region": region}
 )
 
-ElasticSearchVPCStack(
+search = ElasticSearchVPCStack(
     app,
     "SearchVPCES",
     account=account,
     region=region,
     es_domain_name=es_domain_name,
-    vpc_id=vpc_id,
-    security_group_id=security_group_id,
+    es_index_name=es_index_name,
+    index_lifecycle=index_lifecycle,
+    es_version=es_version,
+    ultrawarm=ultrawarm,
+    capacity_plan=capacity_plan,
+    # per-minute and per-hour summaries for long-range dashboards, ES 7.9+
+    rollups={} if es_rollups else None,
+    # scheduled snapshots to S3, restored with utils/restore_indices.py
+    snapshots={} if es_snapshots else None,
+    architecture=architecture,
+    # the es output writes each service to its own rolled over alias
+    routed_services=[nginx_service_name] if firelens_output == "es" else None,
+    lifecycle_options={"retention": f"{retention_days}d"} if capacity_plan else None,
+    vpc=network.vpc,
+    security_group=network.security_group,
     env={"account": account, "region": region}
 )
 
-KinesisFirehoseStack(
+firehose = KinesisFirehoseStack(
     app,
     "KinesisFirehoseStack",
     region=region,
@@ -56,20 +122,98 @@ KinesisFirehoseStack(
     es_domain_name=es_domain_name,
     es_index_name=es_index_name,
     es_type_name=es_type_name,
-    vpc_id=vpc_id,
-    security_group_id=security_group_id,
+    throughput_profile=firehose_profile,
+    s3_backup_mode=firehose_s3_backup_mode,
+    # with the rollover lifecycle Firehose writes to the alias and ISM rotates
+    index_rotation_period="NoRotation" if index_lifecycle == "rollover" else "OneHour",
+    log_processing=firehose_log_processing,
+    # DirectPut unless a Kinesis source stream absorbs the bursts
+    source_stream={
+        "shards": firehose_source_shards,
+        "max_shards": firehose_source_max_shards,
+    } if firehose_source_shards else None,
+    # partitioned Parquet copy in S3, read from the source stream
+    archive={} if firehose_archive else None,
+    # DirectPut streams the services are spread over
+    delivery_stream_shards=firehose_stream_shards,
+    vpc=network.vpc,
+    security_group=network.security_group,
     env={"account": account, "region": region}
 )
 
-ECSStack(
+ecs_service = ECSStack(
     app,
     "ECSStack",
     region=region,
-    vpc_id=vpc_id,
-    security_group_id=security_group_id,
+    log_output=firelens_output,
+    es_index_name=es_index_name,
+    service_name=nginx_service_name,
+    routing={"delivery_stream_shards": firehose_stream_shards},
+    # drop health checks, sample successful hits and cap each task's rate
+    router_filters={
+        "enabled": True,
+        "sample": {"2xx": float(os.environ.get("FIRELENS_SAMPLE_2XX", "1.0"))},
+        "rate_limit": int(os.environ.get("FIRELENS_RATE_LIMIT", "0")),
+    } if firelens_edge_filter else None,
+    architecture=architecture,
+    # FARGATE for the base tasks, the rest split between FARGATE and FARGATE_SPOT by weight
+    capacity_providers={
+        "base": int(os.environ.get("FARGATE_BASE", "1")),
+        "on_demand_weight": int(os.environ.get("FARGATE_WEIGHT", "1")),
+        "spot_weight": fargate_spot_weight,
+    } if fargate_spot_weight else None,
+    vpc=network.vpc,
+    security_group=network.security_group,
+    env={"account": account, "region": region}
+)
+
+MonitoringStack(
+    app,
+    "PipelineMonitoring",
+    es_domain_name=es_domain_name,
+    es_data_nodes=(capacity_plan or DOMAIN_CAPACITY_DEFAULTS)["data_nodes"],
+    throughput_profile=firehose_profile,
+    # DirectPut quota of the region, or the write limit of the largest source stream
+    records_per_second_limit=firehose_source_max_shards * 1000
+    if firehose_source_shards else firehose_records_quota,
+    ecs_autoscaling=AUTOSCALING_DEFAULTS,
+    alarm_email=os.environ.get("ALARM_EMAIL"),
     env={"account": account, "region": region}
 )
 
+if ecs_es_nodes:
+    ElasticSearchECSStack(
+        app,
+        "SearchECSES",
+        region=region,
+        repo_name=repo_name,
+        cluster={
+            "nodes": ecs_es_nodes,
+            "master_nodes": min(ecs_es_nodes, 3),
+            "instance_type": os.environ.get("ECS_ES_INSTANCE_TYPE", "i3.xlarge"),
+        },
+        architecture=architecture,
+        vpc=network.vpc,
+        env={"account": account, "region": region}
+    )
+
+if ingest_peak:
+    # every stage the router feeds has to clear the expected peak with headroom
+    budget = plan_budget(
+        ingest_peak,
+        budget_stages(ecs_service.ingest_capacity, firehose.ingest_capacity, search.ingest_capacity,
+                      firehose_records_per_second=firehose_records_quota,
+                      firehose_mib_per_second=float(os.environ.get("FIREHOSE_MIB_QUOTA", "1"))),
+        headroom=float(os.environ.get("THROUGHPUT_HEADROOM", "1.5")),
+    )
+    # stdout is not the place, the CLI reads the synth output from there
+    print(render_budget_table(budget), file=sys.stderr)
+    annotate_budget(
+        budget,
+        {"ecs": ecs_service, "firehose": firehose, "search": search},
+        fail=os.environ.get("THROUGHPUT_BUDGET", "warn") == "fail",
+    )
+
 core.Tags.of(app).add("Owner", "keehyun")
 
 app.synth()
@@ -0,0 +1,38 @@
+import re
+
+
+ARCHITECTURES = ("x86_64", "arm64")
+
+# Graviton2 family standing in for each x86 family the stacks use. i3 has
+# no Graviton twin, r6gd keeps the memory and the instance-store NVMe.
+GRAVITON_FAMILIES = {
+    "r5": "r6g",
+    "m5": "m6g",
+    "c5": "c6g",
+    "t3": "t4g",
+    "i3": "r6gd",
+}
+# r6g, m6gd, c6gn, t4g ...
+GRAVITON_FAMILY_RE = re.compile(r"^[a-z]+\d+g[a-z]*$")
+
+
+def check_architecture(architecture: str) -> str:
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture '{architecture}', expected one of {list(ARCHITECTURES)}")
+    return architecture
+
+
+def instance_type_for(instance_type: str, architecture: str) -> str:
+    """Graviton counterpart of instance_type on arm64, the type itself on x86_64.
+
+    r5.large.elasticsearch becomes r6g.large.elasticsearch; types that are
+    already Graviton are returned as they are.
+    """
+    if check_architecture(architecture) == "x86_64":
+        return instance_type
+    family, size = instance_type.split(".", 1)
+    if GRAVITON_FAMILY_RE.match(family):
+        return instance_type
+    if family not in GRAVITON_FAMILIES:
+        raise ValueError(f"No Graviton counterpart for {instance_type}, pass an arm64 instance type")
+    return f"{GRAVITON_FAMILIES[family]}.{size}"
@@ -1,33 +1,19 @@
 from aws_cdk import (
     core,
-    aws_ec2 as ec2,
     aws_cognito as cg,
-    aws_lambda as lambda_,
     aws_iam as iam,
     aws_ssm as ssm,
 )
+from ecs_elk.role_names import BOOTSTRAP_ROLE_NAME, SNAPSHOT_ROLE_NAME
 
 
 class CognitoStack(core.Stack):
 
     def __init__(self, scope: core.Construct, construct_id: str,
                  region: str, account: str, es_domain_name: str,
-                 vpc_id: str, security_group_id: str,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        vpc = ec2.Vpc.from_lookup(
-            self,
-            "VPC",
-            vpc_id=vpc_id
-        )
-
-        sg = ec2.SecurityGroup.from_lookup(
-            self,
-            "SecurityGroup",
-            security_group_id=security_group_id
-        )
-
         # lambda_role = iam.Role(
         #     self,
         #     "OctankBaseCognito_PostConfirmationLambdaRole",
@@ -94,7 +80,12 @@ class CognitoStack(core.Stack):
         client = self._user_pool.add_client(
             "KeehyunUserPoolAppClient",
             user_pool_client_name="KeehyunUserPoolAppClient",
-            generate_secret=False
+            generate_secret=False,
+            # utils/es_query_client.py logs in without the hosted UI
+            auth_flows=cg.AuthFlow(
+                user_password=True,
+                user_srp=True
+            )
         )
 
         self._user_pool.add_domain(
@@ -194,6 +185,14 @@ class CognitoStack(core.Stack):
             roles={
                 'unauthenticated': unauthenticated_role.role_arn,
                 'authenticated': authenticated_role.role_arn
+            },
+            # members of the ESAdmin group get its role from their token
+            role_mappings={
+                'userpool': cg.CfnIdentityPoolRoleAttachment.RoleMappingProperty(
+                    type="Token",
+                    ambiguous_role_resolution="AuthenticatedRole",
+                    identity_provider=f"{self._user_pool.user_pool_provider_name}:{client.user_pool_client_id}"
+                )
             }
         )
 
@@ -216,6 +215,20 @@ class CognitoStack(core.Stack):
             )
         )
 
+        # lets the bootstrap custom resource act as the domain master user
+        es_admin_role.assume_role_policy.add_statements(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["sts:AssumeRole"],
+                principals=[iam.AccountRootPrincipal()],
+                conditions={
+                    "ArnEquals": {
+                        "aws:PrincipalArn": f"arn:aws:iam::{account}:role/{BOOTSTRAP_ROLE_NAME}"
+                    }
+                }
+            )
+        )
+
         es_admin_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
@@ -224,6 +237,15 @@ class CognitoStack(core.Stack):
             )
         )
 
+        # registering the snapshot repository passes the snapshot role to the domain
+        es_admin_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[f"arn:aws:iam::{account}:role/{SNAPSHOT_ROLE_NAME}"],
+                actions=["iam:PassRole"]
+            )
+        )
+
         cg.CfnUserPoolGroup(
             self,
             "KeehyunUserPoolGroup",
@@ -248,6 +270,13 @@ class CognitoStack(core.Stack):
             string_value=self._user_pool.user_pool_arn
         )
 
+        ssm.StringParameter(
+            self,
+            "AppClientIDStringParameter",
+            parameter_name="user-pool-client-id",
+            string_value=client.user_pool_client_id
+        )
+
         ssm.StringParameter(
             self,
             "IdentityPoolIDStringParameter",
@@ -0,0 +1,165 @@
+import math
+
+
+# vCPUs, memory in GiB and the largest EBS volume the service allows per node
+DATA_NODE_TYPES = {
+    "r5.large.elasticsearch": {"vcpu": 2, "memory": 16, "max_volume_gb": 1024},
+    "r5.xlarge.elasticsearch": {"vcpu": 4, "memory": 32, "max_volume_gb": 1536},
+    "r5.2xlarge.elasticsearch": {"vcpu": 8, "memory": 64, "max_volume_gb": 3072},
+    "r5.4xlarge.elasticsearch": {"vcpu": 16, "memory": 128, "max_volume_gb": 6144},
+    "r5.12xlarge.elasticsearch": {"vcpu": 48, "memory": 384, "max_volume_gb": 12288},
+}
+
+# dedicated master type by the number of data nodes it manages
+MASTER_NODE_TYPES = [
+    (10, "m5.large.elasticsearch"),
+    (30, "c5.2xlarge.elasticsearch"),
+    (75, "c5.4xlarge.elasticsearch"),
+    (200, "r5.8xlarge.elasticsearch"),
+]
+
+PLANNER_DEFAULTS = {
+    # source to on-disk size: indexing overhead 10%, OS reserved 5%, service overhead 20%
+    "storage_overhead": 1.1 / 0.95 / 0.8,
+    # keep disks below the 75% low watermark headroom
+    "disk_headroom": 0.75,
+    "target_shard_gb": 25,
+    "shards_per_heap_gb": 20,
+    # peak over average ingest, and bytes written per ingested byte including merges
+    "ingest_peak_factor": 3,
+    "write_amplification": 3,
+    # gp3 baseline and per-volume limits
+    "gp3_base_iops": 3000,
+    "gp3_max_iops": 16000,
+    "gp3_base_throughput": 125,
+    "gp3_max_throughput": 1000,
+    "io_size_kib": 64,
+    # nodes per type before the planner prefers a larger type
+    "preferred_max_nodes": 20,
+    "max_data_nodes": 80,
+}
+
+
+def _heap_gb(memory_gb: float) -> float:
+    return min(memory_gb / 2, 32)
+
+
+def _search_threads(vcpu: int) -> int:
+    return int(vcpu * 3 / 2) + 1
+
+
+def _round_up(value: int, multiple: int) -> int:
+    return int(math.ceil(value / multiple) * multiple)
+
+
+def _balanced_shards(shards: int, nodes: int) -> int:
+    """Smallest count >= shards that spreads evenly over the nodes."""
+    if shards >= nodes:
+        return _round_up(shards, nodes)
+    return next(d for d in range(shards, nodes + 1) if nodes % d == 0)
+
+
+def plan_capacity(ingest_gb_per_day: float, retention_days: int,
+                  replicas: int = 1, query_concurrency: int = 10,
+                  **options) -> dict:
+    """Size the hot tier of the domain for a daily ingest volume.
+
+    Returns the data node type and count, dedicated masters, AZ count,
+    a gp3 volume per data node with its IOPS and throughput, and the
+    primary shard count and rollover size for each index.
+    """
+    if ingest_gb_per_day <= 0 or retention_days <= 0:
+        raise ValueError("ingest_gb_per_day and retention_days must be positive")
+    if replicas < 0:
+        raise ValueError("replicas can not be negative")
+    settings = dict(PLANNER_DEFAULTS, **options)
+
+    storage_gb = ingest_gb_per_day * retention_days * (1 + replicas) * settings["storage_overhead"]
+    daily_primary_gb = ingest_gb_per_day * 1.1
+
+    def layout(nodes):
+        """Primaries per index that keep every node writing, and the indices kept in retention."""
+        primaries = _balanced_shards(math.ceil(nodes / (1 + replicas)), nodes)
+        rollover_gb = primaries * settings["target_shard_gb"]
+        indices = retention_days * max(1, math.ceil(daily_primary_gb / rollover_gb))
+        return primaries, rollover_gb, indices
+
+    candidates = []
+    for instance_type, spec in DATA_NODE_TYPES.items():
+        max_shards = _heap_gb(spec["memory"]) * settings["shards_per_heap_gb"]
+        # every shard copy needs its own node
+        nodes = max(
+            math.ceil(storage_gb / (spec["max_volume_gb"] * settings["disk_headroom"])),
+            1 + replicas,
+            2,
+        )
+        while nodes <= settings["max_data_nodes"]:
+            availability_zones = 3 if nodes >= 3 else 2
+            nodes = _round_up(nodes, availability_zones)
+            primaries, rollover_gb, indices = layout(nodes)
+            shards_fit = indices * primaries * (1 + replicas) <= nodes * max_shards
+            # a query on the write index takes one search thread per primary
+            search_fits = query_concurrency * primaries <= nodes * _search_threads(spec["vcpu"])
+            if shards_fit and search_fits:
+                break
+            nodes += 1
+        if nodes > settings["max_data_nodes"]:
+            continue
+        candidates.append((nodes > settings["preferred_max_nodes"], nodes * spec["vcpu"], nodes,
+                           instance_type, availability_zones))
+
+    if not candidates:
+        raise ValueError(f"no data node type fits {storage_gb:.0f} GB in {settings['max_data_nodes']} nodes")
+    _, _, nodes, instance_type, availability_zones = min(candidates)
+    primary_shards, rollover_gb, _ = layout(nodes)
+
+    volume_gb = max(math.ceil(storage_gb / nodes / settings["disk_headroom"]), 10)
+
+    write_mib_per_second = (
+        ingest_gb_per_day * 1024 * (1 + replicas) * settings["write_amplification"]
+        * settings["ingest_peak_factor"] / 86400 / nodes
+    )
+    throughput = min(max(math.ceil(write_mib_per_second), settings["gp3_base_throughput"]),
+                     settings["gp3_max_throughput"])
+    iops = min(max(math.ceil(write_mib_per_second * 1024 / settings["io_size_kib"]), settings["gp3_base_iops"]),
+               settings["gp3_max_iops"])
+
+    master_type = next(t for limit, t in MASTER_NODE_TYPES if nodes <= limit)
+
+    return {
+        "data_node_instance_type": instance_type,
+        "data_nodes": nodes,
+        "master_node_instance_type": master_type,
+        "master_nodes": 3,
+        "availability_zones": availability_zones,
+        "volume_size_gb": volume_gb,
+        "volume_iops": iops,
+        "volume_throughput": throughput,
+        "primary_shards": primary_shards,
+        "replicas": replicas,
+        "rollover_size_gb": rollover_gb,
+        "storage_gb": math.ceil(storage_gb),
+    }
+
+
+def capacity_shortfalls(plan: dict, capacity: dict, volume_size_gb: int = None) -> list:
+    """Describe where a configured cluster falls below the plan."""
+    shortfalls = []
+    planned = DATA_NODE_TYPES[plan["data_node_instance_type"]]
+    configured = DATA_NODE_TYPES.get(capacity["data_node_instance_type"])
+
+    if configured is None:
+        return [f"unknown data node type {capacity['data_node_instance_type']}, can not compare with the plan"]
+    if capacity["data_nodes"] * configured["vcpu"] < plan["data_nodes"] * planned["vcpu"]:
+        shortfalls.append(
+            f"{capacity['data_nodes']} x {capacity['data_node_instance_type']} has fewer vCPUs than "
+            f"the planned {plan['data_nodes']} x {plan['data_node_instance_type']}"
+        )
+    if capacity["data_nodes"] * configured["memory"] < plan["data_nodes"] * planned["memory"]:
+        shortfalls.append("configured data nodes have less memory than planned")
+    if volume_size_gb is not None and capacity["data_nodes"] * volume_size_gb < plan["data_nodes"] * plan["volume_size_gb"]:
+        shortfalls.append(
+            f"{capacity['data_nodes'] * volume_size_gb} GB of EBS is below the planned "
+            f"{plan['data_nodes'] * plan['volume_size_gb']} GB"
+        )
+    return shortfalls
@@ -4,26 +4,83 @@ from aws_cdk import (
     aws_ssm as ssm,
     aws_ec2 as ec2,
     aws_ecs as ecs,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_applicationautoscaling as appscaling,
 )
+from ecs_elk.architecture import check_architecture
+from ecs_elk.firelens import filter_settings
+from ecs_elk.log_router import FireLensLogRouter
+
+
+AUTOSCALING_DEFAULTS = {
+    "min_capacity": 1,
+    "max_capacity": 10,
+    "cpu_target": 60,
+    "memory_target": 70,
+    "requests_per_target": 1000,
+    # step scaling on top of target tracking for sudden CPU spikes
+    "cpu_steps": [
+        {"lower": 80, "change": 2},
+        {"lower": 90, "change": 4},
+    ],
+    "scale_in_cooldown": 120,
+    "scale_out_cooldown": 30,
+}
+
+# FARGATE / FARGATE_SPOT mix for the nginx service
+CAPACITY_PROVIDER_DEFAULTS = {
+    # tasks always placed on FARGATE before the weights apply
+    "base": 1,
+    "on_demand_weight": 1,
+    "spot_weight": 3,
+}
 
 
 class ECSStack(core.Stack):
 
     def __init__(self, scope: core.Construct, construct_id: str,
-                 vpc_id: str, security_group_id: str,
-                 region: str, **kwargs) -> None:
+                 vpc: ec2.IVpc, security_group: ec2.ISecurityGroup,
+                 region: str, log_output: str = "cloudwatch",
+                 delivery_stream_name: str = "keehyun-firehose",
+                 es_index_name: str = "nginx_index",
+                 service_name: str = "nginx-test", routing: dict = None,
+                 task_cpu: int = 512, task_memory_mib: int = 1024,
+                 router_cpu: int = 128, router_memory_mib: int = 128,
+                 router_buffering: dict = None, ephemeral_storage_gib: int = None,
+                 router_filters: dict = None,
+                 autoscaling: dict = None,
+                 architecture: str = "x86_64", capacity_providers: dict = None,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        vpc = ec2.Vpc.from_lookup(
-            self,
-            "VPC",
-            vpc_id=vpc_id
-        )
-        sg = ec2.SecurityGroup.from_lookup(
-            self,
-            "SecurityGroup",
-            security_group_id=security_group_id
-        )
+        scaling = dict(AUTOSCALING_DEFAULTS, **(autoscaling or {}))
+        if scaling["min_capacity"] > scaling["max_capacity"]:
+            raise ValueError("autoscaling min_capacity is larger than max_capacity")
+
+        check_architecture(architecture)
+        if capacity_providers is not None:
+            capacity_providers = dict(CAPACITY_PROVIDER_DEFAULTS, **capacity_providers)
+            if min(capacity_providers.values()) < 0:
+                raise ValueError("capacity provider base and weights can not be negative")
+            if capacity_providers["on_demand_weight"] + capacity_providers["spot_weight"] == 0:
+                raise ValueError("one capacity provider weight must be positive")
+            if architecture == "arm64" and capacity_providers["spot_weight"]:
+                core.Annotations.of(self).add_warning(
+                    "Fargate Spot does not run ARM64 tasks, the FARGATE_SPOT share of the service "
+                    "will not be placed"
+                )
+
+        filters = filter_settings(router_filters)
+        # read by the synth-time throughput budget in app.py
+        self._ingest_capacity = {
+            "log_output": log_output,
+            "max_tasks": scaling["max_capacity"],
+            "requests_per_target": scaling["requests_per_target"],
+            "router_cpu": router_cpu,
+            "rate_limit": filters["rate_limit"] if filters["enabled"] else 0,
+        }
+
+        sg = security_group
 
         cluster = ecs.Cluster(
             self,
@@ -93,13 +150,19 @@ class ECSStack(core.Stack):
         nginx_task_def = ecs.FargateTaskDefinition(
             self,
             "NginxFirelensTest",
-            cpu=512,
-            memory_limit_mib=1024,
+            cpu=task_cpu,
+            memory_limit_mib=task_memory_mib,
             execution_role=execution_role,
             family="nginx-firelens-test",
             task_role=task_role,
         )
 
+        if architecture == "arm64":
+            # FargateTaskDefinition has no runtime platform option yet
+            nginx_task_def.node.default_child.add_property_override(
+                "RuntimePlatform", {"CpuArchitecture": "ARM64", "OperatingSystemFamily": "LINUX"}
+            )
+
         vpc_es_domain_endpoint = ssm.StringParameter.from_string_parameter_attributes(
             self,
             "VPCESDomainEndpoint",
@@ -110,25 +173,7 @@ class ECSStack(core.Stack):
             "nginx-test",
             image=ecs.ContainerImage.from_registry("nginx"),
             essential=True,
-            logging=ecs.LogDrivers.firelens(
-                options={
-                    "Name": "cloudwatch",
-                    "region": region,
-                    "log_group_name": f"/aws/ecs/containerinsights/{cluster.cluster_name}/application",
-                    "auto_create_group": "true",
-                    "log_stream_name": "nginx-test"
-                }
-                # options={
-                #     "Name": "es",
-                #     "Host": vpc_es_domain_endpoint,
-                #     "Port": "443",
-                #     "Index": "nginx_index",
-                #     "Type": "nginx_type",
-                #     "Aws_Auth": "On",
-                #     "Aws_Region": region,
-                #     "tls": "On"
-                # }
-            ),
+            logging=FireLensLogRouter.log_driver(),
             memory_reservation_mib=100,
         )
 
@@ -136,15 +181,46 @@ class ECSStack(core.Stack):
             ecs.PortMapping(container_port=80)
         )
 
-        nginx_task_def.add_firelens_log_router(
-            "log_router",
-            image=ecs.ContainerImage.from_registry("amazon/aws-for-fluent-bit:latest"),
-            firelens_config=ecs.FirelensConfig(
-                type=ecs.FirelensLogRouterType.FLUENTBIT
-            ),
-            logging=ecs.LogDrivers.aws_logs(
-                stream_prefix="firelens",
-            )
+        FireLensLogRouter(
+            self,
+            "NginxLogRouter",
+            task_definition=nginx_task_def,
+            service_name=service_name,
+            region=region,
+            log_output=log_output,
+            es_host=vpc_es_domain_endpoint,
+            log_group_name=f"/aws/ecs/containerinsights/{cluster.cluster_name}/application",
+            routing=dict({
+                "index_prefix": es_index_name,
+                "delivery_stream_name": delivery_stream_name,
+            }, **(routing or {})),
+            buffering=router_buffering,
+            filters=router_filters,
+            ephemeral_storage_gib=ephemeral_storage_gib,
+            router={"cpu": router_cpu, "memory_reservation_mib": router_memory_mib},
+            architecture=architecture,
+        )
+
+        # the tasks have public IPs, so port 80 is only opened to the ALB and
+        # on groups of their own; the imported shared group is attached
+        # immutable so the target wiring adds no rules to it
+        alb_sg = ec2.SecurityGroup(
+            self,
+            "KeehyunECSServiceALBSG",
+            vpc=vpc,
+            description="Public HTTP to the nginx service ALB",
+        )
+        service_sg = ec2.SecurityGroup(
+            self,
+            "KeehyunECSServiceSG",
+            vpc=vpc,
+            description="HTTP from the nginx service ALB",
+        )
+        shared_sg = ec2.SecurityGroup.from_security_group_id(
+            self,
+            "SharedSecurityGroup",
+            sg.security_group_id,
+            mutable=False
         )
 
         service = ecs.FargateService(
@@ -153,11 +229,115 @@ class ECSStack(core.Stack):
             service_name="KeehyunECSService",
             cluster=cluster,
             task_definition=nginx_task_def,
-            desired_count=1,
+            desired_count=scaling["min_capacity"],
             enable_ecs_managed_tags=True,
             assign_public_ip=True,
             vpc_subnets=ec2.SubnetSelection(
                 subnet_type=ec2.SubnetType.PUBLIC
             ),
-            security_groups=[sg],
+            # the shared group for the domain and the rest of the stacks, the
+            # service group for the only ingress the tasks take, from the ALB
+            security_groups=[service_sg, shared_sg],
+        )
+
+        if capacity_providers is not None:
+            # set on the L1 resources, a service takes either a launch type
+            # or a capacity provider strategy
+            cluster.node.default_child.add_property_override(
+                "CapacityProviders", ["FARGATE", "FARGATE_SPOT"]
+            )
+            # the service's L1 child is "Service", default_child only finds "Resource"
+            cfn_service = service.node.find_child("Service")
+            cfn_service.add_property_deletion_override("LaunchType")
+            cfn_service.add_property_override("CapacityProviderStrategy", [
+                {
+                    "CapacityProvider": "FARGATE",
+                    "Base": capacity_providers["base"],
+                    "Weight": capacity_providers["on_demand_weight"],
+                },
+                {
+                    "CapacityProvider": "FARGATE_SPOT",
+                    "Weight": capacity_providers["spot_weight"],
+                },
+            ])
+
+        alb = elbv2.ApplicationLoadBalancer(
+            self,
+            "KeehyunECSServiceALB",
+            vpc=vpc,
+            internet_facing=True,
+            vpc_subnets=ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PUBLIC
+            ),
+            security_group=alb_sg,
+        )
+
+        # open=True only adds 0.0.0.0/0:80 to the ALB's own group
+        listener = alb.add_listener(
+            "HttpListener",
+            port=80,
+            open=True
+        )
+
+        target_group = listener.add_targets(
+            "NginxTargets",
+            port=80,
+            targets=[service],
+            deregistration_delay=core.Duration.seconds(30),
+        )
+
+        core.CfnOutput(
+            self,
+            "ServiceURL",
+            value=f"http://{alb.load_balancer_dns_name}"
         )
+
+        scalable_target = service.auto_scale_task_count(
+            min_capacity=scaling["min_capacity"],
+            max_capacity=scaling["max_capacity"]
+        )
+
+        scale_in_cooldown = core.Duration.seconds(scaling["scale_in_cooldown"])
+        scale_out_cooldown = core.Duration.seconds(scaling["scale_out_cooldown"])
+
+        scalable_target.scale_on_cpu_utilization(
+            "CpuTargetTracking",
+            target_utilization_percent=scaling["cpu_target"],
+            scale_in_cooldown=scale_in_cooldown,
+            scale_out_cooldown=scale_out_cooldown
+        )
+
+        scalable_target.scale_on_memory_utilization(
+            "MemoryTargetTracking",
+            target_utilization_percent=scaling["memory_target"],
+            scale_in_cooldown=scale_in_cooldown,
+            scale_out_cooldown=scale_out_cooldown
+        )
+
+        scalable_target.scale_on_request_count(
+            "RequestCountTargetTracking",
+            requests_per_target=scaling["requests_per_target"],
+            target_group=target_group,
+            scale_in_cooldown=scale_in_cooldown,
+            scale_out_cooldown=scale_out_cooldown
+        )
+
+        if scaling["cpu_steps"]:
+            scalable_target.scale_on_metric(
+                "CpuStepScaling",
+                metric=service.metric_cpu_utilization(
+                    period=core.Duration.minutes(1)
+                ),
+                scaling_steps=[
+                    appscaling.ScalingInterval(upper=scaling["cpu_steps"][0]["lower"], change=0)
+                ] + [
+                    appscaling.ScalingInterval(lower=step["lower"], change=step["change"])
+                    for step in scaling["cpu_steps"]
+                ],
+                adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+                cooldown=scale_out_cooldown
+            )
+
+    @property
+    def ingest_capacity(self) -> dict:
+        return dict(self._ingest_capacity)
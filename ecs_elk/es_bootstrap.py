@@ -0,0 +1,95 @@
+import json
+
+from aws_cdk import (
+    core,
+    aws_iam as iam,
+    aws_ec2 as ec2,
+    aws_lambda as lambda_,
+    aws_logs as cloudwatch_logs,
+    custom_resources as cr,
+)
+from ecs_elk.role_names import BOOTSTRAP_ROLE_NAME
+
+
+class ElasticsearchBootstrap(core.Construct):
+    """Custom resource that applies a list of REST requests to the domain.
+
+    The function runs in the domain's VPC and signs requests as the
+    fine-grained access control master role so it can manage ISM
+    policies, templates and aliases.
+    """
+
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 domain_endpoint: str, admin_role_arn: str,
+                 vpc: ec2.IVpc, security_group: ec2.ISecurityGroup,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        role = iam.Role(
+            self,
+            "BootstrapRole",
+            role_name=BOOTSTRAP_ROLE_NAME,
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaVPCAccessExecutionRole"
+                ),
+            ]
+        )
+
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["sts:AssumeRole"],
+                resources=[admin_role_arn]
+            )
+        )
+
+        self._function = lambda_.Function(
+            self,
+            "BootstrapFunction",
+            handler="handler.handler",
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            code=lambda_.Code.from_asset("resources/es_bootstrap"),
+            timeout=core.Duration.minutes(5),
+            environment={
+                "ADMIN_ROLE_ARN": admin_role_arn,
+            },
+            role=role,
+            vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PRIVATE
+            ),
+            security_groups=[security_group],
+            log_retention=cloudwatch_logs.RetentionDays.ONE_WEEK,
+        )
+
+        self._provider = cr.Provider(
+            self,
+            "BootstrapProvider",
+            on_event_handler=self._function,
+            log_retention=cloudwatch_logs.RetentionDays.ONE_WEEK,
+        )
+
+        self._domain_endpoint = domain_endpoint
+        self._role = role
+
+    @property
+    def role(self) -> iam.IRole:
+        """Role trusted to act as the domain master user."""
+        return self._role
+
+    def add_requests(self, construct_id: str, requests: list,
+                     delete_requests: list = None) -> core.CustomResource:
+        return core.CustomResource(
+            self,
+            construct_id,
+            service_token=self._provider.service_token,
+            resource_type="Custom::ElasticsearchBootstrap",
+            properties={
+                "Name": construct_id,
+                "Endpoint": self._domain_endpoint,
+                "Requests": json.dumps(requests, sort_keys=True),
+                "DeleteRequests": json.dumps(delete_requests or [], sort_keys=True),
+            }
+        )
@@ -0,0 +1,239 @@
+from aws_cdk import (
+    core,
+    aws_iam as iam,
+    aws_ssm as ssm,
+    aws_ec2 as ec2,
+    aws_ecr as ecr,
+    aws_ecs as ecs,
+    aws_elasticloadbalancingv2 as elbv2,
+)
+from ecs_elk.architecture import instance_type_for
+
+
+# discovery.ec2.tag.ElasticSearch in resources/elasticsearch.yml
+DISCOVERY_TAG = ("ElasticSearch", "nonprod")
+
+DATA_PATH = "/mnt/es-data"
+BOOTSTRAP_PATH = "/mnt/es-bootstrap"
+
+ES_CLUSTER_DEFAULTS = {
+    # i3 instances carry instance-store NVMe, user data stripes and mounts it
+    "instance_type": "i3.xlarge",
+    "nodes": 3,
+    "master_nodes": 3,
+    "task_memory_mib": 28672,
+    "image_tag": "latest",
+}
+
+# above ~31 GiB the JVM loses compressed object pointers
+MAX_HEAP_MIB = 31744
+
+
+def heap_size_mib(task_memory_mib: int) -> int:
+    """Half of the task memory for the heap, the rest stays for the page cache."""
+    return min(task_memory_mib // 2, MAX_HEAP_MIB)
+
+
+class ElasticSearchECSStack(core.Stack):
+    """Self-managed Elasticsearch cluster on ECS running the image from ECRStack.
+
+    Every instance runs one node (daemon service, host networking) with its
+    data path on the instance-store NVMe. Nodes find each other through
+    discovery-ec2 and get their zone from cloud.node.auto_attributes. The
+    cluster has no authentication, so the nodes stay out of the shared
+    security group and take ingress on a group of their own.
+    """
+
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 vpc: ec2.IVpc, region: str, repo_name: str, cluster: dict = None,
+                 architecture: str = "x86_64", **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        settings = dict(ES_CLUSTER_DEFAULTS, **(cluster or {}))
+        if settings["master_nodes"] > settings["nodes"]:
+            raise ValueError("master_nodes is larger than nodes")
+
+        heap_mib = heap_size_mib(settings["task_memory_mib"])
+        # r6gd on arm64, the image is built for both by aws-ecr-bake-and-push.sh
+        instance_type = instance_type_for(settings["instance_type"], architecture)
+
+        sg = ec2.SecurityGroup(
+            self,
+            "ESNodeSG",
+            vpc=vpc,
+            description="Elasticsearch transport between the nodes and HTTP through the NLB",
+        )
+        sg.add_ingress_rule(
+            peer=sg,
+            connection=ec2.Port.tcp(9300),
+            description="Elasticsearch transport"
+        )
+        # the NLB has no security group and keeps client addresses, HTTP is
+        # open to the whole VPC, which covers the NLB's health checks
+        sg.add_ingress_rule(
+            peer=ec2.Peer.ipv4(vpc.vpc_cidr_block),
+            connection=ec2.Port.tcp(9200),
+            description="Elasticsearch HTTP"
+        )
+
+        es_cluster = ecs.Cluster(
+            self,
+            "KeehyunESCluster",
+            cluster_name="KeehyunESCluster",
+            vpc=vpc
+        )
+
+        capacity = es_cluster.add_capacity(
+            "ESNodes",
+            instance_type=ec2.InstanceType(instance_type),
+            machine_image=ecs.EcsOptimizedImage.amazon_linux2(
+                ecs.AmiHardwareType.ARM if architecture == "arm64" else ecs.AmiHardwareType.STANDARD
+            ),
+            min_capacity=settings["nodes"],
+            max_capacity=settings["nodes"],
+            desired_capacity=settings["nodes"],
+            vpc_subnets=ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PRIVATE
+            ),
+        )
+        capacity.add_security_group(sg)
+        core.Tags.of(capacity).add(*DISCOVERY_TAG)
+        core.Tags.of(capacity).add("Name", "es-node")
+
+        with open("resources/es-node/user-data.sh") as fp:
+            node_user_data = (
+                fp.read()
+                .replace("__DATA_PATH__", DATA_PATH)
+                .replace("__BOOTSTRAP_PATH__", BOOTSTRAP_PATH)
+                .replace("__TAG_KEY__", DISCOVERY_TAG[0])
+                .replace("__TAG_VALUE__", DISCOVERY_TAG[1])
+                .replace("__MASTER_COUNT__", str(settings["master_nodes"]))
+            )
+        capacity.add_user_data(node_user_data)
+
+        # the user data lists the initial master nodes
+        capacity.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["ec2:DescribeInstances"],
+                resources=["*"]
+            )
+        )
+        capacity.role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name("AmazonSSMManagedInstanceCore")
+        )
+
+        task_role = iam.Role(
+            self,
+            "ESNodeTaskRole",
+            assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
+        )
+
+        # discovery-ec2 and cloud.node.auto_attributes
+        task_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "ec2:DescribeInstances",
+                    "ec2:DescribeTags",
+                ],
+                resources=["*"]
+            )
+        )
+
+        es_task_def = ecs.Ec2TaskDefinition(
+            self,
+            "ESNode",
+            family="es-node",
+            network_mode=ecs.NetworkMode.HOST,
+            task_role=task_role,
+            volumes=[
+                ecs.Volume(name="es-data", host=ecs.Host(source_path=DATA_PATH)),
+                ecs.Volume(name="es-bootstrap", host=ecs.Host(source_path=BOOTSTRAP_PATH)),
+            ]
+        )
+
+        es_container = es_task_def.add_container(
+            "elasticsearch",
+            image=ecs.ContainerImage.from_ecr_repository(
+                ecr.Repository.from_repository_name(self, "ESImageRepo", repo_name),
+                tag=settings["image_tag"]
+            ),
+            essential=True,
+            memory_limit_mib=settings["task_memory_mib"],
+            environment={
+                "REGION": region,
+                "ES_JAVA_OPTS": f"-Xms{heap_mib}m -Xmx{heap_mib}m",
+            },
+            logging=ecs.LogDrivers.aws_logs(
+                stream_prefix="es-node",
+            )
+        )
+
+        es_container.add_ulimits(
+            # bootstrap.memory_lock
+            ecs.Ulimit(name=ecs.UlimitName.MEMLOCK, soft_limit=-1, hard_limit=-1),
+            ecs.Ulimit(name=ecs.UlimitName.NOFILE, soft_limit=65535, hard_limit=65535),
+        )
+
+        es_container.add_port_mappings(
+            ecs.PortMapping(container_port=9200),
+            ecs.PortMapping(container_port=9300),
+        )
+
+        es_container.add_mount_points(
+            ecs.MountPoint(
+                source_volume="es-data",
+                container_path="/usr/share/elasticsearch/data",
+                read_only=False
+            ),
+            ecs.MountPoint(
+                source_volume="es-bootstrap",
+                container_path="/bootstrap",
+                read_only=True
+            ),
+        )
+
+        ecs.Ec2Service(
+            self,
+            "ESNodeService",
+            service_name="ESNodeService",
+            cluster=es_cluster,
+            task_definition=es_task_def,
+            daemon=True,
+            # replacing a node drops its instance-store shards, one at a time
+            min_healthy_percent=100 - 100 // settings["nodes"],
+        )
+
+        es_nlb = elbv2.NetworkLoadBalancer(
+            self,
+            "ESClusterNLB",
+            vpc=vpc,
+            internet_facing=False,
+            vpc_subnets=ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PRIVATE
+            ),
+        )
+
+        es_nlb.add_listener(
+            "HttpListener",
+            port=9200
+        ).add_targets(
+            "ESNodeTargets",
+            port=9200,
+            targets=[capacity],
+            deregistration_delay=core.Duration.seconds(30),
+        )
+
+        ssm.StringParameter(
+            self,
+            "ECSESClusterEndpointStringParameter",
+            parameter_name="ecs-es-cluster-endpoint",
+            string_value=es_nlb.load_balancer_dns_name
+        )
+
+        core.CfnOutput(
+            self,
+            "Output",
+            value=f"http://{es_nlb.load_balancer_dns_name}:9200"
+        )
@@ -0,0 +1,30 @@
+# buffer sizes are in MiB, intervals and retry durations in seconds
+THROUGHPUT_PROFILES = {
+    "low-latency": {
+        "es_buffer_size": 1,
+        "es_buffer_interval": 60,
+        "retry_duration": 60,
+        "s3_buffer_size": 5,
+        "s3_buffer_interval": 60,
+        "s3_compression_format": "Snappy",
+        "s3_backup_mode": "FailedDocumentsOnly",
+    },
+    "balanced": {
+        "es_buffer_size": 5,
+        "es_buffer_interval": 120,
+        "retry_duration": 300,
+        "s3_buffer_size": 32,
+        "s3_buffer_interval": 300,
+        "s3_compression_format": "GZIP",
+        "s3_backup_mode": "AllDocuments",
+    },
+    "bulk-heavy": {
+        "es_buffer_size": 50,
+        "es_buffer_interval": 300,
+        "retry_duration": 900,
+        "s3_buffer_size": 128,
+        "s3_buffer_interval": 900,
+        "s3_compression_format": "GZIP",
+        "s3_backup_mode": "AllDocuments",
+    },
+}
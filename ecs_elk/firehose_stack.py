@@ -1,30 +1,101 @@
 from aws_cdk import (
     core,
     aws_iam as iam,
-    aws_ssm as ssm,
     aws_ec2 as ec2,
     aws_s3 as s3,
+    aws_kinesis as kinesis,
     aws_kinesisfirehose as firehose,
     aws_logs as cloudwatch_logs,
 )
+from ecs_elk.firehose_profiles import THROUGHPUT_PROFILES
+from ecs_elk.firelens import delivery_stream_names
+
+
+SOURCE_STREAM_DEFAULTS = {
+    "shards": 2,
+    "min_shards": 1,
+    "max_shards": 16,
+    "retention_hours": 24,
+    # peak utilization of the per-shard write limits, in percent
+    "target_utilization": 60,
+    "scale_in_utilization": 25,
+    "scaler_interval_minutes": 5,
+    "lookback_minutes": 15,
+}
+
+ARCHIVE_DEFAULTS = {
+    "bucket_name": "firehose-log-archive",
+    # record format conversion needs at least a 64 MiB buffer
+    "buffer_size": 128,
+    "buffer_interval": 900,
+    "compression": "SNAPPY",
+    "processor_buffer_size": 3,
+    "processor_buffer_interval": 60,
+}
 
 
 class KinesisFirehoseStack(core.Stack):
 
     def __init__(self, scope: core.Construct, construct_id: str,
-                 vpc_id: str, security_group_id: str,
+                 vpc: ec2.IVpc, security_group: ec2.ISecurityGroup,
                  region: str, account: str,
                  es_domain_name: str, es_index_name: str, es_type_name: str,
+                 throughput_profile: str = "balanced",
+                 s3_backup_mode: str = None,
+                 index_rotation_period: str = "OneHour",
+                 log_processing: bool = False,
+                 parse_failure_mode: str = "tag",
+                 processor_buffer_size: int = 1,
+                 processor_buffer_interval: int = 60,
+                 processor_memory_size: int = 256,
+                 source_stream: dict = None,
+                 archive: dict = None,
+                 delivery_stream_shards: int = 1,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        if throughput_profile not in THROUGHPUT_PROFILES:
+            raise ValueError(
+                f"Unknown throughput profile '{throughput_profile}', "
+                f"expected one of {sorted(THROUGHPUT_PROFILES)}"
+            )
+        profile = THROUGHPUT_PROFILES[throughput_profile]
+
+        if s3_backup_mode is None:
+            s3_backup_mode = profile["s3_backup_mode"]
+        if s3_backup_mode not in ("AllDocuments", "FailedDocumentsOnly"):
+            raise ValueError(f"Unknown S3 backup mode '{s3_backup_mode}'")
+        if parse_failure_mode not in ("tag", "drop"):
+            raise ValueError(f"Unknown parse failure mode '{parse_failure_mode}'")
+
+        if source_stream is not None:
+            source_stream = dict(SOURCE_STREAM_DEFAULTS, **source_stream)
+            if not source_stream["min_shards"] <= source_stream["shards"] <= source_stream["max_shards"]:
+                raise ValueError("source stream shards must be between min_shards and max_shards")
+        if archive is not None:
+            if source_stream is None:
+                # the archive stream reads the same records as a second consumer
+                raise ValueError("the Parquet archive requires the Kinesis source stream")
+            archive = dict(ARCHIVE_DEFAULTS, **archive)
+
+        if delivery_stream_shards > 1 and source_stream is not None:
+            # a Kinesis source scales by its own shards and feeds one delivery stream
+            raise ValueError("delivery_stream_shards only applies to DirectPut delivery streams")
+
         delivery_stream_name = "keehyun-firehose"
 
+        # read by the synth-time throughput budget in app.py
+        self._ingest_capacity = {
+            "delivery_streams": delivery_stream_shards,
+            # the scaler never grows the source stream past max_shards
+            "source_shards": source_stream["max_shards"] if source_stream is not None else None,
+        }
+
         firehose_log_group = cloudwatch_logs.LogGroup(
             self,
             "KinesisFirehoseLogGroup",
             log_group_name=f"/aws/kinesisfirehose/{delivery_stream_name}",
-            retention=cloudwatch_logs.RetentionDays.INFINITE
+            retention=cloudwatch_logs.RetentionDays.ONE_MONTH
         )
 
         s3_log_stream = cloudwatch_logs.LogStream(
@@ -41,17 +112,6 @@ class KinesisFirehoseStack(core.Stack):
             log_stream_name="ElasticsearchDelivery"
         )
 
-        vpc = ec2.Vpc.from_lookup(
-            self,
-            "VPC",
-            vpc_id=vpc_id
-        )
-        # sg = ec2.SecurityGroup.from_lookup(
-        #     self,
-        #     "SecurityGroup",
-        #     security_group_id=security_group_id
-        # )
-
         # S3 bucket
         backup_bucket = s3.Bucket(
             self,
@@ -178,12 +238,17 @@ class KinesisFirehoseStack(core.Stack):
         s3_config = firehose.CfnDeliveryStream.S3DestinationConfigurationProperty(
             bucket_arn=backup_bucket.bucket_arn,
             role_arn=firehose_delivery_role.role_arn,
+            buffering_hints=firehose.CfnDeliveryStream.BufferingHintsProperty(
+                size_in_m_bs=profile["s3_buffer_size"],
+                interval_in_seconds=profile["s3_buffer_interval"]
+            ),
+            compression_format=profile["s3_compression_format"],
             cloud_watch_logging_options=s3_logging_config
         )
 
         vpc_config = firehose.CfnDeliveryStream.VpcConfigurationProperty(
             role_arn=firehose_delivery_role.role_arn,
-            security_group_ids=[security_group_id],
+            security_group_ids=[security_group.security_group_id],
             subnet_ids=vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE).subnet_ids
         )
 
@@ -199,26 +264,356 @@ class KinesisFirehoseStack(core.Stack):
         #     parameter_name="vpc-es-domain-endpoint"
         # ).string_value
 
+        processing_config = None
+        if log_processing:
+            # only loaded when the processor is enabled to keep synth light
+            from aws_cdk import aws_lambda as lambda_
+
+            log_processor = lambda_.Function(
+                self,
+                "FirehoseLogProcessor",
+                function_name=f"{delivery_stream_name}-log-processor",
+                handler="handler.handler",
+                runtime=lambda_.Runtime.PYTHON_3_8,
+                code=lambda_.Code.from_asset("resources/firehose_processor"),
+                memory_size=processor_memory_size,
+                timeout=core.Duration.minutes(1),
+                environment={
+                    "PARSE_FAILURE_MODE": parse_failure_mode,
+                },
+                log_retention=cloudwatch_logs.RetentionDays.ONE_WEEK,
+            )
+            log_processor.grant_invoke(firehose_delivery_role)
+
+            processing_config = firehose.CfnDeliveryStream.ProcessingConfigurationProperty(
+                enabled=True,
+                processors=[
+                    firehose.CfnDeliveryStream.ProcessorProperty(
+                        type="Lambda",
+                        parameters=[
+                            firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                parameter_name="LambdaArn",
+                                parameter_value=log_processor.function_arn
+                            ),
+                            firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                parameter_name="BufferSizeInMBs",
+                                parameter_value=str(processor_buffer_size)
+                            ),
+                            firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                parameter_name="BufferIntervalInSeconds",
+                                parameter_value=str(processor_buffer_interval)
+                            ),
+                        ]
+                    )
+                ]
+            )
+
         es_config = firehose.CfnDeliveryStream.ElasticsearchDestinationConfigurationProperty(
             index_name=es_index_name,
             # type_name=es_type_name,
             role_arn=firehose_delivery_role.role_arn,
-            index_rotation_period="OneHour",
-            s3_backup_mode="AllDocuments",
+            index_rotation_period=index_rotation_period,
+            buffering_hints=firehose.CfnDeliveryStream.ElasticsearchBufferingHintsProperty(
+                size_in_m_bs=profile["es_buffer_size"],
+                interval_in_seconds=profile["es_buffer_interval"]
+            ),
+            retry_options=firehose.CfnDeliveryStream.ElasticsearchRetryOptionsProperty(
+                duration_in_seconds=profile["retry_duration"]
+            ),
+            s3_backup_mode=s3_backup_mode,
             s3_configuration=s3_config,
             # cluster_endpoint=f"https://{vpc_es_domain_endpoint}",
             domain_arn=f"arn:aws:es:{region}:{account}:domain/{es_domain_name}",
             vpc_configuration=vpc_config,
+            processing_configuration=processing_config,
             cloud_watch_logging_options=es_logging_config
         )
 
-        firehose_delivery_stream = firehose.CfnDeliveryStream(
+        source_config = None
+        if source_stream is not None:
+            # the delivery role's Kinesis permission already names this stream
+            ingest_stream = kinesis.Stream(
+                self,
+                "KeehyunIngestStream",
+                stream_name=delivery_stream_name,
+                shard_count=source_stream["shards"],
+                retention_period=core.Duration.hours(source_stream["retention_hours"]),
+                encryption=kinesis.StreamEncryption.MANAGED,
+            )
+
+            source_config = firehose.CfnDeliveryStream.KinesisStreamSourceConfigurationProperty(
+                kinesis_stream_arn=ingest_stream.stream_arn,
+                role_arn=firehose_delivery_role.role_arn
+            )
+
+            self._add_shard_scaler(ingest_stream, source_stream)
+
+        # DirectPut shards share the role, index and backup bucket; services are
+        # spread over them by the log router, see firelens.service_route
+        stream_names = delivery_stream_names(delivery_stream_name, delivery_stream_shards)
+        for shard, stream_name in enumerate(stream_names):
+            firehose_delivery_stream = firehose.CfnDeliveryStream(
+                self,
+                "KeehyunFirehose" if shard == 0 else f"KeehyunFirehose{shard}",
+                delivery_stream_name=stream_name,
+                delivery_stream_type="DirectPut" if source_stream is None else "KinesisStreamAsSource",
+                kinesis_stream_source_configuration=source_config,
+                elasticsearch_destination_configuration=es_config,
+                tags=[core.CfnTag(key="Owner", value="keehyun")],
+            )
+
+            firehose_delivery_stream.node.add_dependency(firehose_delivery_role)
+            if source_stream is not None:
+                firehose_delivery_stream.node.add_dependency(ingest_stream)
+
+        if archive is not None:
+            self._add_archive_stream(
+                archive, ingest_stream, firehose_log_group,
+                parse_failure_mode=parse_failure_mode,
+                processor_memory_size=processor_memory_size,
+            )
+
+    @property
+    def ingest_capacity(self) -> dict:
+        return dict(self._ingest_capacity)
+
+    def _add_archive_stream(self, settings: dict, source, log_group,
+                            parse_failure_mode: str, processor_memory_size: int) -> None:
+        """Second delivery stream that writes the source records to S3 as partitioned Parquet.
+
+        The log processor parses each line and returns the dt, hour and
+        service partition keys. Firehose converts the JSON to Parquet with
+        the Glue table schema derived from the ES nginx mappings.
+        """
+        # only loaded when the archive is enabled to keep synth light
+        from aws_cdk import aws_glue as glue, aws_lambda as lambda_
+        from ecs_elk.log_archive import (
+            ARCHIVE_DATABASE, ARCHIVE_TABLE, archive_prefix, error_output_prefix,
+            render_glue_columns, render_partition_columns,
+        )
+
+        archive_stream_name = "keehyun-firehose-archive"
+
+        archive_bucket = s3.Bucket(
+            self,
+            "FirehoseArchiveBucket",
+            bucket_name=settings["bucket_name"],
+        )
+
+        database = glue.CfnDatabase(
+            self,
+            "ArchiveDatabase",
+            catalog_id=self.account,
+            database_input=glue.CfnDatabase.DatabaseInputProperty(name=ARCHIVE_DATABASE)
+        )
+
+        table = glue.CfnTable(
+            self,
+            "ArchiveTable",
+            catalog_id=self.account,
+            database_name=ARCHIVE_DATABASE,
+            table_input=glue.CfnTable.TableInputProperty(
+                name=ARCHIVE_TABLE,
+                table_type="EXTERNAL_TABLE",
+                parameters={"classification": "parquet"},
+                partition_keys=[glue.CfnTable.ColumnProperty(**c) for c in render_partition_columns()],
+                storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
+                    columns=[glue.CfnTable.ColumnProperty(**c) for c in render_glue_columns()],
+                    location=f"s3://{archive_bucket.bucket_name}/nginx/",
+                    input_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+                    output_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+                    serde_info=glue.CfnTable.SerdeInfoProperty(
+                        serialization_library="org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+                    ),
+                )
+            )
+        )
+        table.add_depends_on(database)
+
+        archive_role = iam.Role(
             self,
-            "KeehyunFirehose",
-            delivery_stream_name=delivery_stream_name,
-            delivery_stream_type="DirectPut",
-            elasticsearch_destination_configuration=es_config,
+            "KinesisFirehoseArchiveRole",
+            assumed_by=iam.ServicePrincipal("firehose.amazonaws.com"),
+        )
+        archive_bucket.grant_read_write(archive_role)
+        source.grant_read(archive_role)
+        archive_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "glue:GetTable",
+                    "glue:GetTableVersion",
+                    "glue:GetTableVersions",
+                ],
+                resources=[
+                    f"arn:aws:glue:{self.region}:{self.account}:catalog",
+                    f"arn:aws:glue:{self.region}:{self.account}:database/{ARCHIVE_DATABASE}",
+                    f"arn:aws:glue:{self.region}:{self.account}:table/{ARCHIVE_DATABASE}/{ARCHIVE_TABLE}",
+                ]
+            )
+        )
+        log_group.grant_write(archive_role)
+
+        archive_processor = lambda_.Function(
+            self,
+            "FirehoseArchiveProcessor",
+            function_name=f"{archive_stream_name}-processor",
+            handler="handler.handler",
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            code=lambda_.Code.from_asset("resources/firehose_processor"),
+            memory_size=processor_memory_size,
+            timeout=core.Duration.minutes(1),
+            environment={
+                "PARSE_FAILURE_MODE": parse_failure_mode,
+                "OUTPUT_FORMAT": "archive",
+            },
+            log_retention=cloudwatch_logs.RetentionDays.ONE_WEEK,
+        )
+        archive_processor.grant_invoke(archive_role)
+
+        archive_log_stream = cloudwatch_logs.LogStream(
+            self,
+            "ArchiveLogStream",
+            log_group=log_group,
+            log_stream_name="ArchiveDelivery"
+        )
+
+        archive_config = firehose.CfnDeliveryStream.ExtendedS3DestinationConfigurationProperty(
+            bucket_arn=archive_bucket.bucket_arn,
+            role_arn=archive_role.role_arn,
+            prefix=archive_prefix(),
+            error_output_prefix=error_output_prefix(),
+            buffering_hints=firehose.CfnDeliveryStream.BufferingHintsProperty(
+                size_in_m_bs=settings["buffer_size"],
+                interval_in_seconds=settings["buffer_interval"]
+            ),
+            # Parquet pages are compressed by the serializer instead
+            compression_format="UNCOMPRESSED",
+            processing_configuration=firehose.CfnDeliveryStream.ProcessingConfigurationProperty(
+                enabled=True,
+                processors=[
+                    firehose.CfnDeliveryStream.ProcessorProperty(
+                        type="Lambda",
+                        parameters=[
+                            firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                parameter_name="LambdaArn",
+                                parameter_value=archive_processor.function_arn
+                            ),
+                            firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                parameter_name="BufferSizeInMBs",
+                                parameter_value=str(settings["processor_buffer_size"])
+                            ),
+                            firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                parameter_name="BufferIntervalInSeconds",
+                                parameter_value=str(settings["processor_buffer_interval"])
+                            ),
+                        ]
+                    )
+                ]
+            ),
+            data_format_conversion_configuration=firehose.CfnDeliveryStream.DataFormatConversionConfigurationProperty(
+                enabled=True,
+                input_format_configuration=firehose.CfnDeliveryStream.InputFormatConfigurationProperty(
+                    deserializer=firehose.CfnDeliveryStream.DeserializerProperty(
+                        hive_json_ser_de=firehose.CfnDeliveryStream.HiveJsonSerDeProperty()
+                    )
+                ),
+                output_format_configuration=firehose.CfnDeliveryStream.OutputFormatConfigurationProperty(
+                    serializer=firehose.CfnDeliveryStream.SerializerProperty(
+                        parquet_ser_de=firehose.CfnDeliveryStream.ParquetSerDeProperty(
+                            compression=settings["compression"]
+                        )
+                    )
+                ),
+                schema_configuration=firehose.CfnDeliveryStream.SchemaConfigurationProperty(
+                    catalog_id=self.account,
+                    database_name=ARCHIVE_DATABASE,
+                    table_name=ARCHIVE_TABLE,
+                    region=self.region,
+                    role_arn=archive_role.role_arn,
+                    version_id="LATEST"
+                )
+            ),
+            cloud_watch_logging_options=firehose.CfnDeliveryStream.CloudWatchLoggingOptionsProperty(
+                enabled=True,
+                log_group_name=log_group.log_group_name,
+                log_stream_name=archive_log_stream.log_stream_name
+            )
+        )
+
+        archive_delivery_stream = firehose.CfnDeliveryStream(
+            self,
+            "KeehyunFirehoseArchive",
+            delivery_stream_name=archive_stream_name,
+            delivery_stream_type="KinesisStreamAsSource",
+            kinesis_stream_source_configuration=firehose.CfnDeliveryStream.KinesisStreamSourceConfigurationProperty(
+                kinesis_stream_arn=source.stream_arn,
+                role_arn=archive_role.role_arn
+            ),
+            extended_s3_destination_configuration=archive_config,
             tags=[core.CfnTag(key="Owner", value="keehyun")],
         )
+        # this CDK version has no dynamic partitioning properties yet
+        archive_delivery_stream.add_property_override(
+            "ExtendedS3DestinationConfiguration.DynamicPartitioningConfiguration",
+            {"Enabled": True, "RetryOptions": {"DurationInSeconds": 300}}
+        )
+        archive_delivery_stream.add_depends_on(table)
+        archive_delivery_stream.node.add_dependency(archive_role)
+
+    def _add_shard_scaler(self, stream, settings: dict) -> None:
+        """Scheduled function that resizes the stream from its IncomingBytes and throttle metrics.
+
+        Kinesis has no native shard autoscaling and Application Auto Scaling
+        only supports it through a custom API Gateway endpoint, so a small
+        function polls the metrics and calls UpdateShardCount.
+        """
+        # only loaded when the source stream is enabled to keep synth light
+        from aws_cdk import (
+            aws_lambda as lambda_,
+            aws_events as events,
+            aws_events_targets as targets,
+        )
 
-        firehose_delivery_stream.node.add_dependency(firehose_delivery_role)
+        scaler = lambda_.Function(
+            self,
+            "ShardScaler",
+            handler="handler.handler",
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            code=lambda_.Code.from_asset("resources/shard_scaler"),
+            timeout=core.Duration.minutes(1),
+            environment={
+                "STREAM_NAME": stream.stream_name,
+                "MIN_SHARDS": str(settings["min_shards"]),
+                "MAX_SHARDS": str(settings["max_shards"]),
+                "TARGET_UTILIZATION": str(settings["target_utilization"]),
+                "SCALE_IN_UTILIZATION": str(settings["scale_in_utilization"]),
+                "LOOKBACK_MINUTES": str(settings["lookback_minutes"]),
+            },
+            log_retention=cloudwatch_logs.RetentionDays.ONE_WEEK,
+        )
+
+        scaler.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "kinesis:DescribeStreamSummary",
+                    "kinesis:UpdateShardCount",
+                ],
+                resources=[stream.stream_arn]
+            )
+        )
+        scaler.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["cloudwatch:GetMetricData"],
+                resources=["*"]
+            )
+        )
+
+        events.Rule(
+            self,
+            "ShardScalerSchedule",
+            schedule=events.Schedule.rate(core.Duration.minutes(settings["scaler_interval_minutes"])),
+            targets=[targets.LambdaFunction(scaler)]
+        )
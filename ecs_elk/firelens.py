@@ -0,0 +1,166 @@
+import re
+import zlib
+
+
+# Fluent Bit tuning per FireLens output mode. The values are passed to the
+# log router as environment variables and expanded by the matching config
+# file under resources/fluent-bit.
+OUTPUT_MODES = {
+    "cloudwatch": {
+        "flush": 5,
+        "grace": 30,
+        "workers": 1,
+        "retry_limit": 5,
+        "mem_buf_limit": "25MB",
+    },
+    "es": {
+        "flush": 5,
+        "grace": 30,
+        "workers": 2,
+        "retry_limit": 5,
+        "mem_buf_limit": "50MB",
+    },
+    "kinesis_firehose": {
+        "flush": 1,
+        "grace": 30,
+        "workers": 2,
+        "retry_limit": 5,
+        "mem_buf_limit": "50MB",
+    },
+    # Firehose reading from the Kinesis source stream
+    "kinesis_streams": {
+        "flush": 1,
+        "grace": 30,
+        "workers": 2,
+        "retry_limit": 5,
+        "mem_buf_limit": "50MB",
+    },
+}
+
+CONFIG_DIR = "/fluent-bit/etc"
+
+# Router buffering. "filesystem" keeps chunks on the task's ephemeral
+# storage while an output is slow, "memory" pauses the input at
+# mem_buf_limit and blocks the application's log pipe.
+BUFFERING_DEFAULTS = {
+    "storage_type": "filesystem",
+    "storage_path": "/var/fluent-bit/flb-storage/",
+    # memory for chunks loaded back from disk after a restart
+    "backlog_mem_limit": "16M",
+    # chunks kept in memory at once, about 2 MB each
+    "max_chunks_up": 32,
+    # per output cap on disk, oldest chunks are dropped beyond it
+    "total_limit_size": "5G",
+    # None keeps each output mode's own workers and retry limit
+    "workers": None,
+    "retry_limit": None,
+}
+
+# Edge filter run by the router before any output, see
+# resources/fluent-bit/edge_filter.lua. Drops and sampling only apply to
+# lines that parse as nginx access logs.
+FILTER_DEFAULTS = {
+    "enabled": False,
+    # request path and user agent prefixes dropped outright, the ALB health
+    # checks hit / and are only told apart by their user agent
+    "drop_paths": ["/health"],
+    "drop_user_agents": ["ELB-HealthChecker"],
+    "drop_status": [],
+    # share of lines kept per status class, kept lines carry sample_rate =
+    # 1 / share, scaled further by the share the rate cap let through
+    "sample": {"1xx": 1.0, "2xx": 1.0, "3xx": 1.0, "4xx": 1.0, "5xx": 1.0},
+    # lines per second one task ships at most, 0 for no cap
+    "rate_limit": 0,
+    # 5xx lines bypass sampling and the rate cap
+    "keep_errors": True,
+}
+
+# Per service routing. With the es output every service writes to its own
+# alias under index_prefix, bootstrapped and rolled over by the search stack
+# for the services in its routed_services. Firehose fixes the index per
+# delivery stream, so the Firehose modes spread services over
+# delivery_stream_shards streams by a stable hash of the service name and
+# tag every record with its service.
+ROUTING_DEFAULTS = {
+    "index_prefix": "logs",
+    "delivery_stream_name": "keehyun-firehose",
+    "delivery_stream_shards": 1,
+}
+
+SERVICE_NAME_RE = r"^[a-z0-9][a-z0-9_-]*$"
+
+
+def config_file_path(mode: str) -> str:
+    return f"{CONFIG_DIR}/{mode}.conf"
+
+
+def buffering_settings(buffering: dict = None) -> dict:
+    settings = dict(BUFFERING_DEFAULTS, **(buffering or {}))
+    if settings["storage_type"] not in ("filesystem", "memory"):
+        raise ValueError(f"Unknown router storage type '{settings['storage_type']}'")
+    return settings
+
+
+def filter_settings(filters: dict = None) -> dict:
+    filters = filters or {}
+    settings = dict(FILTER_DEFAULTS, **filters)
+    settings["sample"] = dict(FILTER_DEFAULTS["sample"], **filters.get("sample", {}))
+    for status_class, ratio in settings["sample"].items():
+        if status_class not in FILTER_DEFAULTS["sample"]:
+            raise ValueError(f"Unknown status class '{status_class}', expected one of 1xx to 5xx")
+        if not 0 < ratio <= 1:
+            raise ValueError(f"Sample ratio for {status_class} must be in (0, 1]")
+    if settings["rate_limit"] < 0:
+        raise ValueError("rate_limit can not be negative")
+    return settings
+
+
+def router_environment(mode: str, buffering: dict = None, filters: dict = None) -> dict:
+    settings = OUTPUT_MODES[mode]
+    buffering = buffering_settings(buffering)
+    workers = buffering["workers"] or settings["workers"]
+    retry_limit = buffering["retry_limit"] or settings["retry_limit"]
+    filters = filter_settings(filters)
+    environment = {
+        "FLB_FLUSH": str(settings["flush"]),
+        "FLB_GRACE": str(settings["grace"]),
+        "FLB_WORKERS": str(workers),
+        "FLB_RETRY_LIMIT": str(retry_limit),
+        "FLB_STORAGE_TYPE": buffering["storage_type"],
+        "FLB_STORAGE_PATH": buffering["storage_path"],
+        "FLB_BACKLOG_MEM_LIMIT": buffering["backlog_mem_limit"],
+        "FLB_MAX_CHUNKS_UP": str(buffering["max_chunks_up"]),
+        "FLB_STORAGE_LIMIT": buffering["total_limit_size"],
+        "FLB_MEM_BUF_LIMIT": settings["mem_buf_limit"],
+        "FLB_FILTER_ENABLED": "true" if filters["enabled"] else "false",
+        "FLB_FILTER_DROP_PATHS": ",".join(filters["drop_paths"]),
+        "FLB_FILTER_DROP_USER_AGENTS": ",".join(filters["drop_user_agents"]),
+        "FLB_FILTER_DROP_STATUS": ",".join(str(status) for status in filters["drop_status"]),
+        "FLB_FILTER_RATE_LIMIT": str(filters["rate_limit"]),
+        "FLB_FILTER_KEEP_ERRORS": "true" if filters["keep_errors"] else "false",
+    }
+    for status_class, ratio in filters["sample"].items():
+        environment[f"FLB_FILTER_SAMPLE_{status_class.upper()}"] = str(ratio)
+    return environment
+
+
+def delivery_stream_names(delivery_stream_name: str, shards: int = 1) -> list:
+    # the first shard keeps the unsharded name so existing producers keep working
+    if shards < 1:
+        raise ValueError("delivery_stream_shards must be at least 1")
+    return [delivery_stream_name] + [f"{delivery_stream_name}-{shard}" for shard in range(1, shards)]
+
+
+def service_route(service_name: str, mode: str, routing: dict = None) -> dict:
+    """Index and delivery stream a service's router writes to."""
+    if not re.match(SERVICE_NAME_RE, service_name):
+        raise ValueError(f"Service name '{service_name}' is not a valid index name part")
+    settings = dict(ROUTING_DEFAULTS, **(routing or {}))
+    streams = delivery_stream_names(settings["delivery_stream_name"], settings["delivery_stream_shards"])
+    # crc32 is stable across processes, unlike hash()
+    stream = streams[zlib.crc32(service_name.encode("utf-8")) % len(streams)]
+    return {
+        "service": service_name,
+        "index": f"{settings['index_prefix']}-{service_name}" if mode == "es" else None,
+        "delivery_stream": stream if mode in ("kinesis_firehose", "kinesis_streams") else None,
+    }
@@ -0,0 +1,156 @@
+ISM_POLICY_PATH = "/_opendistro/_ism/policies"
+
+
+def render_ism_policy(rollover_size: str = "30gb",
+                      rollover_doc_count: int = 50000000,
+                      rollover_age: str = "1d",
+                      warm_after: str = "1d",
+                      retention: str = "30d",
+                      force_merge_segments: int = 1,
+                      shrink_shards: int = None,
+                      ultrawarm: bool = False,
+                      cold_after: str = None) -> dict:
+    """Render the rollover ISM policy.
+
+    Without ``ultrawarm`` the warm state compacts indices in place on the
+    hot nodes. With it they are migrated to UltraWarm nodes, and with
+    ``cold_after`` detached to cold storage later on.
+    """
+    if cold_after and not ultrawarm:
+        raise ValueError("cold storage requires the UltraWarm tier")
+
+    # the ISM plugin on ES 7.x has no shrink action, only set
+    # shrink_shards on domains whose ISM supports it (OpenSearch)
+    warm_actions = [] if ultrawarm else [{"read_only": {}}]
+    if shrink_shards:
+        warm_actions.append(
+            {"shrink": {"num_new_shards": shrink_shards, "force_unsafe": True}}
+        )
+    warm_actions.append(
+        {"force_merge": {"max_num_segments": force_merge_segments}}
+    )
+    if ultrawarm:
+        warm_actions.append({"warm_migration": {}})
+
+    states = [
+        {
+            "name": "hot",
+            "actions": [
+                {
+                    "rollover": {
+                        "min_size": rollover_size,
+                        "min_doc_count": rollover_doc_count,
+                        "min_index_age": rollover_age,
+                    }
+                }
+            ],
+            "transitions": [
+                {"state_name": "warm", "conditions": {"min_index_age": warm_after}}
+            ]
+        },
+        {
+            "name": "warm",
+            "actions": warm_actions,
+            "transitions": [
+                {"state_name": "cold", "conditions": {"min_index_age": cold_after}}
+                if cold_after else
+                {"state_name": "delete", "conditions": {"min_index_age": retention}}
+            ]
+        },
+    ]
+
+    if cold_after:
+        states.append({
+            "name": "cold",
+            "actions": [
+                {"cold_migration": {"timestamp_field": "@timestamp"}}
+            ],
+            "transitions": [
+                {"state_name": "delete", "conditions": {"min_index_age": retention}}
+            ]
+        })
+
+    states.append({
+        "name": "delete",
+        "actions": [
+            # cold indices are no longer on the cluster, remove them from cold storage
+            {"cold_delete": {}} if cold_after else {"delete": {}}
+        ],
+        "transitions": []
+    })
+
+    return {
+        "policy": {
+            "description": "Roll over log indices on size or doc count, "
+                           "move them down the storage tiers and delete after retention",
+            "default_state": "hot",
+            "states": states,
+        }
+    }
+
+
+def render_index_template(index_name: str, policy_id: str,
+                          shards: int = 2, replicas: int = 1, order: int = 0) -> dict:
+    return {
+        "index_patterns": [f"{index_name}-*"],
+        "order": order,
+        "settings": {
+            "index.number_of_shards": shards,
+            "index.number_of_replicas": replicas,
+            "opendistro.index_state_management.policy_id": policy_id,
+            "opendistro.index_state_management.rollover_alias": index_name,
+        }
+    }
+
+
+def render_write_alias_request(alias: str) -> dict:
+    return {
+        "method": "PUT",
+        "path": f"/{alias}-000001",
+        "body": {"aliases": {alias: {"is_write_index": True}}},
+        "unless_exists": f"/_alias/{alias}",
+    }
+
+
+def render_bootstrap_requests(index_name: str, policy_id: str = None,
+                              shards: int = 2, replicas: int = 1,
+                              services: list = None,
+                              **policy_options) -> list:
+    """Requests that install the ISM policy, the index template and the write alias.
+
+    Firehose writes to ``index_name`` with rotation disabled, which resolves to
+    the current write index behind the alias.
+
+    The es output of the log router writes each service to
+    ``<index_name>-<service>``, see firelens.service_route. Every service
+    in ``services`` gets that name as a write alias of its own, with a
+    higher order template that points the rollover of its indices at it;
+    they also match the shared ``<index_name>-*`` template, whose alias they
+    are never the write index of.
+    """
+    policy_id = policy_id or f"{index_name}-rollover"
+    service_requests = []
+    for service in services or []:
+        alias = f"{index_name}-{service}"
+        service_requests += [
+            {
+                "method": "PUT",
+                "path": f"/_template/{alias}-rollover",
+                "body": render_index_template(alias, policy_id, shards, replicas, order=1),
+            },
+            render_write_alias_request(alias),
+        ]
+    return [
+        {
+            "method": "PUT",
+            "path": f"{ISM_POLICY_PATH}/{policy_id}",
+            "body": render_ism_policy(**policy_options),
+            "versioned": True,
+        },
+        {
+            "method": "PUT",
+            "path": f"/_template/{index_name}-rollover",
+            "body": render_index_template(index_name, policy_id, shards, replicas),
+        },
+        render_write_alias_request(index_name),
+    ] + service_requests
@@ -0,0 +1,81 @@
+from ecs_elk.slow_logs import SLOW_LOG_THRESHOLDS
+
+
+NGINX_TEMPLATE_VERSION = 4
+
+# fields added by FireLens when enable-ecs-log-metadata is on
+FIRELENS_METADATA_FIELDS = [
+    "container_id",
+    "container_name",
+    "source",
+    "ecs_cluster",
+    "ecs_task_arn",
+    "ecs_task_definition",
+]
+
+
+def render_nginx_mappings(strict: bool = True) -> dict:
+    properties = {
+        "@timestamp": {"type": "date"},
+        "remote_addr": {"type": "ip"},
+        "remote_user": {"type": "keyword", "ignore_above": 256},
+        "method": {"type": "keyword", "ignore_above": 16},
+        "protocol": {"type": "keyword", "ignore_above": 16},
+        "request": {"type": "keyword", "ignore_above": 1024},
+        "path": {"type": "keyword", "ignore_above": 1024},
+        "path_group": {"type": "keyword", "ignore_above": 1024},
+        "status": {"type": "short"},
+        "body_bytes_sent": {"type": "long"},
+        "request_time": {"type": "float"},
+        "http_referer": {"type": "keyword", "ignore_above": 1024},
+        # kept for lookups only, dashboards aggregate on the ua_* fields
+        "http_user_agent": {"type": "keyword", "ignore_above": 512, "doc_values": False},
+        "ua_browser": {"type": "keyword", "ignore_above": 64},
+        "ua_os": {"type": "keyword", "ignore_above": 64},
+        "ua_is_bot": {"type": "boolean"},
+        # unparsed lines from the FireLens envelope or the processor
+        "log": {"type": "text", "norms": False},
+        "tags": {"type": "keyword", "ignore_above": 64},
+        # set by the log router of each onboarded service
+        "service": {"type": "keyword", "ignore_above": 256},
+        # lines each document stands for after edge sampling
+        "sample_rate": {"type": "float"},
+    }
+    for field in FIRELENS_METADATA_FIELDS:
+        properties[field] = {"type": "keyword", "ignore_above": 256}
+
+    return {
+        "dynamic": "strict" if strict else False,
+        "_source": {"enabled": True},
+        "properties": properties,
+    }
+
+
+def render_nginx_template(index_name: str, replicas: int = 1,
+                          refresh_interval: str = "30s",
+                          strict: bool = True,
+                          slow_log_thresholds: dict = None) -> dict:
+    return {
+        "index_patterns": [f"{index_name}-*"],
+        "version": NGINX_TEMPLATE_VERSION,
+        # applied after the lifecycle template so these settings win
+        "order": 10,
+        "settings": {
+            "index.codec": "best_compression",
+            "index.refresh_interval": refresh_interval,
+            "index.number_of_replicas": replicas,
+            # the domain publishes slow logs, these decide what is slow
+            **dict(SLOW_LOG_THRESHOLDS, **(slow_log_thresholds or {})),
+        },
+        "mappings": render_nginx_mappings(strict),
+    }
+
+
+def render_template_requests(index_name: str, **template_options) -> list:
+    return [
+        {
+            "method": "PUT",
+            "path": f"/_template/{index_name}-nginx",
+            "body": render_nginx_template(index_name, **template_options),
+        },
+    ]
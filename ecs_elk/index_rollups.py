@@ -0,0 +1,115 @@
+ROLLUP_JOB_PATH = "/_opendistro/_rollup/jobs"
+KIBANA_INDEX_PATTERN_PATH = "/_plugin/kibana/api/saved_objects/index-pattern"
+
+# summary granularities, keyed by the suffix of the rollup index
+ROLLUP_INTERVALS = {
+    "1m": {"period": 5, "unit": "Minutes", "delay_ms": 5 * 60 * 1000},
+    "1h": {"period": 1, "unit": "Hours", "delay_ms": 60 * 60 * 1000},
+}
+
+ROLLUP_DEFAULTS = {
+    "intervals": ["1m", "1h"],
+    "dimensions": ["service", "status", "path_group"],
+    # field -> metrics kept per bucket; doc counts are always kept
+    "metrics": {
+        "request_time": ["avg", "min", "max", "sum", "value_count"],
+        "body_bytes_sent": ["sum", "avg"],
+        # sum re-scales sampled lines, see the router's edge filter
+        "sample_rate": ["sum"],
+    },
+    "page_size": 1000,
+}
+
+# fixed so the jobs render the same on every synth, the scheduler runs them from now on
+SCHEDULE_START_TIME = 1609459200
+
+
+def rollup_index(index_name: str, interval: str) -> str:
+    # outside the "<index_name>-*" pattern, so the raw templates and the
+    # rollup jobs' own source pattern do not pick it up
+    return f"{index_name}_rollup_{interval}"
+
+
+def rollup_index_pattern(index_name: str) -> str:
+    return f"{index_name}_rollup_*"
+
+
+def render_rollup_job(index_name: str, interval: str, dimensions: list = None,
+                      metrics: dict = None, page_size: int = None) -> dict:
+    if interval not in ROLLUP_INTERVALS:
+        raise ValueError(f"Unknown rollup interval '{interval}', expected one of {sorted(ROLLUP_INTERVALS)}")
+    schedule = ROLLUP_INTERVALS[interval]
+    dimensions = ROLLUP_DEFAULTS["dimensions"] if dimensions is None else dimensions
+    metrics = ROLLUP_DEFAULTS["metrics"] if metrics is None else metrics
+
+    return {
+        "rollup": {
+            "description": f"{interval} summaries of {index_name} by {', '.join(dimensions)}",
+            "source_index": f"{index_name}-*",
+            "target_index": rollup_index(index_name, interval),
+            "enabled": True,
+            "continuous": True,
+            "schedule": {
+                "interval": {
+                    "start_time": SCHEDULE_START_TIME,
+                    "period": schedule["period"],
+                    "unit": schedule["unit"],
+                }
+            },
+            # late documents still land in a bucket before it is rolled up
+            "delay": schedule["delay_ms"],
+            "page_size": page_size or ROLLUP_DEFAULTS["page_size"],
+            "dimensions": [
+                {"date_histogram": {"source_field": "@timestamp", "fixed_interval": interval, "timezone": "UTC"}}
+            ] + [
+                {"terms": {"source_field": field}} for field in dimensions
+            ],
+            "metrics": [
+                {"source_field": field, "metrics": [{name: {}} for name in names]}
+                for field, names in metrics.items()
+            ],
+        }
+    }
+
+
+def render_rollup_requests(index_name: str, **options) -> list:
+    """Requests that install a continuous rollup job per interval and a Kibana index pattern.
+
+    The index pattern covers every summary index, so long-range dashboards
+    can read them instead of the raw documents.
+    """
+    settings = dict(ROLLUP_DEFAULTS, **options)
+    requests = [
+        {
+            "method": "PUT",
+            "path": f"{ROLLUP_JOB_PATH}/{rollup_index(index_name, interval)}",
+            "body": render_rollup_job(index_name, interval, settings["dimensions"],
+                                      settings["metrics"], settings["page_size"]),
+            "versioned": True,
+        }
+        for interval in settings["intervals"]
+    ]
+    requests.append({
+        "method": "POST",
+        "path": f"{KIBANA_INDEX_PATTERN_PATH}/{index_name}-rollups?overwrite=true",
+        "body": {
+            "attributes": {
+                "title": rollup_index_pattern(index_name),
+                "timeFieldName": "@timestamp",
+            }
+        },
+        "headers": {"kbn-xsrf": "true"},
+    })
+    return requests
+
+
+def render_rollup_delete_requests(index_name: str, intervals: list = None) -> list:
+    # summaries stay, only the jobs stop
+    return [
+        {
+            "method": "DELETE",
+            "path": f"{ROLLUP_JOB_PATH}/{rollup_index(index_name, interval)}",
+            "ignore_status": [404],
+        }
+        for interval in (intervals or ROLLUP_DEFAULTS["intervals"])
+    ]
@@ -0,0 +1,55 @@
+from ecs_elk.index_mappings import render_nginx_mappings
+
+
+ARCHIVE_DATABASE = "nginx_logs"
+ARCHIVE_TABLE = "nginx_access"
+
+# the processor renames @timestamp, Glue and Parquet column names can not hold "@"
+TIMESTAMP_COLUMN = "event_time"
+
+# Hive partition keys, in S3 prefix order. Values come from the processor's
+# partitionKeys metadata (dynamic partitioning).
+PARTITION_KEYS = ["dt", "hour", "service"]
+
+ES_TO_GLUE_TYPES = {
+    "date": "timestamp",
+    "ip": "string",
+    "keyword": "string",
+    "text": "string",
+    "short": "smallint",
+    "long": "bigint",
+    "float": "float",
+    "boolean": "boolean",
+}
+
+# keyword fields that hold lists in the documents
+ARRAY_FIELDS = {"tags"}
+
+
+def render_glue_columns() -> list:
+    """Glue columns for the archive table, derived from the ES nginx mappings."""
+    columns = []
+    for field, mapping in render_nginx_mappings()["properties"].items():
+        # a partition key can not also be a data column
+        if field in PARTITION_KEYS:
+            continue
+        column_type = ES_TO_GLUE_TYPES[mapping["type"]]
+        if field in ARRAY_FIELDS:
+            column_type = f"array<{column_type}>"
+        name = TIMESTAMP_COLUMN if field == "@timestamp" else field
+        columns.append({"name": name, "type": column_type})
+    return columns
+
+
+def render_partition_columns() -> list:
+    return [{"name": key, "type": "string"} for key in PARTITION_KEYS]
+
+
+def archive_prefix(root: str = "nginx") -> str:
+    """Firehose S3 prefix, e.g. nginx/dt=2021-01-31/hour=09/service=nginx-test/."""
+    partitions = "/".join(f"{key}=!{{partitionKeyFromLambda:{key}}}" for key in PARTITION_KEYS)
+    return f"{root}/{partitions}/"
+
+
+def error_output_prefix(root: str = "nginx") -> str:
+    return f"{root}-errors/!{{firehose:error-output-type}}/!{{timestamp:yyyy-MM-dd}}/"
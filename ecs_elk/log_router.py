@@ -0,0 +1,152 @@
+from aws_cdk import (
+    core,
+    aws_iam as iam,
+    aws_ecs as ecs,
+)
+from ecs_elk.architecture import check_architecture
+from ecs_elk.firelens import (
+    OUTPUT_MODES, buffering_settings, config_file_path, router_environment, service_route,
+)
+
+
+ROUTER_DEFAULTS = {
+    "cpu": 128,
+    "memory_reservation_mib": 128,
+    "image_directory": "resources/fluent-bit",
+}
+
+# docker platform of the router image for each task architecture
+IMAGE_PLATFORMS = {
+    "x86_64": "linux/amd64",
+    "arm64": "linux/arm64",
+}
+
+
+class FireLensLogRouter(core.Construct):
+    """Tuned FireLens log router for one service's task definition.
+
+    Adds the Fluent Bit sidecar with the output mode's tuning, the router
+    buffering and the edge filter, grants the task role the one stream it
+    writes to and resolves the service's route: its own index with the es output,
+    or one of the sharded delivery streams with the Firehose outputs.
+    Application containers log through ``log_driver()``.
+    """
+
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 task_definition: ecs.TaskDefinition, service_name: str,
+                 region: str, log_output: str = "cloudwatch",
+                 es_host: str = None, log_group_name: str = None,
+                 routing: dict = None, buffering: dict = None, filters: dict = None,
+                 ephemeral_storage_gib: int = None, router: dict = None,
+                 architecture: str = "x86_64", **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        if log_output not in OUTPUT_MODES:
+            raise ValueError(
+                f"Unknown FireLens output '{log_output}', "
+                f"expected one of {sorted(OUTPUT_MODES)}"
+            )
+        if log_output == "es" and es_host is None:
+            raise ValueError("es_host is required for the es output")
+        if log_output == "cloudwatch" and log_group_name is None:
+            raise ValueError("log_group_name is required for the cloudwatch output")
+        if ephemeral_storage_gib is not None and not 21 <= ephemeral_storage_gib <= 200:
+            raise ValueError("Fargate ephemeral storage must be between 21 and 200 GiB")
+
+        settings = dict(ROUTER_DEFAULTS, **(router or {}))
+        buffering = buffering_settings(buffering)
+        self._route = service_route(service_name, log_output, routing)
+        account = core.Stack.of(self).account
+
+        if log_output == "kinesis_firehose":
+            task_definition.add_to_task_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["firehose:PutRecordBatch"],
+                    resources=[
+                        f"arn:aws:firehose:{region}:{account}:deliverystream/{self._route['delivery_stream']}"
+                    ]
+                )
+            )
+        elif log_output == "kinesis_streams":
+            # the Firehose source stream shares the delivery stream's name
+            task_definition.add_to_task_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["kinesis:PutRecords"],
+                    resources=[
+                        f"arn:aws:kinesis:{region}:{account}:stream/{self._route['delivery_stream']}"
+                    ]
+                )
+            )
+
+        environment = router_environment(log_output, buffering, filters)
+        environment.update({
+            "AWS_REGION": region,
+            "SERVICE_NAME": service_name,
+        })
+        if log_output == "cloudwatch":
+            environment.update({
+                "LOG_GROUP_NAME": log_group_name,
+                "LOG_STREAM_NAME": service_name,
+            })
+        elif log_output == "es":
+            environment.update({
+                "ES_HOST": es_host,
+                "ES_INDEX": self._route["index"],
+            })
+        else:
+            environment["DELIVERY_STREAM"] = self._route["delivery_stream"]
+
+        self._container = task_definition.add_firelens_log_router(
+            "log_router",
+            # the Dockerfile only copies files onto the base image, so the
+            # arm64 image builds on x86 hosts without emulation
+            image=ecs.ContainerImage.from_asset(
+                settings["image_directory"],
+                build_args={"TARGET_PLATFORM": IMAGE_PLATFORMS[check_architecture(architecture)]}
+            ),
+            firelens_config=ecs.FirelensConfig(
+                type=ecs.FirelensLogRouterType.FLUENTBIT,
+                options=ecs.FirelensOptions(
+                    config_file_type=ecs.FirelensConfigFileType.FILE,
+                    config_file_value=config_file_path(log_output),
+                    enable_ecs_log_metadata=True
+                )
+            ),
+            environment=environment,
+            # keeps Fluent Bit scheduled when the application saturates the task
+            cpu=settings["cpu"],
+            memory_reservation_mib=settings["memory_reservation_mib"],
+            logging=ecs.LogDrivers.aws_logs(
+                stream_prefix=f"firelens-{service_name}",
+            )
+        )
+
+        if buffering["storage_type"] == "filesystem":
+            # bind mount on the task's ephemeral storage
+            task_definition.add_volume(name="flb-storage")
+            self._container.add_mount_points(
+                ecs.MountPoint(
+                    source_volume="flb-storage",
+                    container_path=buffering["storage_path"],
+                    read_only=False
+                )
+            )
+        if ephemeral_storage_gib is not None:
+            # FargateTaskDefinition has no ephemeral storage option yet
+            task_definition.node.default_child.add_property_override(
+                "EphemeralStorage.SizeInGiB", ephemeral_storage_gib
+            )
+
+    @property
+    def container(self) -> ecs.ContainerDefinition:
+        return self._container
+
+    @property
+    def route(self) -> dict:
+        return dict(self._route)
+
+    @staticmethod
+    def log_driver() -> ecs.LogDriver:
+        return ecs.LogDrivers.firelens(options={})
@@ -0,0 +1,214 @@
+from aws_cdk import (
+    core,
+    aws_sns as sns,
+    aws_cloudwatch as cloudwatch,
+    aws_cloudwatch_actions as cloudwatch_actions,
+)
+from ecs_elk.firehose_profiles import THROUGHPUT_PROFILES
+from ecs_elk.slow_logs import SLOW_LOG_KINDS, SLOW_LOG_NAMESPACE, slow_log_metric_name
+
+
+# thresholds that do not follow from the configured capacity
+ALARM_DEFAULTS = {
+    # sustained indexing operations per minute one data node handles
+    "indexing_ops_per_data_node": 300000,
+    "indexing_latency_ms": 50,
+    "search_latency_ms": 500,
+    "jvm_memory_pressure": 80,
+    # share of a capacity limit at which an alarm fires, in percent
+    "headroom_alarm": 80,
+}
+
+
+class PipelineMonitoring(core.Construct):
+    """CloudWatch dashboard and alarms for the ingest pipeline.
+
+    Each add_* call appends a dashboard row for one stage and creates its
+    alarms. Metrics are addressed by name, so the stages can live in
+    other stacks. Thresholds tied to capacity are derived from the same
+    settings the stacks are built with.
+    """
+
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 dashboard_name: str, alarm_topic: sns.ITopic = None,
+                 thresholds: dict = None, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self._thresholds = dict(ALARM_DEFAULTS, **(thresholds or {}))
+        self._alarm_topic = alarm_topic
+        self._alarms = []
+        self._dashboard = cloudwatch.Dashboard(
+            self,
+            "Dashboard",
+            dashboard_name=dashboard_name
+        )
+
+    @property
+    def alarms(self) -> list:
+        return list(self._alarms)
+
+    def _alarm(self, construct_id: str, metric: cloudwatch.IMetric, threshold: float,
+               description: str,
+               comparison=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+               evaluation_periods: int = 3) -> cloudwatch.Alarm:
+        alarm = metric.create_alarm(
+            self,
+            construct_id,
+            threshold=threshold,
+            evaluation_periods=evaluation_periods,
+            comparison_operator=comparison,
+            alarm_description=description,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+        if self._alarm_topic is not None:
+            alarm.add_alarm_action(cloudwatch_actions.SnsAction(self._alarm_topic))
+        self._alarms.append(alarm)
+        return alarm
+
+    def _headroom(self, limit: float) -> float:
+        return limit * self._thresholds["headroom_alarm"] / 100
+
+    def add_firehose(self, delivery_stream_name: str, throughput_profile: str,
+                     records_per_second_limit: int) -> None:
+        """records_per_second_limit is the DirectPut quota or the source stream's shard limit."""
+        profile = THROUGHPUT_PROFILES[throughput_profile]
+        period = core.Duration.minutes(5)
+
+        def metric(name, statistic):
+            return cloudwatch.Metric(
+                namespace="AWS/Firehose",
+                metric_name=name,
+                dimensions={"DeliveryStreamName": delivery_stream_name},
+                statistic=statistic,
+                period=period,
+            )
+
+        success = metric("DeliveryToElasticsearch.Success", "Average")
+        freshness = metric("DeliveryToElasticsearch.DataFreshness", "Maximum")
+        incoming = metric("IncomingRecords", "Sum")
+        throttled = metric("ThrottledRecords", "Sum")
+
+        self._alarm(
+            "FirehoseDeliverySuccess", success, 0.99,
+            "Less than 99% of the Elasticsearch bulk requests succeed",
+            comparison=cloudwatch.ComparisonOperator.LESS_THAN_THRESHOLD,
+        )
+        # a record waits at most one buffer interval, then retries for retry_duration
+        self._alarm(
+            "FirehoseDataFreshness", freshness,
+            profile["es_buffer_interval"] + profile["retry_duration"],
+            f"Records older than the '{throughput_profile}' buffer interval plus retry duration",
+        )
+        self._alarm(
+            "FirehoseIncomingRecords", incoming,
+            self._headroom(records_per_second_limit * period.to_seconds()),
+            f"Incoming records above {self._thresholds['headroom_alarm']}% of the ingest limit",
+        )
+        self._alarm(
+            "FirehoseThrottledRecords", throttled, 0,
+            "Producers are throttled by the delivery stream",
+            evaluation_periods=1,
+        )
+
+        self._dashboard.add_widgets(
+            cloudwatch.TextWidget(markdown=f"## Firehose {delivery_stream_name}", width=24, height=1),
+            cloudwatch.GraphWidget(title="Incoming records", left=[incoming], right=[throttled]),
+            cloudwatch.GraphWidget(title="ES delivery success", left=[success]),
+            cloudwatch.GraphWidget(title="ES data freshness (s)", left=[freshness]),
+        )
+
+    def add_elasticsearch(self, domain_name: str, account: str, data_nodes: int) -> None:
+        period = core.Duration.minutes(1)
+
+        def metric(name, statistic):
+            return cloudwatch.Metric(
+                namespace="AWS/ES",
+                metric_name=name,
+                dimensions={"DomainName": domain_name, "ClientId": account},
+                statistic=statistic,
+                period=period,
+            )
+
+        indexing_rate = metric("IndexingRate", "Sum")
+        indexing_latency = metric("IndexingLatency", "Average")
+        write_rejected = metric("ThreadpoolWriteRejected", "Sum")
+        jvm_pressure = metric("JVMMemoryPressure", "Maximum")
+        search_latency = metric("SearchLatency", "Average")
+        slow_logs = [
+            cloudwatch.Metric(
+                namespace=SLOW_LOG_NAMESPACE,
+                metric_name=slow_log_metric_name(domain_name, kind),
+                statistic="Sum",
+                period=period,
+            )
+            for kind in SLOW_LOG_KINDS
+        ]
+
+        self._alarm(
+            "ESIndexingRate", indexing_rate,
+            self._headroom(data_nodes * self._thresholds["indexing_ops_per_data_node"]),
+            f"Indexing rate near the capacity of {data_nodes} data nodes",
+            evaluation_periods=5,
+        )
+        self._alarm(
+            "ESIndexingLatency", indexing_latency, self._thresholds["indexing_latency_ms"],
+            "Average shard indexing latency is high",
+            evaluation_periods=5,
+        )
+        self._alarm(
+            "ESWriteRejected", write_rejected, 0,
+            "Write thread pool rejections, bulk requests are being pushed back",
+        )
+        self._alarm(
+            "ESJVMMemoryPressure", jvm_pressure, self._thresholds["jvm_memory_pressure"],
+            "JVM memory pressure on the hottest node",
+            evaluation_periods=5,
+        )
+        self._alarm(
+            "ESSearchLatency", search_latency, self._thresholds["search_latency_ms"],
+            "Average shard search latency is high",
+            evaluation_periods=5,
+        )
+
+        self._dashboard.add_widgets(
+            cloudwatch.TextWidget(markdown=f"## Elasticsearch {domain_name}", width=24, height=1),
+            cloudwatch.GraphWidget(title="Indexing rate (ops/min)", left=[indexing_rate]),
+            cloudwatch.GraphWidget(title="Latency (ms)", left=[indexing_latency, search_latency]),
+            cloudwatch.GraphWidget(title="Write rejections", left=[write_rejected]),
+            cloudwatch.GraphWidget(title="JVM memory pressure (%)", left=[jvm_pressure]),
+            cloudwatch.GraphWidget(title="Slow log entries", left=slow_logs),
+        )
+
+    def add_ecs_service(self, cluster_name: str, service_name: str, autoscaling: dict) -> None:
+        period = core.Duration.minutes(1)
+
+        def metric(name):
+            return cloudwatch.Metric(
+                namespace="AWS/ECS",
+                metric_name=name,
+                dimensions={"ClusterName": cluster_name, "ServiceName": service_name},
+                statistic="Average",
+                period=period,
+            )
+
+        cpu = metric("CPUUtilization")
+        memory = metric("MemoryUtilization")
+
+        # target tracking holds the service at the target; staying halfway to
+        # 100% means it is pinned at max_capacity
+        self._alarm(
+            "ECSServiceCPU", cpu, (autoscaling["cpu_target"] + 100) / 2,
+            f"Service CPU stays above its {autoscaling['cpu_target']}% scaling target",
+            evaluation_periods=10,
+        )
+        self._alarm(
+            "ECSServiceMemory", memory, (autoscaling["memory_target"] + 100) / 2,
+            f"Service memory stays above its {autoscaling['memory_target']}% scaling target",
+            evaluation_periods=10,
+        )
+
+        self._dashboard.add_widgets(
+            cloudwatch.TextWidget(markdown=f"## ECS {service_name}", width=24, height=1),
+            cloudwatch.GraphWidget(title="CPU (%)", left=[cpu]),
+            cloudwatch.GraphWidget(title="Memory (%)", left=[memory]),
+        )
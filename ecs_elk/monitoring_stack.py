@@ -0,0 +1,40 @@
+from aws_cdk import (
+    core,
+    aws_sns as sns,
+    aws_sns_subscriptions as subscriptions,
+)
+from ecs_elk.monitoring import PipelineMonitoring
+
+
+class MonitoringStack(core.Stack):
+    """Pipeline dashboard and alarms, wired from the settings the other stacks use."""
+
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 es_domain_name: str, es_data_nodes: int,
+                 throughput_profile: str, records_per_second_limit: int,
+                 ecs_autoscaling: dict,
+                 delivery_stream_name: str = "keehyun-firehose",
+                 ecs_cluster_name: str = "KeehyunECSCluster",
+                 ecs_service_name: str = "KeehyunECSService",
+                 alarm_email: str = None, thresholds: dict = None,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        alarm_topic = sns.Topic(
+            self,
+            "PipelineAlarmTopic",
+            topic_name="keehyun-pipeline-alarms"
+        )
+        if alarm_email:
+            alarm_topic.add_subscription(subscriptions.EmailSubscription(alarm_email))
+
+        monitoring = PipelineMonitoring(
+            self,
+            "PipelineMonitoring",
+            dashboard_name="keehyun-ingest-pipeline",
+            alarm_topic=alarm_topic,
+            thresholds=thresholds
+        )
+        monitoring.add_firehose(delivery_stream_name, throughput_profile, records_per_second_limit)
+        monitoring.add_elasticsearch(es_domain_name, self.account, es_data_nodes)
+        monitoring.add_ecs_service(ecs_cluster_name, ecs_service_name, ecs_autoscaling)
@@ -0,0 +1,38 @@
+from aws_cdk import (
+    core,
+    aws_ec2 as ec2,
+)
+
+
+class NetworkStack(core.Stack):
+    """Looks up the shared VPC and security group once for every other stack.
+
+    Lookups return literal IDs, so passing them across stacks does not
+    create CloudFormation exports. Ingress rules added to the imported
+    security group by other stacks are synthesized into this stack.
+    """
+
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 vpc_id: str, security_group_id: str,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self._vpc = ec2.Vpc.from_lookup(
+            self,
+            "VPC",
+            vpc_id=vpc_id
+        )
+
+        self._security_group = ec2.SecurityGroup.from_lookup(
+            self,
+            "SecurityGroup",
+            security_group_id=security_group_id
+        )
+
+    @property
+    def vpc(self) -> ec2.IVpc:
+        return self._vpc
+
+    @property
+    def security_group(self) -> ec2.ISecurityGroup:
+        return self._security_group
@@ -0,0 +1,8 @@
+# Fixed IAM role names shared between stacks. Kept free of CDK imports so the
+# stacks that only need a name do not load the construct modules.
+
+# the bootstrap custom resource, which the ES admin role lets assume it
+BOOTSTRAP_ROLE_NAME = "KeehyunESBootstrapRole"
+
+# the S3 snapshot repository role, which the ES admin role may pass to the domain
+SNAPSHOT_ROLE_NAME = "KeehyunESSnapshotRole"
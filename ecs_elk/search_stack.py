@@ -4,21 +4,145 @@ from aws_cdk import (
     aws_elasticsearch as es,
     aws_ssm as ssm,
     aws_iam as iam,
-    aws_route53 as route53,
-    aws_route53_targets as alias,
+    aws_logs as cloudwatch_logs,
+    aws_autoscaling as autoscaling,
     aws_elasticloadbalancingv2 as elbv2,
-    aws_elasticloadbalancingv2_targets as elbv2_targets
 )
+from ecs_elk.architecture import check_architecture, instance_type_for
+from ecs_elk.capacity_planner import PLANNER_DEFAULTS, capacity_shortfalls
+from ecs_elk.slow_logs import SLOW_LOG_NAMESPACE, slow_log_metric_name
+
+
+DOMAIN_CAPACITY_DEFAULTS = {
+    "master_node_instance_type": "r5.large.elasticsearch",
+    "master_nodes": 3,
+    "data_node_instance_type": "r5.large.elasticsearch",
+    "data_nodes": 4,
+}
+
+# per data node, sizes in GB and throughput in MiB/s. Without a capacity
+# plan or storage settings the domain keeps the CDK's 10 GB gp2 volumes;
+# IOPS and throughput only apply to the gp3 volumes those switch to.
+STORAGE_DEFAULTS = {
+    "volume_size_gb": 10,
+    "volume_iops": 3000,
+    "volume_throughput": 125,
+}
+
+KIBANA_PROXY_DEFAULTS = {
+    "instance_type": "t3.medium",
+    "min_capacity": 2,
+    "max_capacity": 6,
+    "requests_per_second_per_target": 50,
+    # step scaling on ALB target response time, in seconds
+    "latency_steps": [
+        {"lower": 1, "change": 1},
+        {"lower": 3, "change": 2},
+    ],
+    "key_name": None,
+    "certificate_arn": None,
+}
 
 
 class ElasticSearchVPCStack(core.Stack):
 
     def __init__(self, scope: core.Construct, construct_id: str,
                  account: str, region: str, es_domain_name: str,
-                 vpc_id: str, security_group_id: str,
+                 vpc: ec2.IVpc, security_group: ec2.ISecurityGroup,
+                 es_index_name: str = None, index_lifecycle: str = "hourly",
+                 lifecycle_options: dict = None, index_template_options: dict = None,
+                 es_version: str = "7.7", ultrawarm: dict = None,
+                 kibana_proxy: dict = None, capacity: dict = None,
+                 storage: dict = None, availability_zones: int = 2,
+                 capacity_plan: dict = None, rollups: dict = None,
+                 snapshots: dict = None, architecture: str = "x86_64",
+                 routed_services: list = None,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        if index_lifecycle not in ("hourly", "rollover"):
+            raise ValueError(f"Unknown index lifecycle '{index_lifecycle}'")
+        if index_lifecycle == "rollover" and es_index_name is None:
+            raise ValueError("es_index_name is required for the rollover index lifecycle")
+
+        if rollups is not None:
+            if es_index_name is None:
+                raise ValueError("es_index_name is required for the index rollups")
+            if tuple(map(int, es_version.split("."))) < (7, 9):
+                raise ValueError("index rollups require Elasticsearch 7.9 or later")
+        # services the log router's es output writes to <es_index_name>-<service>
+        if routed_services and index_lifecycle != "rollover":
+            raise ValueError("per service indices are rolled over by the rollover index lifecycle")
+        if snapshots is not None and es_index_name is None:
+            raise ValueError("es_index_name is required for the index snapshots")
+        if check_architecture(architecture) == "arm64" and tuple(map(int, es_version.split("."))) < (7, 9):
+            raise ValueError("Graviton instance types require Elasticsearch 7.9 or later")
+
+        # ultrawarm: {"instance_type", "nodes", "warm_after", "cold_after"}
+        lifecycle_options = dict(lifecycle_options or {})
+        if ultrawarm:
+            if index_lifecycle != "rollover":
+                raise ValueError("the UltraWarm tier is driven by the rollover index lifecycle")
+            if ultrawarm.get("cold_after") and tuple(map(int, es_version.split("."))) < (7, 9):
+                raise ValueError("cold storage requires Elasticsearch 7.9 or later")
+            lifecycle_options.update({
+                "ultrawarm": True,
+                "warm_after": ultrawarm.get("warm_after", "24h"),
+                "cold_after": ultrawarm.get("cold_after"),
+            })
+
+        proxy = dict(KIBANA_PROXY_DEFAULTS, **(kibana_proxy or {}))
+
+        # capacity_plan comes from capacity_planner.plan_capacity. Explicit
+        # capacity or storage settings win and are checked against it.
+        if capacity_plan is not None:
+            if capacity is not None or storage is not None:
+                configured = dict(DOMAIN_CAPACITY_DEFAULTS, **(capacity or {}))
+                configured_storage = dict(STORAGE_DEFAULTS, **(storage or {}))
+                for shortfall in capacity_shortfalls(capacity_plan, configured,
+                                                     configured_storage["volume_size_gb"]):
+                    core.Annotations.of(self).add_warning(f"Below the capacity plan: {shortfall}")
+            else:
+                availability_zones = capacity_plan["availability_zones"]
+            capacity = capacity or {k: capacity_plan[k] for k in DOMAIN_CAPACITY_DEFAULTS}
+            storage = storage or {k: capacity_plan[k] for k in STORAGE_DEFAULTS}
+            lifecycle_options.setdefault("shards", capacity_plan["primary_shards"])
+            lifecycle_options.setdefault("replicas", capacity_plan["replicas"])
+            lifecycle_options.setdefault("rollover_size", f"{capacity_plan['rollover_size_gb']}gb")
+            index_template_options = dict(index_template_options or {})
+            index_template_options.setdefault("replicas", capacity_plan["replicas"])
+        # a capacity plan or explicit storage settings switch the volumes to gp3
+        gp3 = storage is not None
+        capacity = dict(DOMAIN_CAPACITY_DEFAULTS, **(capacity or {}))
+        storage = dict(STORAGE_DEFAULTS, **(storage or {}))
+        if gp3 and storage["volume_throughput"] > PLANNER_DEFAULTS["gp3_base_throughput"]:
+            # AWS::Elasticsearch::Domain has no EBS throughput setting
+            core.Annotations.of(self).add_warning(
+                f"{storage['volume_throughput']} MiB/s of gp3 throughput requested, the domain resource "
+                f"only gets the {PLANNER_DEFAULTS['gp3_base_throughput']} MiB/s baseline"
+            )
+            storage["volume_throughput"] = PLANNER_DEFAULTS["gp3_base_throughput"]
+        # the capacity plan sizes x86 types, arm64 takes their Graviton counterparts
+        for key in ("master_node_instance_type", "data_node_instance_type"):
+            capacity[key] = instance_type_for(capacity[key], architecture)
+
+        # read by the synth-time throughput budget in app.py
+        self._ingest_capacity = {
+            "data_nodes": capacity["data_nodes"],
+            "data_node_instance_type": capacity["data_node_instance_type"],
+            "volume_throughput": storage["volume_throughput"],
+            "replicas": (lifecycle_options if index_lifecycle == "rollover"
+                         else index_template_options or {}).get("replicas", 1),
+        }
+
+        domain_subnets = vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE, one_per_az=True).subnets
+        if len(domain_subnets) < availability_zones:
+            core.Annotations.of(self).add_warning(
+                f"{availability_zones} availability zones requested but the VPC has private subnets "
+                f"in {len(domain_subnets)}"
+            )
+            availability_zones = len(domain_subnets)
+
         user_pool_id = ssm.StringParameter.from_string_parameter_attributes(
             self, "UserPoolIDStringParameter", parameter_name="user-pool-id"
         ).string_value
@@ -27,17 +151,7 @@ class ElasticSearchVPCStack(core.Stack):
             self, "IdentityPoolIDStringParameter", parameter_name="identity-pool-id"
         ).string_value
 
-        vpc = ec2.Vpc.from_lookup(
-            self,
-            "VPC",
-            vpc_id=vpc_id
-        )
-
-        sg = ec2.SecurityGroup.from_lookup(
-            self,
-            "SecurityGroup",
-            security_group_id=security_group_id
-        )
+        sg = security_group
 
         es_admin_role_arn = f"arn:aws:iam::{account}:role/KeehyunCognitoESAdminRole"
 
@@ -55,7 +169,7 @@ class ElasticSearchVPCStack(core.Stack):
             self,
             "KeehyunVPCES",
             domain_name=es_domain_name,
-            version=es.ElasticsearchVersion.V7_7,
+            version=es.ElasticsearchVersion.of(es_version),
             enforce_https=True,
             node_to_node_encryption=True,
             encryption_at_rest=es.EncryptionAtRestOptions(enabled=True),
@@ -69,17 +183,17 @@ class ElasticSearchVPCStack(core.Stack):
             ),
             vpc_options=es.VpcOptions(
                 security_groups=[sg],
-                subnets=vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE).subnets
+                # the domain takes exactly one subnet per zone
+                subnets=domain_subnets[:availability_zones]
             ),
             zone_awareness=es.ZoneAwarenessConfig(
-                availability_zone_count=2,
+                availability_zone_count=availability_zones,
                 enabled=True
             ),
-            capacity=es.CapacityConfig(
-                master_node_instance_type="r5.large.elasticsearch",
-                master_nodes=3,
-                data_node_instance_type="r5.large.elasticsearch",
-                data_nodes=4
+            capacity=es.CapacityConfig(**capacity),
+            ebs=es.EbsOptions(
+                enabled=True,
+                volume_size=storage["volume_size_gb"]
             ),
             logging=es.LoggingOptions(
                 app_log_enabled=True,
@@ -99,6 +213,38 @@ class ElasticSearchVPCStack(core.Stack):
             ],
         )
 
+        cfn_domain = es_domain.node.default_child
+        if gp3:
+            # EbsOptions has no gp3 volume type yet
+            cfn_domain.add_property_override("EBSOptions.VolumeType", "gp3")
+            cfn_domain.add_property_override("EBSOptions.Iops", storage["volume_iops"])
+
+        if ultrawarm:
+            # CapacityConfig has no warm node options yet
+            cfn_domain.add_property_override("ElasticsearchClusterConfig.WarmEnabled", True)
+            cfn_domain.add_property_override(
+                "ElasticsearchClusterConfig.WarmType",
+                ultrawarm.get("instance_type", "ultrawarm1.medium.elasticsearch")
+            )
+            cfn_domain.add_property_override("ElasticsearchClusterConfig.WarmCount", ultrawarm.get("nodes", 2))
+            if ultrawarm.get("cold_after"):
+                cfn_domain.add_property_override(
+                    "ElasticsearchClusterConfig.ColdStorageOptions.Enabled", True
+                )
+
+        # slow log entries as metrics for the pipeline dashboard
+        for kind, log_group in (("SlowIndex", es_domain.slow_index_log_group),
+                                ("SlowSearch", es_domain.slow_search_log_group)):
+            cloudwatch_logs.MetricFilter(
+                self,
+                f"{kind}LogMetricFilter",
+                log_group=log_group,
+                metric_namespace=SLOW_LOG_NAMESPACE,
+                metric_name=slow_log_metric_name(es_domain_name, kind),
+                filter_pattern=cloudwatch_logs.FilterPattern.all_events(),
+                metric_value="1",
+            )
+
         ssm.StringParameter(
             self,
             "VPCESDomainEndpointStringParameter",
@@ -112,24 +258,202 @@ class ElasticSearchVPCStack(core.Stack):
             value=es_domain.domain_endpoint
         )
 
+        if es_index_name is not None:
+            # pulls in aws_lambda and custom_resources, only load when used
+            from ecs_elk.es_bootstrap import ElasticsearchBootstrap
+            from ecs_elk.index_lifecycle import render_bootstrap_requests
+            from ecs_elk.index_mappings import render_template_requests
+
+            bootstrap = ElasticsearchBootstrap(
+                self,
+                "ESBootstrap",
+                domain_endpoint=es_domain.domain_endpoint,
+                admin_role_arn=es_admin_role_arn,
+                vpc=vpc,
+                security_group=sg
+            )
+
+            index_template = bootstrap.add_requests(
+                "IndexTemplate",
+                render_template_requests(es_index_name, **(index_template_options or {}))
+            )
+            index_template.node.add_dependency(es_domain)
+
+            if index_lifecycle == "rollover":
+                # the first write index has to pick up the mappings
+                bootstrap.add_requests(
+                    "IndexLifecycle",
+                    render_bootstrap_requests(es_index_name, services=routed_services, **lifecycle_options)
+                ).node.add_dependency(index_template)
+
+            if rollups is not None:
+                from ecs_elk.index_rollups import render_rollup_delete_requests, render_rollup_requests
+
+                # rollup jobs read the raw indices through the nginx mappings
+                bootstrap.add_requests(
+                    "IndexRollups",
+                    render_rollup_requests(es_index_name, **rollups),
+                    delete_requests=render_rollup_delete_requests(es_index_name, rollups.get("intervals")),
+                ).node.add_dependency(index_template)
+
+            if snapshots is not None:
+                from ecs_elk.snapshots import SnapshotLifecycle
+
+                # snapshot lifecycle management is not available on 7.x
+                # domains, a scheduled function takes and prunes them instead
+                snapshot_options = dict(snapshots)
+                SnapshotLifecycle(
+                    self,
+                    "IndexSnapshots",
+                    bootstrap=bootstrap,
+                    domain_endpoint=es_domain.domain_endpoint,
+                    admin_role_arn=es_admin_role_arn,
+                    indices=snapshot_options.pop("indices", f"{es_index_name}*"),
+                    vpc=vpc,
+                    security_group=sg,
+                    options=snapshot_options
+                ).node.add_dependency(es_domain)
+
         amzn_linux = ec2.MachineImage.latest_amazon_linux(
-            cpu_type=ec2.AmazonLinuxCpuType.X86_64,
+            cpu_type=ec2.AmazonLinuxCpuType.ARM_64 if architecture == "arm64" else ec2.AmazonLinuxCpuType.X86_64,
             edition=ec2.AmazonLinuxEdition.STANDARD,
             generation=ec2.AmazonLinuxGeneration.AMAZON_LINUX_2,
             storage=ec2.AmazonLinuxStorage.GENERAL_PURPOSE,
             virtualization=ec2.AmazonLinuxVirt.HVM,
         )
 
-        kibana_proxy = ec2.Instance(
+        with open("resources/kibana-proxy/nginx.conf") as fp:
+            proxy_config = fp.read().replace("__ES_ENDPOINT__", es_domain.domain_endpoint)
+        with open("resources/kibana-proxy/resolve.sh") as fp:
+            resolve_script = fp.read()
+
+        proxy_user_data = ec2.UserData.for_linux()
+        proxy_user_data.add_commands(
+            "amazon-linux-extras install -y nginx1",
+            "mkdir -p /var/cache/nginx/kibana && chown nginx:nginx /var/cache/nginx/kibana",
+            f"cat > /etc/nginx/nginx.conf <<'EOF'\n{proxy_config}EOF",
+            "systemctl enable --now nginx",
+            # the upstream pins the endpoint's addresses, reload when they change
+            f"cat > /usr/local/bin/kibana-proxy-resolve <<'EOF'\n{resolve_script}EOF",
+            "chmod +x /usr/local/bin/kibana-proxy-resolve",
+            f"echo '* * * * * root /usr/local/bin/kibana-proxy-resolve {es_domain.domain_endpoint}'"
+            " > /etc/cron.d/kibana-proxy-resolve",
+        )
+
+        proxy_role = iam.Role(
             self,
-            "KibanaProxyInstance",
-            instance_name="kibana-proxy",
-            instance_type=ec2.InstanceType("t3.medium"),
+            "KibanaProxyRole",
+            assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name("AmazonSSMManagedInstanceCore"),
+            ]
+        )
+
+        # the ALB is public, so it and the proxies get groups of their own;
+        # the imported shared group, which the domain and the other stacks
+        # use, is attached immutable so the target wiring adds no rules to it
+        kibana_alb_sg = ec2.SecurityGroup(
+            self,
+            "KibanaProxyALBSG",
+            vpc=vpc,
+            description="Public access to the Kibana proxy ALB",
+        )
+        proxy_sg = ec2.SecurityGroup(
+            self,
+            "KibanaProxySG",
+            vpc=vpc,
+            description="HTTP from the Kibana proxy ALB",
+        )
+        shared_sg = ec2.SecurityGroup.from_security_group_id(
+            self,
+            "SharedSecurityGroup",
+            sg.security_group_id,
+            mutable=False
+        )
+
+        proxy_group = autoscaling.AutoScalingGroup(
+            self,
+            "KibanaProxyGroup",
+            instance_type=ec2.InstanceType(instance_type_for(proxy["instance_type"], architecture)),
             machine_image=amzn_linux,
             vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PRIVATE
+            ),
+            security_group=proxy_sg,
+            role=proxy_role,
+            user_data=proxy_user_data,
+            key_name=proxy["key_name"],
+            min_capacity=proxy["min_capacity"],
+            max_capacity=proxy["max_capacity"],
+            health_check=autoscaling.HealthCheck.elb(grace=core.Duration.minutes(5)),
+        )
+        # the proxies reach the domain through the shared group
+        proxy_group.add_security_group(shared_sg)
+        core.Tags.of(proxy_group).add("Name", "kibana-proxy")
+
+        kibana_alb = elbv2.ApplicationLoadBalancer(
+            self,
+            "KibanaProxyALB",
+            vpc=vpc,
+            internet_facing=True,
             vpc_subnets=ec2.SubnetSelection(
                 subnet_type=ec2.SubnetType.PUBLIC
             ),
-            security_group=sg,
-            key_name="eksworkshop",
+            security_group=kibana_alb_sg,
         )
+
+        # open=True only adds 0.0.0.0/0 to the ALB's own group
+        if proxy["certificate_arn"]:
+            listener = kibana_alb.add_listener(
+                "HttpsListener",
+                port=443,
+                certificates=[elbv2.ListenerCertificate.from_arn(proxy["certificate_arn"])],
+                open=True
+            )
+        else:
+            listener = kibana_alb.add_listener(
+                "HttpListener",
+                port=80,
+                open=True
+            )
+
+        proxy_targets = listener.add_targets(
+            "KibanaProxyTargets",
+            port=80,
+            targets=[proxy_group],
+            health_check=elbv2.HealthCheck(path="/nginx-health"),
+            # Kibana sessions are cookie based, keep users on the proxy holding their cache entries
+            stickiness_cookie_duration=core.Duration.hours(1),
+            deregistration_delay=core.Duration.seconds(30),
+        )
+
+        proxy_group.scale_on_request_count(
+            "KibanaProxyRequestCount",
+            target_requests_per_second=proxy["requests_per_second_per_target"]
+        )
+
+        if proxy["latency_steps"]:
+            proxy_group.scale_on_metric(
+                "KibanaProxyLatency",
+                metric=proxy_targets.metric_target_response_time(
+                    period=core.Duration.minutes(1)
+                ),
+                scaling_steps=[
+                    autoscaling.ScalingInterval(upper=proxy["latency_steps"][0]["lower"], change=0)
+                ] + [
+                    autoscaling.ScalingInterval(lower=step["lower"], change=step["change"])
+                    for step in proxy["latency_steps"]
+                ],
+                adjustment_type=autoscaling.AdjustmentType.CHANGE_IN_CAPACITY
+            )
+
+        core.CfnOutput(
+            self,
+            "KibanaURL",
+            value=f"{'https' if proxy['certificate_arn'] else 'http'}://{kibana_alb.load_balancer_dns_name}/_plugin/kibana/"
+        )
+
+    @property
+    def ingest_capacity(self) -> dict:
+        return dict(self._ingest_capacity)
@@ -0,0 +1,22 @@
+# Slow log settings shared by the index template, the domain's metric filters
+# and the pipeline dashboard. Free of CDK imports so the search stack does not
+# load the monitoring constructs.
+
+SLOW_LOG_NAMESPACE = "EcsElk/SlowLogs"
+SLOW_LOG_KINDS = ("SlowIndex", "SlowSearch")
+
+# an operation is logged once, at the highest level it passes, so the metric
+# filters count every operation slower than the info threshold
+SLOW_LOG_THRESHOLDS = {
+    "index.indexing.slowlog.threshold.index.warn": "2s",
+    "index.indexing.slowlog.threshold.index.info": "500ms",
+    "index.search.slowlog.threshold.query.warn": "5s",
+    "index.search.slowlog.threshold.query.info": "2s",
+    "index.search.slowlog.threshold.fetch.warn": "1s",
+    "index.search.slowlog.threshold.fetch.info": "500ms",
+}
+
+
+def slow_log_metric_name(domain_name: str, kind: str) -> str:
+    # metric filters in this CDK version can not set dimensions
+    return f"{domain_name}-{kind}Entries"
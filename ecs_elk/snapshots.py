@@ -0,0 +1,167 @@
+from aws_cdk import (
+    core,
+    aws_iam as iam,
+    aws_ec2 as ec2,
+    aws_s3 as s3,
+    aws_lambda as lambda_,
+    aws_logs as cloudwatch_logs,
+    aws_events as events,
+    aws_events_targets as targets,
+)
+from ecs_elk.es_bootstrap import ElasticsearchBootstrap
+from ecs_elk.role_names import SNAPSHOT_ROLE_NAME
+
+SNAPSHOT_DEFAULTS = {
+    "bucket_name": "es-log-snapshots",
+    "repository": "log-snapshots",
+    "snapshot_prefix": "logs",
+    "interval_hours": 6,
+    # snapshots outlive the indices, so old data can be evicted from the
+    # cluster and restored on demand
+    "retention_days": 365,
+    "infrequent_access_after_days": 30,
+    # per node repository throttles
+    "max_snapshot_bytes_per_sec": "200mb",
+    "max_restore_bytes_per_sec": "1gb",
+}
+
+
+def render_repository_request(bucket_name: str, region: str, role_arn: str,
+                              repository: str, max_snapshot_bytes_per_sec: str,
+                              max_restore_bytes_per_sec: str) -> dict:
+    return {
+        "method": "PUT",
+        "path": f"/_snapshot/{repository}",
+        "body": {
+            "type": "s3",
+            "settings": {
+                "bucket": bucket_name,
+                "region": region,
+                "role_arn": role_arn,
+                "server_side_encryption": True,
+                "max_snapshot_bytes_per_sec": max_snapshot_bytes_per_sec,
+                "max_restore_bytes_per_sec": max_restore_bytes_per_sec,
+            }
+        },
+    }
+
+
+class SnapshotLifecycle(core.Construct):
+    """Manual snapshot repository in S3 with scheduled snapshots.
+
+    Registers the repository through the bootstrap custom resource and
+    runs a scheduled function, sharing the bootstrap code and role, that
+    prunes expired snapshots and takes the next one. utils/restore_indices.py
+    brings indices back from the repository.
+    """
+
+    def __init__(self, scope: core.Construct, construct_id: str,
+                 bootstrap: ElasticsearchBootstrap, domain_endpoint: str,
+                 admin_role_arn: str, indices: str, vpc: ec2.IVpc, security_group: ec2.ISecurityGroup,
+                 options: dict = None, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        settings = dict(SNAPSHOT_DEFAULTS, **(options or {}))
+        if settings["retention_days"] < 1:
+            raise ValueError("snapshot retention_days must be at least 1")
+
+        bucket = s3.Bucket(
+            self,
+            "SnapshotBucket",
+            bucket_name=settings["bucket_name"],
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            # older snapshot files are only read on restore
+            lifecycle_rules=[
+                s3.LifecycleRule(
+                    transitions=[
+                        s3.Transition(
+                            storage_class=s3.StorageClass.INFREQUENT_ACCESS,
+                            transition_after=core.Duration.days(settings["infrequent_access_after_days"])
+                        )
+                    ]
+                )
+            ],
+        )
+
+        snapshot_role = iam.Role(
+            self,
+            "SnapshotRole",
+            role_name=SNAPSHOT_ROLE_NAME,
+            assumed_by=iam.ServicePrincipal("es.amazonaws.com"),
+        )
+
+        snapshot_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "s3:ListBucket"
+                ],
+                resources=[bucket.bucket_arn]
+            )
+        )
+        snapshot_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "s3:GetObject",
+                    "s3:PutObject",
+                    "s3:DeleteObject"
+                ],
+                resources=[f"{bucket.bucket_arn}/*"]
+            )
+        )
+
+        repository = bootstrap.add_requests(
+            "SnapshotRepository",
+            [render_repository_request(
+                bucket.bucket_name, core.Stack.of(self).region, snapshot_role.role_arn,
+                settings["repository"], settings["max_snapshot_bytes_per_sec"],
+                settings["max_restore_bytes_per_sec"],
+            )]
+        )
+        repository.node.add_dependency(snapshot_role)
+
+        scheduler = lambda_.Function(
+            self,
+            "SnapshotFunction",
+            handler="snapshots.handler",
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            code=lambda_.Code.from_asset("resources/es_bootstrap"),
+            timeout=core.Duration.minutes(5),
+            environment={
+                "ENDPOINT": domain_endpoint,
+                "ADMIN_ROLE_ARN": admin_role_arn,
+                "REPOSITORY": settings["repository"],
+                "INDICES": indices,
+                "SNAPSHOT_PREFIX": settings["snapshot_prefix"],
+                "RETENTION_DAYS": str(settings["retention_days"]),
+            },
+            # trusted by the admin role, like the bootstrap function
+            role=bootstrap.role,
+            vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PRIVATE
+            ),
+            security_groups=[security_group],
+            log_retention=cloudwatch_logs.RetentionDays.ONE_WEEK,
+        )
+
+        schedule = events.Rule(
+            self,
+            "SnapshotSchedule",
+            schedule=events.Schedule.rate(core.Duration.hours(settings["interval_hours"])),
+            targets=[targets.LambdaFunction(scheduler)]
+        )
+        schedule.node.add_dependency(repository)
+
+        self._bucket = bucket
+        self._repository = settings["repository"]
+
+    @property
+    def bucket(self) -> s3.IBucket:
+        return self._bucket
+
+    @property
+    def repository(self) -> str:
+        return self._repository
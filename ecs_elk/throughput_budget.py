@@ -0,0 +1,154 @@
+from aws_cdk import core
+from ecs_elk.capacity_planner import PLANNER_DEFAULTS
+from ecs_elk.monitoring import ALARM_DEFAULTS
+
+
+BUDGET_DEFAULTS = {
+    # every stage's ceiling must clear the expected peak by this factor
+    "headroom": 1.5,
+    # a parsed nginx line with the FireLens metadata
+    "record_bytes": 600,
+    # rough Fluent Bit figure with the Lua edge filter, re-measure with
+    # utils/bench_firelens_modes.py on the router's task size
+    "router_records_per_vcpu": 20000,
+    # DirectPut quotas of one delivery stream outside the largest regions
+    "firehose_records_per_second": 100000,
+    "firehose_mib_per_second": 1,
+    # write limits of one Kinesis shard
+    "shard_records_per_second": 1000,
+    "shard_mib_per_second": 1,
+    # per minute, the same figure the indexing rate alarm uses
+    "indexing_ops_per_data_node": ALARM_DEFAULTS["indexing_ops_per_data_node"],
+    "write_amplification": PLANNER_DEFAULTS["write_amplification"],
+}
+
+
+def peak_records_per_second(ingest_gb_per_day: float, record_bytes: int = BUDGET_DEFAULTS["record_bytes"],
+                            peak_factor: float = PLANNER_DEFAULTS["ingest_peak_factor"]) -> float:
+    """Peak rate implied by a daily volume, with the capacity planner's peak factor."""
+    return ingest_gb_per_day * 1024 ** 3 / record_bytes / 86400 * peak_factor
+
+
+def budget_stages(ecs: dict, firehose: dict, search: dict, **options) -> list:
+    """Estimated ceiling of each stage the router feeds, in pipeline order.
+
+    Takes the ingest_capacity of ECSStack, KinesisFirehoseStack and
+    ElasticSearchVPCStack. A stage is a dict with the stack it belongs to,
+    its limit in words, a records per second ceiling and a MiB per second
+    one, None where the stage is not bound by bytes.
+    """
+    settings = dict(BUDGET_DEFAULTS, **options)
+    tasks = ecs["max_tasks"]
+
+    # past this rate the service runs every task above its scaling target
+    stages = [{
+        "stage": "ecs scaling",
+        "stack": "ecs",
+        "limit": f"{tasks} tasks x {ecs['requests_per_target']} requests/min target",
+        "records_per_second": tasks * ecs["requests_per_target"] / 60,
+        "mib_per_second": None,
+    }]
+
+    per_task = ecs["router_cpu"] / 1024 * settings["router_records_per_vcpu"]
+    limit = f"{tasks} routers x {ecs['router_cpu']} cpu units"
+    if ecs["rate_limit"]:
+        per_task = min(per_task, ecs["rate_limit"])
+        limit += f", {ecs['rate_limit']} records/s cap"
+    stages.append({
+        "stage": "firelens router",
+        "stack": "ecs",
+        "limit": limit,
+        "records_per_second": tasks * per_task,
+        "mib_per_second": None,
+    })
+
+    if ecs["log_output"] == "kinesis_streams":
+        shards = firehose["source_shards"]
+        if shards is None:
+            raise ValueError("the kinesis_streams output needs the Firehose source stream")
+        stages.append({
+            "stage": "kinesis source",
+            "stack": "firehose",
+            "limit": f"{shards} shards at most",
+            "records_per_second": shards * settings["shard_records_per_second"],
+            "mib_per_second": shards * settings["shard_mib_per_second"],
+        })
+    elif ecs["log_output"] == "kinesis_firehose":
+        streams = firehose["delivery_streams"]
+        stages.append({
+            "stage": "firehose directput",
+            "stack": "firehose",
+            "limit": f"{streams} delivery streams x quota",
+            "records_per_second": streams * settings["firehose_records_per_second"],
+            "mib_per_second": streams * settings["firehose_mib_per_second"],
+        })
+
+    # the cloudwatch output does not reach the domain
+    if ecs["log_output"] != "cloudwatch":
+        copies = 1 + search["replicas"]
+        nodes = search["data_nodes"]
+        stages.append({
+            "stage": "elasticsearch",
+            "stack": "search",
+            "limit": f"{nodes} x {search['data_node_instance_type']}, {copies} copies",
+            "records_per_second": nodes * settings["indexing_ops_per_data_node"] / 60 / copies,
+            "mib_per_second": nodes * search["volume_throughput"] / copies / settings["write_amplification"],
+        })
+    return stages
+
+
+def plan_budget(peak: float, stages: list, **options) -> list:
+    """Compare every stage's ceiling with the peak times the headroom factor.
+
+    Returns one row per stage with its ceiling in records per second, the
+    required rate, the utilization at the required rate and whether it fits.
+    """
+    if peak <= 0:
+        raise ValueError("the expected peak must be positive")
+    settings = dict(BUDGET_DEFAULTS, **options)
+    required = peak * settings["headroom"]
+
+    rows = []
+    for stage in stages:
+        ceiling, bound = stage["records_per_second"], "records"
+        if stage["mib_per_second"] is not None:
+            by_bytes = stage["mib_per_second"] * 1024 ** 2 / settings["record_bytes"]
+            if by_bytes < ceiling:
+                ceiling, bound = by_bytes, "bytes"
+        rows.append(dict(
+            stage,
+            ceiling=ceiling,
+            bound=bound,
+            required=required,
+            utilization=required / ceiling * 100,
+            fits=ceiling >= required,
+        ))
+    return rows
+
+
+def render_budget_table(rows: list) -> str:
+    lines = [f"{'stage':<20}{'ceiling/s':>12}{'required/s':>12}{'use':>7}  {'limit'}"]
+    for row in rows:
+        lines.append(
+            f"{row['stage']:<20}{row['ceiling']:>12,.0f}{row['required']:>12,.0f}"
+            f"{row['utilization']:>6.0f}%  {row['limit']} ({row['bound']} bound)"
+            f"{'' if row['fits'] else '  OVER BUDGET'}"
+        )
+    return "\n".join(lines)
+
+
+def annotate_budget(rows: list, stacks: dict, fail: bool = False) -> None:
+    """Warn on, or with fail set error out, the stacks whose stage is over budget.
+
+    stacks maps the stage's stack key (ecs, firehose, search) to the stack.
+    """
+    for row in rows:
+        if row["fits"]:
+            continue
+        message = (f"Throughput budget: {row['stage']} tops out at {row['ceiling']:,.0f} records/s "
+                   f"({row['limit']}), below the {row['required']:,.0f} records/s required")
+        annotations = core.Annotations.of(stacks[row["stack"]])
+        if fail:
+            annotations.add_error(message)
+        else:
+            annotations.add_warning(message)
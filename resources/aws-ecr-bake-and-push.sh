@@ -1,7 +1,12 @@
 #!/usr/bin/env zsh
 
 ECR_URL="${CDK_ACCOUNT}.dkr.ecr.${CDK_REGION}.amazonaws.com"
+# one manifest list for x86 and Graviton nodes, ECS pulls the matching image
+PLATFORMS="${PLATFORMS:-linux/amd64,linux/arm64}"
 
-docker build -t "${REPO_NAME}" .
-docker tag "${REPO_NAME}:latest" "${ECR_URL}/${REPO_NAME}:latest"
-docker push "${ECR_URL}/${REPO_NAME}:latest"
+# the default docker driver can not build for several platforms at once; on
+# Linux hosts the foreign platform's RUN steps also need QEMU, e.g.
+# docker run --privileged --rm tonistiigi/binfmt --install arm64
+docker buildx inspect multiarch > /dev/null 2>&1 || docker buildx create --name multiarch
+docker buildx build --builder multiarch --platform "${PLATFORMS}" \
+    -t "${ECR_URL}/${REPO_NAME}:latest" --push .
@@ -0,0 +1,14 @@
+#!/bin/bash
+# Passes node settings written by the ECS instance user data to the stock
+# entrypoint. Setting names contain dots, so they go through env(1).
+set -e
+
+settings=()
+if [ -s /bootstrap/node_name ]; then
+    settings+=("node.name=$(cat /bootstrap/node_name)")
+fi
+if [ -s /bootstrap/initial_master_nodes ]; then
+    settings+=("cluster.initial_master_nodes=$(cat /bootstrap/initial_master_nodes)")
+fi
+
+exec env "${settings[@]}" /usr/local/bin/docker-entrypoint.sh "$@"
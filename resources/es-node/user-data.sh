@@ -0,0 +1,47 @@
+# Appended to the ECS agent user data of every Elasticsearch node.
+
+yum install -y mdadm xfsprogs jq awscli
+
+# kernel settings the Elasticsearch bootstrap checks require
+sysctl -w vm.max_map_count=262144
+echo "vm.max_map_count=262144" > /etc/sysctl.d/99-elasticsearch.conf
+sysctl -w vm.swappiness=1
+
+# instance-store NVMe only, the EBS root volume also shows up as NVMe on Nitro
+devices=$(lsblk -dpno NAME,MODEL | awk '/Instance Storage/ {print $1}')
+count=$(echo "$devices" | grep -c nvme || true)
+if [ "$count" -gt 1 ]; then
+    mdadm --create /dev/md0 --level=0 --raid-devices="$count" $devices
+    data_device=/dev/md0
+else
+    data_device=$devices
+fi
+if [ -n "$data_device" ]; then
+    mkfs.xfs -f "$data_device"
+    mkdir -p __DATA_PATH__
+    mount -o noatime "$data_device" __DATA_PATH__
+fi
+mkdir -p __DATA_PATH__
+chown 1000:0 __DATA_PATH__
+
+# cluster.initial_master_nodes has to name nodes before any of them exist,
+# so every node waits for the initial group and derives the same list
+token=$(curl -s -X PUT http://169.254.169.254/latest/api/token -H "X-aws-ec2-metadata-token-ttl-seconds: 300")
+metadata() {
+    curl -s -H "X-aws-ec2-metadata-token: $token" "http://169.254.169.254/latest/meta-data/$1"
+}
+region=$(metadata placement/region)
+mkdir -p __BOOTSTRAP_PATH__
+metadata local-hostname > __BOOTSTRAP_PATH__/node_name
+
+for attempt in $(seq 60); do
+    nodes=$(aws ec2 describe-instances --region "$region" \
+        --filters "Name=tag:__TAG_KEY__,Values=__TAG_VALUE__" "Name=instance-state-name,Values=pending,running" \
+        --query "Reservations[].Instances[].[LaunchTime,InstanceId,PrivateDnsName]" --output json \
+        | jq -r 'sort | .[:__MASTER_COUNT__] | map(.[2]) | join(",")')
+    if [ "$(echo "$nodes" | tr ',' '\n' | grep -c .)" -ge __MASTER_COUNT__ ]; then
+        break
+    fi
+    sleep 10
+done
+echo -n "$nodes" > __BOOTSTRAP_PATH__/initial_master_nodes
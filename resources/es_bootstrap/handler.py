@@ -0,0 +1,96 @@
+import json
+import os
+import urllib.error
+import urllib.request
+
+import boto3
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+
+
+class RequestFailed(Exception):
+    pass
+
+
+def admin_credentials():
+    role_arn = os.environ.get("ADMIN_ROLE_ARN")
+    if not role_arn:
+        return boto3.Session().get_credentials()
+
+    creds = boto3.client("sts").assume_role(
+        RoleArn=role_arn,
+        RoleSessionName="es-bootstrap"
+    )["Credentials"]
+    return Credentials(creds["AccessKeyId"], creds["SecretAccessKey"], creds["SessionToken"])
+
+
+def make_sender(endpoint, region=None, credentials=None):
+    """Return send(method, path, body) -> (status, response) for the given endpoint.
+
+    Requests are SigV4 signed when credentials are given, plain otherwise
+    (local Elasticsearch containers).
+    """
+    base_url = endpoint if endpoint.startswith("http") else f"https://{endpoint}"
+
+    def send(method, path, body=None, extra_headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = dict({"Content-Type": "application/json"}, **(extra_headers or {}))
+
+        if credentials is not None:
+            aws_request = AWSRequest(method=method, url=base_url + path, data=data, headers=headers)
+            SigV4Auth(credentials, "es", region).add_auth(aws_request)
+            headers = dict(aws_request.headers.items())
+
+        request = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, payload.decode("utf-8", errors="replace")
+
+    return send
+
+
+def apply_request(send, request):
+    path = request["path"]
+
+    unless_exists = request.get("unless_exists")
+    if unless_exists:
+        status, _ = send("HEAD", unless_exists)
+        if status == 200:
+            return "skipped"
+
+    # ISM policies and rollup jobs reject a plain PUT over an existing one
+    if request.get("versioned"):
+        status, current = send("GET", path)
+        if status == 200:
+            path += f"?if_seq_no={current['_seq_no']}&if_primary_term={current['_primary_term']}"
+
+    status, response = send(request["method"], path, request.get("body"), request.get("headers"))
+    if status >= 300 and status not in request.get("ignore_status", []):
+        raise RequestFailed(f"{request['method']} {request['path']} returned {status}: {response}")
+    return status
+
+
+def handler(event, context):
+    props = event["ResourceProperties"]
+    send = make_sender(props["Endpoint"], os.environ["AWS_REGION"], admin_credentials())
+
+    if event["RequestType"] == "Delete":
+        requests = json.loads(props.get("DeleteRequests", "[]"))
+    else:
+        requests = json.loads(props["Requests"])
+
+    for request in requests:
+        result = apply_request(send, request)
+        print(f"{request['method']} {request['path']}: {result}")
+
+    return {
+        "PhysicalResourceId": event.get("PhysicalResourceId") or f"{props['Endpoint']}/{props['Name']}"
+    }
@@ -0,0 +1,85 @@
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+
+from handler import RequestFailed, admin_credentials, make_sender
+
+
+ENDPOINT = os.environ.get("ENDPOINT")
+REPOSITORY = os.environ.get("REPOSITORY", "log-snapshots")
+INDICES = os.environ.get("INDICES", "*")
+SNAPSHOT_PREFIX = os.environ.get("SNAPSHOT_PREFIX", "logs")
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "365"))
+
+# returned while another snapshot or deletion holds the repository
+CONCURRENT_ERROR_TYPE = "concurrent_snapshot_execution_exception"
+
+
+def expired_snapshots(snapshots, now, retention_days, prefix):
+    """Names of our snapshots older than the retention, never the newest successful one."""
+    ours = sorted(
+        (s for s in snapshots if s["snapshot"].startswith(f"{prefix}-")),
+        key=lambda s: s["start_time_in_millis"]
+    )
+    successful = [s for s in ours if s["state"] == "SUCCESS"]
+    keep = successful[-1]["snapshot"] if successful else None
+    cutoff = (now - timedelta(days=retention_days)).timestamp() * 1000
+    return [s["snapshot"] for s in ours
+            if s["start_time_in_millis"] < cutoff and s["snapshot"] != keep]
+
+
+def is_concurrent(response):
+    error = response.get("error") if isinstance(response, dict) else None
+    if not isinstance(error, dict):
+        return False
+    return any(cause.get("type") == CONCURRENT_ERROR_TYPE for cause in [error] + error.get("root_cause", []))
+
+
+def handler(event, context):
+    send = make_sender(ENDPOINT, os.environ["AWS_REGION"], admin_credentials())
+    now = datetime.now(timezone.utc)
+
+    # snapshots are incremental, a run still going just means the next one is smaller
+    status, current = send("GET", f"/_snapshot/{REPOSITORY}/_current")
+    if status == 200 and current["snapshots"]:
+        print(f"skipped, {current['snapshots'][0]['snapshot']} is still running")
+        return {"skipped": True}
+
+    status, listing = send("GET", f"/_snapshot/{REPOSITORY}/_all")
+    if status != 200:
+        raise RequestFailed(f"listing {REPOSITORY} returned {status}: {listing}")
+
+    # one snapshot operation at a time on 7.x, so prune before taking the next
+    expired = expired_snapshots(listing["snapshots"], now, RETENTION_DAYS, SNAPSHOT_PREFIX)
+    deleted = []
+    for name in expired:
+        try:
+            status, response = send("DELETE", f"/_snapshot/{REPOSITORY}/{name}")
+        except socket.timeout:
+            # the cluster carries on deleting, the next run takes the snapshot
+            print(f"skipped, DELETE {name} is still running")
+            return {"skipped": True, "deleted": deleted}
+        print(f"DELETE {name}: {status}")
+        if status == 404:
+            continue
+        if status != 200:
+            if is_concurrent(response):
+                print(f"skipped, a snapshot deletion is still running: {response}")
+                return {"skipped": True, "deleted": deleted}
+            raise RequestFailed(f"deleting {name} returned {status}: {response}")
+        deleted.append(name)
+
+    name = f"{SNAPSHOT_PREFIX}-{now:%Y.%m.%d-%H.%M}"
+    status, response = send("PUT", f"/_snapshot/{REPOSITORY}/{name}", {
+        "indices": INDICES,
+        "ignore_unavailable": True,
+        "include_global_state": False,
+    })
+    if status >= 300 and is_concurrent(response):
+        # a deletion started elsewhere, e.g. by hand, still holds the repository
+        print(f"skipped, {name} refused while a snapshot operation is running: {response}")
+        return {"skipped": True, "deleted": deleted}
+    if status >= 300:
+        raise RequestFailed(f"snapshot {name} returned {status}: {response}")
+    print(f"PUT {name}: {status}")
+    return {"snapshot": name, "deleted": deleted}
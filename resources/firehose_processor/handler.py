@@ -0,0 +1,189 @@
+import base64
+import json
+import os
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+
+
+# nginx "combined" log format, optionally followed by $request_time
+COMBINED_LOG_RE = re.compile(
+    r'(?P<remote_addr>\S+) - (?P<remote_user>\S+) '
+    r'\[(?P<time_local>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<request_uri>\S+) (?P<protocol>[^"]+)" '
+    r'(?P<status>\d{3}) (?P<body_bytes_sent>\d+|-) '
+    r'"(?P<http_referer>[^"]*)" "(?P<http_user_agent>[^"]*)"'
+    r'(?: (?P<request_time>\d+\.\d+))?'
+)
+
+# requests nginx could not parse, e.g. TLS handshakes on the plain port
+INVALID_REQUEST_RE = re.compile(
+    r'(?P<remote_addr>\S+) - (?P<remote_user>\S+) '
+    r'\[(?P<time_local>[^\]]+)\] '
+    r'"(?P<request>[^"]*)" '
+    r'(?P<status>\d{3}) (?P<body_bytes_sent>\d+|-) '
+    r'"(?P<http_referer>[^"]*)" "(?P<http_user_agent>[^"]*)"'
+)
+
+NUMERIC_SEGMENT_RE = re.compile(r"^\d+$")
+HEX_SEGMENT_RE = re.compile(r"^[0-9a-fA-F]{16,}$|^[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}$")
+
+BOT_RE = re.compile(r"bot|crawl|spider|slurp|ELB-HealthChecker|kube-probe|curl|wget", re.I)
+BROWSER_RES = [
+    ("Edge", re.compile(r"Edg(?:e|A|iOS)?/(\d+)")),
+    ("Opera", re.compile(r"OPR/(\d+)")),
+    ("Chrome", re.compile(r"Chrome/(\d+)")),
+    ("Firefox", re.compile(r"Firefox/(\d+)")),
+    ("Safari", re.compile(r"Version/(\d+).*Safari/")),
+]
+OS_RES = [
+    ("Windows", re.compile(r"Windows NT")),
+    ("iOS", re.compile(r"iPhone|iPad")),
+    ("Android", re.compile(r"Android")),
+    ("macOS", re.compile(r"Mac OS X")),
+    ("Linux", re.compile(r"Linux")),
+]
+
+SERVICE_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+PARSE_FAILURE_MODE = os.environ.get("PARSE_FAILURE_MODE", "tag")
+# "es" for the Elasticsearch destination, "archive" for the Parquet archive stream
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "es")
+CACHE_SIZE = int(os.environ.get("NORMALIZE_CACHE_SIZE", "4096"))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_user_agent(user_agent):
+    if not user_agent or user_agent == "-":
+        return "unknown", "unknown", False
+
+    is_bot = BOT_RE.search(user_agent) is not None
+
+    browser = "other"
+    for name, pattern in BROWSER_RES:
+        match = pattern.search(user_agent)
+        if match:
+            browser = f"{name} {match.group(1)}"
+            break
+
+    os_name = "other"
+    for name, pattern in OS_RES:
+        if pattern.search(user_agent):
+            os_name = name
+            break
+
+    return browser, os_name, is_bot
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_path(request_uri):
+    path = request_uri.split("?", 1)[0]
+    segments = []
+    for segment in path.split("/"):
+        if NUMERIC_SEGMENT_RE.match(segment):
+            segments.append(":id")
+        elif HEX_SEGMENT_RE.match(segment):
+            segments.append(":hash")
+        else:
+            segments.append(segment)
+    return path, "/".join(segments) or "/"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_time_local(time_local):
+    return datetime.strptime(time_local, "%d/%b/%Y:%H:%M:%S %z").isoformat()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def archive_time(timestamp):
+    """Hive timestamp plus the dt and hour partition values, all in UTC."""
+    utc = datetime.fromisoformat(timestamp).astimezone(timezone.utc)
+    return utc.strftime("%Y-%m-%d %H:%M:%S.000"), utc.strftime("%Y-%m-%d"), utc.strftime("%H")
+
+
+def to_archive(doc, arrival_ms):
+    """Reshapes a document for the Parquet conversion and returns its partition keys."""
+    timestamp = doc.pop("@timestamp", None)
+    if timestamp is None:
+        timestamp = datetime.fromtimestamp(arrival_ms / 1000, timezone.utc).replace(microsecond=0).isoformat()
+    doc["event_time"], dt, hour = archive_time(timestamp)
+    service = SERVICE_NAME_RE.sub("_", doc.get("service") or doc.get("container_name") or "") or "unknown"
+    return {"dt": dt, "hour": hour, "service": service}
+
+
+def parse_line(line):
+    match = COMBINED_LOG_RE.match(line)
+    if match is None:
+        match = INVALID_REQUEST_RE.match(line)
+        if match is None:
+            return None
+
+    fields = match.groupdict()
+    try:
+        timestamp = parse_time_local(fields["time_local"])
+    except ValueError:
+        # matches the format but is no date, e.g. a month nginx never writes
+        return None
+
+    doc = {
+        "remote_addr": fields["remote_addr"],
+        "remote_user": None if fields["remote_user"] == "-" else fields["remote_user"],
+        "@timestamp": timestamp,
+        "status": int(fields["status"]),
+        "body_bytes_sent": 0 if fields["body_bytes_sent"] == "-" else int(fields["body_bytes_sent"]),
+        "http_referer": None if fields["http_referer"] == "-" else fields["http_referer"],
+        "http_user_agent": fields["http_user_agent"],
+    }
+
+    if "request_uri" in fields:
+        doc["method"] = fields["method"]
+        doc["protocol"] = fields["protocol"]
+        doc["path"], doc["path_group"] = normalize_path(fields["request_uri"])
+        if fields["request_time"] is not None:
+            doc["request_time"] = float(fields["request_time"])
+    else:
+        doc["request"] = fields["request"]
+
+    doc["ua_browser"], doc["ua_os"], doc["ua_is_bot"] = normalize_user_agent(fields["http_user_agent"])
+    return doc
+
+
+def transform_record(record):
+    payload = base64.b64decode(record["data"])
+
+    # FireLens wraps each line in a JSON envelope with the container metadata
+    try:
+        envelope = json.loads(payload)
+    except ValueError:
+        envelope = {"log": payload.decode("utf-8", errors="replace")}
+    if not isinstance(envelope, dict):
+        envelope = {"log": str(envelope)}
+
+    line = envelope.pop("log", "")
+    if not isinstance(line, str):
+        # Firehose keeps the original record under processing-failed/ in the backup bucket
+        return {"recordId": record["recordId"], "result": "ProcessingFailed", "data": record["data"]}
+    line = line.rstrip("\n")
+    doc = parse_line(line)
+
+    if doc is None:
+        if PARSE_FAILURE_MODE == "drop":
+            return {"recordId": record["recordId"], "result": "Dropped", "data": record["data"]}
+        doc = {"log": line, "tags": ["_nginx_parse_failure"]}
+
+    # the parsed time_local wins over the router's @timestamp, the envelope
+    # only fills in what the line does not carry
+    doc = dict(envelope, **doc)
+    partition_keys = None
+    if OUTPUT_FORMAT == "archive":
+        partition_keys = to_archive(doc, record.get("approximateArrivalTimestamp", 0))
+
+    data = base64.b64encode(json.dumps(doc, separators=(",", ":")).encode("utf-8"))
+    result = {"recordId": record["recordId"], "result": "Ok", "data": data.decode("utf-8")}
+    if partition_keys is not None:
+        result["metadata"] = {"partitionKeys": partition_keys}
+    return result
+
+
+def handler(event, context):
+    return {"records": [transform_record(record) for record in event["records"]]}
@@ -0,0 +1,95 @@
+-- Drops and samples nginx access lines before they leave the task.
+-- Settings come from the FLB_FILTER_* environment variables, see
+-- ecs_elk/firelens.py. Lines that do not parse are always kept.
+
+local function split(value)
+    local items = {}
+    for item in string.gmatch(value or "", "[^,]+") do
+        items[#items + 1] = item
+    end
+    return items
+end
+
+local enabled = os.getenv("FLB_FILTER_ENABLED") == "true"
+local drop_paths = split(os.getenv("FLB_FILTER_DROP_PATHS"))
+local drop_user_agents = split(os.getenv("FLB_FILTER_DROP_USER_AGENTS"))
+local drop_status = {}
+for _, status in ipairs(split(os.getenv("FLB_FILTER_DROP_STATUS"))) do
+    drop_status[status] = true
+end
+-- share of lines kept per status class, "2" for 2xx and so on
+local keep = {}
+for class = 1, 5 do
+    keep[tostring(class)] = tonumber(os.getenv("FLB_FILTER_SAMPLE_" .. class .. "XX") or "1")
+end
+local rate_limit = tonumber(os.getenv("FLB_FILTER_RATE_LIMIT") or "0")
+-- 5xx lines skip sampling and the rate cap so errors stay countable
+local keep_errors = os.getenv("FLB_FILTER_KEEP_ERRORS") ~= "false"
+
+math.randomseed(os.time())
+
+local window = -1
+local window_count = 0
+-- share of the sampled lines the cap let through in the previous second.
+-- a second's share is only known once it is over, so kept lines are
+-- scaled by the last one and the first capped second of a burst is
+-- undercounted
+local cap_ratio = 1
+
+local function has_prefix(value, prefixes)
+    for _, prefix in ipairs(prefixes) do
+        if string.sub(value, 1, #prefix) == prefix then
+            return true
+        end
+    end
+    return false
+end
+
+function edge_filter(tag, timestamp, record)
+    if not enabled then
+        return 0, timestamp, record
+    end
+
+    local line = record["log"]
+    if type(line) ~= "string" then
+        return 0, timestamp, record
+    end
+    local path, status = string.match(line, '^%S+ %- %S+ %[[^%]]*%] "%u+ ([^ "]*)[^"]*" (%d%d%d) ')
+    if status == nil then
+        return 0, timestamp, record
+    end
+
+    -- combined format, the user agent is the last quoted field
+    local user_agent = string.match(line, '" %d%d%d %S+ "[^"]*" "([^"]*)"')
+    if drop_status[status] or has_prefix(path, drop_paths)
+            or (user_agent and has_prefix(user_agent, drop_user_agents)) then
+        return -1, 0, 0
+    end
+
+    local class = string.sub(status, 1, 1)
+    local error_line = keep_errors and class == "5"
+    local ratio = error_line and 1 or (keep[class] or 1)
+    if ratio < 1 and math.random() >= ratio then
+        return -1, 0, 0
+    end
+
+    local capped = 1
+    if rate_limit > 0 and not error_line then
+        local second = math.floor(timestamp)
+        if second ~= window then
+            -- a gap of a second or more had no traffic to cap
+            cap_ratio = second == window + 1 and math.min(1, rate_limit / window_count) or 1
+            window = second
+            window_count = 0
+        end
+        window_count = window_count + 1
+        if window_count > rate_limit then
+            return -1, 0, 0
+        end
+        capped = cap_ratio
+    end
+
+    -- each kept line stands for 1 / (ratio * capped) lines, dashboards sum this field
+    record["sample_rate"] = 1 / (ratio * capped)
+    return 1, timestamp, record
+end
@@ -0,0 +1,22 @@
+#!/bin/sh
+# FireLens generates the [INPUT] sections and they cannot be configured
+# from the task definition. Copy the generated config and give every
+# input the buffering chosen through FLB_STORAGE_TYPE before starting
+# Fluent Bit the way the stock entrypoint does.
+set -e
+
+generated=/fluent-bit/etc/fluent-bit.conf
+config=/tmp/fluent-bit.conf
+
+if [ "${FLB_STORAGE_TYPE:-memory}" = "filesystem" ]; then
+    mkdir -p "${FLB_STORAGE_PATH}"
+    buffering="    storage.type filesystem"
+else
+    buffering="    Mem_Buf_Limit ${FLB_MEM_BUF_LIMIT:-25MB}"
+fi
+
+awk -v buffering="$buffering" '{ print } /^\[INPUT\]/ { print buffering }' "$generated" > "$config"
+
+exec /fluent-bit/bin/fluent-bit \
+    -e /fluent-bit/firehose.so -e /fluent-bit/cloudwatch.so -e /fluent-bit/kinesis.so \
+    -c "$config"
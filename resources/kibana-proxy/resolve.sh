@@ -0,0 +1,17 @@
+#!/bin/bash
+# Reloads nginx when the domain endpoint resolves to other addresses, the
+# upstream in nginx.conf only resolves it when the config loads.
+set -eu
+
+endpoint="$1"
+state=/var/lib/kibana-proxy/addresses
+
+addresses=$(getent ahostsv4 "$endpoint" | awk '{print $1}' | sort -u)
+# keep the current upstream when the lookup fails
+[ -n "$addresses" ] || exit 0
+
+mkdir -p "$(dirname "$state")"
+if [ "$addresses" != "$(cat "$state" 2>/dev/null)" ]; then
+    echo "$addresses" > "$state"
+    systemctl reload nginx
+fi
@@ -0,0 +1,109 @@
+import math
+import os
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+
+# per-shard write limits
+SHARD_BYTES_PER_SECOND = 1024 * 1024
+SHARD_RECORDS_PER_SECOND = 1000
+
+STREAM_NAME = os.environ.get("STREAM_NAME")
+MIN_SHARDS = int(os.environ.get("MIN_SHARDS", "1"))
+MAX_SHARDS = int(os.environ.get("MAX_SHARDS", "16"))
+TARGET_UTILIZATION = float(os.environ.get("TARGET_UTILIZATION", "60")) / 100
+SCALE_IN_UTILIZATION = float(os.environ.get("SCALE_IN_UTILIZATION", "25")) / 100
+LOOKBACK_MINUTES = int(os.environ.get("LOOKBACK_MINUTES", "15"))
+
+
+def peak_per_second(cloudwatch, stream_name, now):
+    """Highest one-minute IncomingBytes and IncomingRecords rates and the throttle count in the window."""
+    queries = [
+        {
+            "Id": metric_id,
+            "MetricStat": {
+                "Metric": {
+                    "Namespace": "AWS/Kinesis",
+                    "MetricName": metric_name,
+                    "Dimensions": [{"Name": "StreamName", "Value": stream_name}],
+                },
+                "Period": 60,
+                "Stat": "Sum",
+            },
+        }
+        for metric_id, metric_name in (
+            ("bytes", "IncomingBytes"),
+            ("records", "IncomingRecords"),
+            ("throttles", "WriteProvisionedThroughputExceeded"),
+        )
+    ]
+    response = cloudwatch.get_metric_data(
+        MetricDataQueries=queries,
+        StartTime=now - timedelta(minutes=LOOKBACK_MINUTES),
+        EndTime=now,
+    )
+    values = {r["Id"]: r["Values"] for r in response["MetricDataResults"]}
+    return (
+        max(values.get("bytes") or [0]) / 60,
+        max(values.get("records") or [0]) / 60,
+        sum(values.get("throttles") or [0]),
+    )
+
+
+def desired_shards(shards, bytes_per_second, records_per_second, throttles):
+    """Shard count that brings the peak back to the target utilization.
+
+    UpdateShardCount can at most double or halve the count in one call
+    and is limited to ten calls a day, so scale-in only happens when the
+    whole lookback window stayed below SCALE_IN_UTILIZATION.
+    """
+    utilization = max(
+        bytes_per_second / (shards * SHARD_BYTES_PER_SECOND),
+        records_per_second / (shards * SHARD_RECORDS_PER_SECOND),
+    )
+
+    if throttles or utilization > TARGET_UTILIZATION:
+        desired = math.ceil(shards * utilization / TARGET_UTILIZATION)
+        if throttles:
+            # the metrics under-report demand that was rejected
+            desired = max(desired, shards * 2)
+    elif utilization < SCALE_IN_UTILIZATION:
+        desired = math.ceil(shards * utilization / TARGET_UTILIZATION)
+    else:
+        desired = shards
+
+    desired = min(max(desired, math.ceil(shards / 2)), shards * 2)
+    return min(max(desired, MIN_SHARDS), MAX_SHARDS)
+
+
+def handler(event, context):
+    kinesis = boto3.client("kinesis")
+    cloudwatch = boto3.client("cloudwatch")
+
+    summary = kinesis.describe_stream_summary(StreamName=STREAM_NAME)["StreamDescriptionSummary"]
+    shards = summary["OpenShardCount"]
+    if summary["StreamStatus"] != "ACTIVE":
+        print(f"{STREAM_NAME} is {summary['StreamStatus']}, skipping")
+        return {"shards": shards, "desired": shards}
+
+    bytes_per_second, records_per_second, throttles = peak_per_second(
+        cloudwatch, STREAM_NAME, datetime.now(timezone.utc)
+    )
+    desired = desired_shards(shards, bytes_per_second, records_per_second, throttles)
+    print(f"{STREAM_NAME}: {shards} shards, peak {bytes_per_second:.0f} B/s "
+          f"{records_per_second:.0f} records/s, {throttles:.0f} throttles -> {desired} shards")
+
+    if desired != shards:
+        try:
+            kinesis.update_shard_count(
+                StreamName=STREAM_NAME,
+                TargetShardCount=desired,
+                ScalingType="UNIFORM_SCALING"
+            )
+        except kinesis.exceptions.LimitExceededException as e:
+            # out of UpdateShardCount calls for the rolling 24 hours, the next
+            # run after the window frees a call tries again
+            print(f"{STREAM_NAME}: resharding to {desired} refused, skipping: {e}")
+            return {"shards": shards, "desired": desired, "skipped": "LimitExceededException"}
+    return {"shards": shards, "desired": desired}
@@ -24,10 +24,21 @@ setuptools.setup(
         "aws-cdk.aws-ec2==1.85.0",
         "aws-cdk.aws-ecs==1.85.0",
         "aws-cdk.aws-ecs-patterns==1.85.0",
+        "aws-cdk.aws-autoscaling==1.85.0",
         "aws-cdk.aws-elasticsearch==1.85.0",
         "aws-cdk.aws-elasticloadbalancingv2==1.85.0",
         "aws-cdk.aws-elasticloadbalancingv2-targets==1.85.0",
+        "aws-cdk.aws-glue==1.85.0",
+        "aws-cdk.aws-kinesis==1.85.0",
         "aws-cdk.aws-kinesisfirehose==1.85.0",
+        "aws-cdk.aws-lambda==1.85.0",
+        "aws-cdk.aws-events==1.85.0",
+        "aws-cdk.aws-events-targets==1.85.0",
+        "aws-cdk.aws-cloudwatch==1.85.0",
+        "aws-cdk.aws-cloudwatch-actions==1.85.0",
+        "aws-cdk.aws-sns==1.85.0",
+        "aws-cdk.aws-sns-subscriptions==1.85.0",
+        "aws-cdk.custom-resources==1.85.0",
     ],
 
     python_requires=">=3.6",
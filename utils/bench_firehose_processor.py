@@ -0,0 +1,110 @@
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+
+HANDLER_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "resources", "firehose_processor", "handler.py"
+)
+
+SAMPLE_PATHS = ["/", "/index.html", "/api/orders/{}", "/api/users/{}/profile",
+                "/static/app.{}.js", "/health", "/favicon.ico"]
+SAMPLE_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0.4280.88 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0.2 Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 14_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/604.1",
+    "ELB-HealthChecker/2.0",
+    "curl/7.64.1",
+]
+
+
+def load_handler():
+    spec = importlib.util.spec_from_file_location("firehose_processor", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_batch(size, failure_ratio):
+    now = datetime.now(timezone.utc)
+    records = []
+    for i in range(size):
+        if random.random() < failure_ratio:
+            line = "\\x16\\x03\\x01 garbage"
+        else:
+            ts = (now + timedelta(milliseconds=i)).strftime("%d/%b/%Y:%H:%M:%S %z")
+            path = random.choice(SAMPLE_PATHS).format(random.randint(1, 5000))
+            line = (f'10.0.{random.randint(0, 255)}.{random.randint(1, 254)} - - [{ts}] '
+                    f'"GET {path} HTTP/1.1" {random.choice([200, 200, 200, 304, 404, 500])} '
+                    f'{random.randint(0, 50000)} "-" "{random.choice(SAMPLE_AGENTS)}" '
+                    f'{random.random():.3f}')
+        envelope = {
+            "log": line,
+            "container_name": "nginx-test",
+            "source": "stdout",
+            "ecs_cluster": "KeehyunECSCluster",
+        }
+        records.append({
+            "recordId": str(uuid.uuid4()),
+            "approximateArrivalTimestamp": int(time.time() * 1000),
+            "data": base64.b64encode(json.dumps(envelope).encode("utf-8")).decode("utf-8"),
+        })
+    return {"records": records}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded Firehose batch through the log parsing processor"
+    )
+    parser.add_argument("--batch-file", help="Firehose transformation event (JSON) to replay")
+    parser.add_argument("--record", help="write a generated batch to this file and exit")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--failure-ratio", type=float, default=0.01)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.record:
+        with open(args.record, "w") as fp:
+            json.dump(generate_batch(args.batch_size, args.failure_ratio), fp)
+        print(f"Recorded {args.batch_size} records to {args.record}")
+        raise SystemExit(0)
+
+    if args.batch_file:
+        with open(args.batch_file) as fp:
+            event = json.load(fp)
+    else:
+        event = generate_batch(args.batch_size, args.failure_ratio)
+
+    processor = load_handler()
+    record_count = len(event["records"])
+    payload_bytes = sum(len(r["data"]) for r in event["records"])
+
+    latencies = []
+    results = {}
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        output = processor.handler(event, None)
+        latencies.append(time.perf_counter() - start)
+
+    for record in output["records"]:
+        results[record["result"]] = results.get(record["result"], 0) + 1
+
+    latencies.sort()
+    total = sum(latencies)
+    print(f"Records per batch : {record_count} ({payload_bytes / 1024 / 1024:.2f} MiB encoded)")
+    print(f"Iterations        : {args.iterations}")
+    print(f"Throughput        : {record_count * args.iterations / total:,.0f} records/s")
+    print(f"Batch latency p50 : {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"Batch latency p99 : {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.1f} ms")
+    print(f"Batch latency max : {latencies[-1] * 1000:.1f} ms")
+    print(f"Results           : {results}")
+    print(f"Cache (user agent): {processor.normalize_user_agent.cache_info()}")
+    print(f"Cache (path)      : {processor.normalize_path.cache_info()}")
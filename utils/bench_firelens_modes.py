@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ecs_elk.firelens import OUTPUT_MODES  # noqa: E402
+
+
+FLUENT_BIT_IMAGE = "amazon/aws-for-fluent-bit:latest"
+SAMPLE_LINE = ('10.0.1.23 - - [10/Oct/2020:13:55:36 +0000] "GET /api/orders/1234 HTTP/1.1" '
+               '200 5120 "-" "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/87.0" 0.012')
+
+
+class StandInSink(ThreadingHTTPServer):
+    """Counts records delivered by Fluent Bit, standing in for CloudWatch, ES or Firehose."""
+
+    daemon_threads = True
+
+    def __init__(self, address, delay, error_every):
+        super().__init__(address, SinkHandler)
+        self.delay = delay
+        self.error_every = error_every
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.records = 0
+        self.last_received = None
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        sink = self.server
+
+        with sink.lock:
+            sink.requests += 1
+            reject = sink.error_every and sink.requests % sink.error_every == 0
+
+        if sink.delay:
+            time.sleep(sink.delay)
+
+        if reject:
+            self.send_response(429)
+            self.end_headers()
+            return
+
+        if self.path.endswith("/_bulk"):
+            # action line + document line per record
+            count = len([line for line in body.splitlines() if line.strip()]) // 2
+            response = json.dumps({"took": 1, "errors": False, "items": []}).encode("utf-8")
+        else:
+            count = len(json.loads(body))
+            response = b"{}"
+
+        with sink.lock:
+            sink.records += count
+            sink.last_received = time.monotonic()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def render_config(mode, input_port, sink_port):
+    settings = OUTPUT_MODES[mode]
+    config = f"""[SERVICE]
+    Flush     {settings["flush"]}
+    Grace     {settings["grace"]}
+    Log_Level warn
+
+[INPUT]
+    Name          tcp
+    Listen        127.0.0.1
+    Port          {input_port}
+    Format        json
+    Mem_Buf_Limit {settings["mem_buf_limit"]}
+
+"""
+    if mode == "es":
+        config += f"""[OUTPUT]
+    Name        es
+    Match       *
+    Host        127.0.0.1
+    Port        {sink_port}
+    Index       bench
+    Type        _doc
+    Buffer_Size False
+    workers     {settings["workers"]}
+    Retry_Limit {settings["retry_limit"]}
+"""
+    else:
+        config += f"""[OUTPUT]
+    Name        http
+    Match       *
+    Host        127.0.0.1
+    Port        {sink_port}
+    URI         /{mode}
+    Format      json
+    workers     {settings["workers"]}
+    Retry_Limit {settings["retry_limit"]}
+"""
+    return config
+
+
+def start_fluent_bit(config_dir, fluent_bit_bin, storage_dir=None, name=None, environment=None):
+    """storage_dir is mounted at the same path so configs can name it directly."""
+    environment = environment or {}
+    if fluent_bit_bin:
+        command = [fluent_bit_bin, "-c", os.path.join(config_dir, "fluent-bit.conf")]
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                env=dict(os.environ, **environment))
+
+    command = ["docker", "run", "--rm", "--network", "host", "-v", f"{config_dir}:/bench:ro"]
+    if storage_dir:
+        command += ["-v", f"{storage_dir}:{storage_dir}"]
+    if name:
+        command += ["--name", name]
+    for key, value in environment.items():
+        command += ["-e", f"{key}={value}"]
+    command += [FLUENT_BIT_IMAGE, "/fluent-bit/bin/fluent-bit", "-c", "/bench/fluent-bit.conf"]
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return socket.create_connection(("127.0.0.1", port), timeout=1)
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"Fluent Bit did not open port {port} within {timeout}s")
+
+
+def run_mode(mode, args):
+    sink = StandInSink(("127.0.0.1", free_port()), args.sink_delay, args.sink_error_every)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    input_port = free_port()
+    with tempfile.TemporaryDirectory() as config_dir:
+        with open(os.path.join(config_dir, "fluent-bit.conf"), "w") as fp:
+            fp.write(render_config(mode, input_port, sink.server_address[1]))
+
+        fluent_bit = start_fluent_bit(config_dir, args.fluent_bit)
+        try:
+            conn = wait_for_port(input_port)
+            line = json.dumps({"log": SAMPLE_LINE, "container_name": "nginx-test"}).encode("utf-8") + b"\n"
+
+            start = time.monotonic()
+            with conn:
+                for _ in range(args.records):
+                    conn.sendall(line)
+            sent_elapsed = time.monotonic() - start
+
+            # wait until the sink has everything or stops making progress
+            idle_deadline = time.monotonic() + args.drain_timeout
+            last_count = -1
+            while time.monotonic() < idle_deadline and sink.records < args.records:
+                if sink.records != last_count:
+                    last_count = sink.records
+                    idle_deadline = time.monotonic() + args.drain_timeout
+                time.sleep(0.5)
+        finally:
+            fluent_bit.terminate()
+            fluent_bit.wait()
+            sink.shutdown()
+
+    end = sink.last_received or time.monotonic()
+    elapsed = end - start
+    return {
+        "mode": mode,
+        "sent": args.records,
+        "delivered": sink.records,
+        "dropped": args.records - sink.records,
+        "sink_requests": sink.requests,
+        "send_seconds": round(sent_elapsed, 3),
+        "delivery_seconds": round(elapsed, 3),
+        "records_per_second": round(sink.records / elapsed, 1) if elapsed > 0 else 0.0,
+        **OUTPUT_MODES[mode],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Push a fixed log volume through Fluent Bit per FireLens output mode"
+    )
+    parser.add_argument("--modes", nargs="+", default=sorted(OUTPUT_MODES), choices=sorted(OUTPUT_MODES))
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--fluent-bit", help="local fluent-bit binary; defaults to running the image in docker")
+    parser.add_argument("--sink-delay", type=float, default=0.0, help="seconds the sink waits per request")
+    parser.add_argument("--sink-error-every", type=int, default=0, help="reject every Nth request with a 429")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [run_mode(mode, args) for mode in args.modes]
+
+    print(f"{'mode':<18}{'delivered':>12}{'dropped':>10}{'records/s':>14}{'requests':>10}")
+    for result in results:
+        print(f"{result['mode']:<18}{result['delivered']:>12}{result['dropped']:>10}"
+              f"{result['records_per_second']:>14,.1f}{result['sink_requests']:>10}")
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# placeholders so the benchmark runs without a deployment environment;
+# lookups fall back to dummy values when cdk.context.json is missing
+DEFAULT_ENV = {
+    "CDK_ACCOUNT": "123456789012",
+    "CDK_REGION": "ap-northeast-2",
+    "ES_DOMAIN_NAME": "bench-domain",
+    "ES_INDEX_NAME": "nginx",
+    "ES_TYPE_NAME": "_doc",
+    "VPC_ID": "vpc-bench",
+    "SECURITY_GROUP_ID": "sg-bench",
+    "REPO_NAME": "bench-repo",
+    "JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION": "1",
+}
+
+
+def run_synth(python):
+    env = dict(DEFAULT_ENV, **os.environ)
+    with tempfile.TemporaryDirectory() as outdir:
+        env["CDK_OUTDIR"] = outdir
+        start = time.perf_counter()
+        subprocess.run([python, "app.py"], cwd=APP_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure wall time and peak memory of synthesizing app.py"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative regression before failing")
+    args = parser.parse_args()
+
+    # the first run warms the jsii runtime and file caches
+    run_synth(args.python)
+    durations = [run_synth(args.python) for _ in range(args.runs)]
+
+    # ru_maxrss is the largest of the python app and its jsii node child, in KiB on Linux
+    peak_rss_mib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    result = {
+        "runs": args.runs,
+        "wall_seconds_median": round(statistics.median(durations), 3),
+        "wall_seconds_min": round(min(durations), 3),
+        "wall_seconds_max": round(max(durations), 3),
+        "peak_rss_mib": round(peak_rss_mib, 1),
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(result, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = [
+            key for key in ("wall_seconds_median", "peak_rss_mib")
+            if result[key] > baseline[key] * (1 + args.tolerance)
+        ]
+        for key in regressions:
+            print(f"regression: {key} {baseline[key]} -> {result[key]}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
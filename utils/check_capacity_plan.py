@@ -0,0 +1,72 @@
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ecs_elk.capacity_planner import (  # noqa: E402
+    DATA_NODE_TYPES, PLANNER_DEFAULTS, capacity_shortfalls, plan_capacity,
+)
+from check_index_lifecycle import check  # noqa: E402
+
+
+# GB/day, retention days, replicas, query concurrency
+PROFILES = [
+    (1, 1, 1, 1),
+    (10, 7, 1, 10),
+    (50, 30, 1, 10),
+    (100, 14, 2, 20),
+    (500, 30, 1, 10),
+    (2000, 30, 1, 50),
+    (5000, 7, 0, 10),
+]
+
+
+def check_plan(profile):
+    ingest, retention, replicas, concurrency = profile
+    plan = plan_capacity(ingest, retention, replicas=replicas, query_concurrency=concurrency)
+    spec = DATA_NODE_TYPES[plan["data_node_instance_type"]]
+    label = f"{ingest} GB/day x {retention}d r{replicas} q{concurrency}"
+
+    results = [
+        check(plan["data_nodes"] * plan["volume_size_gb"] * PLANNER_DEFAULTS["disk_headroom"] >= plan["storage_gb"] - 1,
+              f"{label}: {plan['data_nodes']} x {plan['volume_size_gb']} GB holds {plan['storage_gb']} GB"),
+        check(plan["volume_size_gb"] <= spec["max_volume_gb"],
+              f"{label}: volume within the {plan['data_node_instance_type']} limit"),
+        check(plan["data_nodes"] % plan["availability_zones"] == 0,
+              f"{label}: {plan['data_nodes']} nodes spread over {plan['availability_zones']} AZs"),
+        check(plan["data_nodes"] >= replicas + 1, f"{label}: every shard copy on its own node"),
+        check(plan["primary_shards"] % plan["data_nodes"] == 0 or plan["data_nodes"] % plan["primary_shards"] == 0,
+              f"{label}: {plan['primary_shards']} primaries balance over the nodes"),
+    ]
+
+    indices = retention * max(1, math.ceil(ingest * 1.1 / plan["rollover_size_gb"]))
+    shards = indices * plan["primary_shards"] * (1 + replicas)
+    heap_gb = min(spec["memory"] / 2, 32)
+    results.append(check(shards <= plan["data_nodes"] * heap_gb * PLANNER_DEFAULTS["shards_per_heap_gb"],
+                         f"{label}: {shards} shards within the heap budget"))
+    results.append(check(not capacity_shortfalls(plan, plan, plan["volume_size_gb"]),
+                         f"{label}: the plan is not short of itself"))
+    return plan, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check capacity planner invariants over a range of ingest profiles")
+    parser.add_argument("--show", action="store_true", help="print each plan")
+    args = parser.parse_args()
+
+    results = []
+    for profile in PROFILES:
+        plan, profile_results = check_plan(profile)
+        results.extend(profile_results)
+        if args.show:
+            print(json.dumps(plan))
+
+    small = {"data_node_instance_type": "r5.large.elasticsearch", "data_nodes": 2}
+    results.append(check(capacity_shortfalls(plan_capacity(500, 30), small, 100),
+                         "an undersized cluster is reported"))
+
+    raise SystemExit(0 if all(results) else 1)
@@ -0,0 +1,124 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from check_index_lifecycle import check  # noqa: E402
+from cleanup import clean_bucket, clean_repository, make_client  # noqa: E402
+
+
+def backup_keys(hours, per_hour):
+    """Keys laid out like Firehose backups, plus a few sitting at the shallower levels."""
+    keys = [f"2021/03/{1 + hour // 24:02d}/{hour % 24:02d}/keehyun-firehose-{n}" for hour in range(hours)
+            for n in range(per_hour)]
+    return keys + ["top-level-object", "2021/month-level-object", "elasticsearch-failed/2021/03/01/00/failed-0"]
+
+
+def seed_bucket(s3, bucket, keys, workers, versioned=False):
+    s3.create_bucket(Bucket=bucket)
+    if versioned:
+        s3.put_bucket_versioning(Bucket=bucket, VersioningConfiguration={"Status": "Enabled"})
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda key: s3.put_object(Bucket=bucket, Key=key, Body=b"{}"), keys))
+    if versioned:
+        # noncurrent versions and delete markers are invisible to list_objects_v2
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda key: s3.put_object(Bucket=bucket, Key=key, Body=b"[]"), keys[::3]))
+            list(pool.map(lambda key: s3.delete_object(Bucket=bucket, Key=key), keys[1::3]))
+    return len(keys) + (len(keys[::3]) + len(keys[1::3]) if versioned else 0)
+
+
+def bucket_exists(s3, bucket):
+    return bucket in {b["Name"] for b in s3.list_buckets()["Buckets"]}
+
+
+def seed_repository(ecr, repo_name, images, tags_per_image):
+    ecr.create_repository(repositoryName=repo_name)
+    digests = set()
+    for n in range(images):
+        layer = {
+            "mediaType": "application/vnd.docker.image.rootfs.diff.tar.gzip",
+            "digest": f"sha256:{hashlib.sha256(str(n).encode()).hexdigest()}",
+            "size": 1,
+        }
+        manifest = json.dumps({
+            "schemaVersion": 2,
+            "mediaType": "application/vnd.docker.distribution.manifest.v2+json",
+            "config": dict(layer, mediaType="application/vnd.docker.container.image.v1+json"),
+            "layers": [layer],
+        })
+        for tag in range(tags_per_image):
+            response = ecr.put_image(repositoryName=repo_name, imageManifest=manifest, imageTag=f"v{n}-{tag}")
+            digests.add(response["image"]["imageId"]["imageDigest"])
+    return len(digests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Seed buckets and an ECR repository on a local stand-in, clean them with the "
+                    "cleanup tool and check nothing is left. Run e.g. moto_server -p 5000"
+    )
+    parser.add_argument("--endpoint-url", default="http://localhost:5000")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--hours", type=int, default=48)
+    parser.add_argument("--objects-per-hour", type=int, default=60)
+    parser.add_argument("--images", type=int, default=150, help="more than one batch_delete_image call")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    s3 = make_client("s3", args)
+    keys = backup_keys(args.hours, args.objects_per_hour)
+    results = []
+
+    bucket = f"cleanup-check-{uuid.uuid4().hex[:8]}"
+    seeded = seed_bucket(s3, bucket, keys, args.workers)
+    summary = clean_bucket(s3, bucket, depth=3, workers=args.workers, report_interval=0)
+    print(f"s3: {json.dumps(summary)}")
+    results += [
+        check(summary["listed"] == summary["deleted"] == seeded,
+              f"{summary['deleted']} of {seeded} objects deleted once over {summary['shards']} shards"),
+        check(summary.get("bucket_deleted") and not bucket_exists(s3, bucket), "emptied bucket deleted"),
+    ]
+
+    bucket = f"cleanup-check-{uuid.uuid4().hex[:8]}"
+    seeded = seed_bucket(s3, bucket, keys, args.workers, versioned=True)
+    summary = clean_bucket(s3, bucket, depth=2, workers=args.workers, report_interval=0)
+    print(f"s3 versioned: {json.dumps(summary)}")
+    results += [
+        check(summary["versioned"] and summary["deleted"] == seeded,
+              f"{summary['deleted']} of {seeded} versions and delete markers deleted"),
+        check(not bucket_exists(s3, bucket), "versioned bucket deleted"),
+    ]
+
+    bucket = f"cleanup-check-{uuid.uuid4().hex[:8]}"
+    seed_bucket(s3, bucket, keys, args.workers)
+    under = sum(1 for key in keys if key.startswith("2021/03/01/"))
+    summary = clean_bucket(s3, bucket, prefix="2021/03/01/", depth=1, workers=args.workers, report_interval=0)
+    left = sum(page.get("KeyCount", 0) for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket))
+    results += [
+        check(summary["deleted"] == under and left == len(keys) - under,
+              f"prefix clean deleted {summary['deleted']} of {under} and kept the other {left}"),
+        check(bucket_exists(s3, bucket), "prefix clean keeps the bucket"),
+    ]
+    clean_bucket(s3, bucket, workers=args.workers, report_interval=0)
+
+    ecr = make_client("ecr", args)
+    repo_name = f"cleanup-check-{uuid.uuid4().hex[:8]}"
+    images = seed_repository(ecr, repo_name, args.images, tags_per_image=2)
+    summary = clean_repository(ecr, repo_name, workers=args.workers, report_interval=0)
+    print(f"ecr: {json.dumps(summary)}")
+    repositories = {r["repositoryName"] for r in ecr.describe_repositories()["repositories"]}
+    results += [
+        check(summary["listed"] == summary["deleted"] == images,
+              f"{summary['deleted']} of {images} images deleted by digest with every tag"),
+        check(summary.get("repository_deleted") and repo_name not in repositories, "emptied repository deleted"),
+    ]
+
+    raise SystemExit(0 if all(results) else 1)
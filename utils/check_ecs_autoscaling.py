@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aws_cdk import core  # noqa: E402
+
+from ecs_elk.ecs_stack import AUTOSCALING_DEFAULTS, CAPACITY_PROVIDER_DEFAULTS, ECSStack  # noqa: E402
+from ecs_elk.network_stack import NetworkStack  # noqa: E402
+from check_index_lifecycle import check  # noqa: E402
+
+
+ENV = {"account": "123456789012", "region": "ap-northeast-2"}
+
+
+def synth_ecs(**options):
+    """Synthesize the ECS stack and return its template and the shared security group ID."""
+    app = core.App()
+    # lookups fall back to dummy values without a cdk.context.json
+    network = NetworkStack(app, "Network", vpc_id="vpc-check", security_group_id="sg-check", env=ENV)
+    stack = ECSStack(
+        app,
+        "ECSStack",
+        region=ENV["region"],
+        vpc=network.vpc,
+        security_group=network.security_group,
+        env=ENV,
+        **options
+    )
+    assembly = app.synth()
+    return (assembly.get_stack_by_name(stack.stack_name).template,
+            assembly.get_stack_by_name(network.stack_name).template,
+            network.security_group.security_group_id)
+
+
+def resources(template, resource_type):
+    return [resource["Properties"] for resource in template.get("Resources", {}).values()
+            if resource["Type"] == resource_type]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Synthesize the ECS stack and check the nginx service's scalable target, "
+                    "scaling policies and the ALB's security groups"
+    )
+    parser.add_argument("--print", action="store_true", help="also print the scaling resources")
+    args = parser.parse_args()
+
+    template, network_template, shared_sg_id = synth_ecs()
+
+    targets = resources(template, "AWS::ApplicationAutoScaling::ScalableTarget")
+    policies = resources(template, "AWS::ApplicationAutoScaling::ScalingPolicy")
+    if args.print:
+        print(json.dumps({"targets": targets, "policies": policies}, indent=2, default=str))
+
+    tracked = {
+        policy["TargetTrackingScalingPolicyConfiguration"]["PredefinedMetricSpecification"]["PredefinedMetricType"]:
+            policy["TargetTrackingScalingPolicyConfiguration"]["TargetValue"]
+        for policy in policies if policy["PolicyType"] == "TargetTrackingScaling"
+    }
+    steps = [policy for policy in policies if policy["PolicyType"] == "StepScaling"]
+
+    results = [
+        check(len(targets) == 1 and targets[0]["ScalableDimension"] == "ecs:service:DesiredCount",
+              "one scalable target on the service's desired count"),
+        check(targets and (targets[0]["MinCapacity"], targets[0]["MaxCapacity"])
+              == (AUTOSCALING_DEFAULTS["min_capacity"], AUTOSCALING_DEFAULTS["max_capacity"]),
+              f"scales between {AUTOSCALING_DEFAULTS['min_capacity']} and {AUTOSCALING_DEFAULTS['max_capacity']} tasks"),
+        check(tracked.get("ECSServiceAverageCPUUtilization") == AUTOSCALING_DEFAULTS["cpu_target"],
+              f"CPU tracked at {AUTOSCALING_DEFAULTS['cpu_target']}%"),
+        check(tracked.get("ECSServiceAverageMemoryUtilization") == AUTOSCALING_DEFAULTS["memory_target"],
+              f"memory tracked at {AUTOSCALING_DEFAULTS['memory_target']}%"),
+        check(tracked.get("ALBRequestCountPerTarget") == AUTOSCALING_DEFAULTS["requests_per_target"],
+              f"ALB requests tracked at {AUTOSCALING_DEFAULTS['requests_per_target']} per target"),
+        check(len(steps) >= 1, "CPU step scaling on top of target tracking"),
+    ]
+
+    without_steps, _, _ = synth_ecs(autoscaling={"cpu_steps": []})
+    results.append(check(not [policy for policy in resources(without_steps, "AWS::ApplicationAutoScaling::ScalingPolicy")
+                              if policy["PolicyType"] == "StepScaling"],
+                         "no step scaling without cpu_steps"))
+
+    try:
+        synth_ecs(autoscaling={"min_capacity": 5, "max_capacity": 2})
+        results.append(check(False, "min_capacity above max_capacity is rejected"))
+    except ValueError:
+        results.append(check(True, "min_capacity above max_capacity is rejected"))
+
+    spot, _, _ = synth_ecs(capacity_providers=CAPACITY_PROVIDER_DEFAULTS)
+    clusters = resources(spot, "AWS::ECS::Cluster")
+    services = resources(spot, "AWS::ECS::Service")
+    strategy = {provider["CapacityProvider"]: provider for provider in services[0].get("CapacityProviderStrategy", [])}
+    results += [
+        check(clusters[0].get("CapacityProviders") == ["FARGATE", "FARGATE_SPOT"],
+              "cluster uses the FARGATE and FARGATE_SPOT providers"),
+        check("LaunchType" not in services[0], "service drops its launch type for the strategy"),
+        check(strategy.get("FARGATE", {}).get("Base") == CAPACITY_PROVIDER_DEFAULTS["base"]
+              and strategy.get("FARGATE_SPOT", {}).get("Weight") == CAPACITY_PROVIDER_DEFAULTS["spot_weight"],
+              f"{CAPACITY_PROVIDER_DEFAULTS['base']} base task on FARGATE, "
+              f"spot weighted {CAPACITY_PROVIDER_DEFAULTS['spot_weight']}:{CAPACITY_PROVIDER_DEFAULTS['on_demand_weight']}"),
+    ]
+
+    # the public listener must not open the shared group the domain and the other stacks use
+    groups = resources(template, "AWS::EC2::SecurityGroup")
+    public = [group for group in groups
+              if any(rule.get("CidrIp") == "0.0.0.0/0" for rule in group.get("SecurityGroupIngress", []))]
+    shared_rules = [rule for stack_template in (template, network_template)
+                    for rule in resources(stack_template, "AWS::EC2::SecurityGroupIngress")
+                    if rule["GroupId"] == shared_sg_id]
+    results += [
+        check(len(public) == 1 and "ALB" in public[0]["GroupDescription"],
+              "only the ALB's own group takes 0.0.0.0/0"),
+        check(not shared_rules, f"{len(shared_rules)} ingress rules added to the shared security group"),
+    ]
+
+    raise SystemExit(0 if all(results) else 1)
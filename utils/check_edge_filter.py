@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ecs_elk.firelens import filter_settings, router_environment  # noqa: E402
+from bench_firelens_modes import free_port, start_fluent_bit, wait_for_port  # noqa: E402
+from check_index_lifecycle import check  # noqa: E402
+
+
+FILTER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "resources", "fluent-bit", "edge_filter.lua"
+)
+
+# path, status, user agent and share of the fixture, roughly what an nginx behind an ALB emits
+FIXTURE_MIX = [
+    ("/", 200, "ELB-HealthChecker/2.0", 0.20),
+    ("/health", 200, "kube-probe/1.18", 0.10),
+    ("/static/app.{}.js", 200, "Mozilla/5.0", 0.25),
+    ("/api/orders/{}", 200, "Mozilla/5.0", 0.25),
+    ("/api/orders/{}", 304, "Mozilla/5.0", 0.05),
+    ("/api/users/{}/profile", 404, "Mozilla/5.0", 0.06),
+    ("/api/orders/{}", 500, "Mozilla/5.0", 0.04),
+    (None, None, None, 0.05),
+]
+
+
+def generate_fixture(size, seed):
+    rng = random.Random(seed)
+    paths, weights = zip(*[((p, s, a), w) for p, s, a, w in FIXTURE_MIX])
+    ts = datetime.now(timezone.utc).strftime("%d/%b/%Y:%H:%M:%S %z")
+    lines = []
+    for _ in range(size):
+        path, status, user_agent = rng.choices(paths, weights)[0]
+        if path is None:
+            lines.append("\\x16\\x03\\x01 garbage")
+            continue
+        lines.append(f'10.0.1.{rng.randint(1, 254)} - - [{ts}] "GET {path.format(rng.randint(1, 5000))} HTTP/1.1" '
+                     f'{status} {rng.randint(0, 50000)} "-" "{user_agent}" 0.012')
+    return lines
+
+
+def classify(line):
+    """Path and status class the way the Lua filter reads them, None for unparsed lines."""
+    parts = line.split('"')
+    if len(parts) < 3 or not parts[2].strip()[:3].isdigit():
+        return None, None
+    return parts[1].split(" ")[1], parts[2].strip()[0] + "xx"
+
+
+def bucket(line, filters):
+    path, status_class = classify(line)
+    if path is None:
+        return "unparsed"
+    parts = line.split('"')
+    user_agent = parts[5] if len(parts) > 5 else ""
+    if any(path.startswith(p) for p in filters["drop_paths"]) or \
+            any(user_agent.startswith(a) for a in filters["drop_user_agents"]):
+        return "dropped"
+    return status_class
+
+
+class CollectingSink(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, CollectingHandler)
+        self.lock = threading.Lock()
+        self.records = []
+
+
+class CollectingHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.records.extend(json.loads(body))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def render_config(script_path, input_port, sink_port):
+    return f"""[SERVICE]
+    Flush     1
+    Log_Level warn
+
+[INPUT]
+    Name   tcp
+    Listen 127.0.0.1
+    Port   {input_port}
+    Format json
+
+[FILTER]
+    Name   lua
+    Match  *
+    script {script_path}
+    call   edge_filter
+
+[OUTPUT]
+    Name   http
+    Match  *
+    Host   127.0.0.1
+    Port   {sink_port}
+    URI    /filtered
+    Format json
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Feed a log fixture through the router's edge filter and check the kept and dropped ratios"
+    )
+    parser.add_argument("--fixture", help="nginx access log to replay instead of the generated mix")
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--sample-2xx", type=float, default=0.1)
+    parser.add_argument("--sample-4xx", type=float, default=0.5)
+    parser.add_argument("--rate-limit", type=int, default=0, help="per task lines per second, 0 for no cap")
+    parser.add_argument("--send-rate", type=int, default=0,
+                        help="lines per second to replay at, 0 for as fast as possible; "
+                             "defaults to four times the rate limit when one is set")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="allowed error of a kept share")
+    parser.add_argument("--fluent-bit", help="local fluent-bit binary; defaults to running the image in docker")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    filters = filter_settings({
+        "enabled": True,
+        "sample": {"2xx": args.sample_2xx, "4xx": args.sample_4xx},
+        "rate_limit": args.rate_limit,
+    })
+    environment = {k: v for k, v in router_environment("cloudwatch", None, filters).items()
+                   if k.startswith("FLB_FILTER_")}
+
+    if args.fixture:
+        with open(args.fixture) as fp:
+            lines = [line.rstrip("\n") for line in fp if line.strip()]
+    else:
+        lines = generate_fixture(args.records, args.seed)
+
+    sink = CollectingSink(("127.0.0.1", free_port()))
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    input_port = free_port()
+    with tempfile.TemporaryDirectory() as config_dir:
+        shutil.copy(FILTER_SCRIPT, os.path.join(config_dir, "edge_filter.lua"))
+        script_path = os.path.join(config_dir if args.fluent_bit else "/bench", "edge_filter.lua")
+        with open(os.path.join(config_dir, "fluent-bit.conf"), "w") as fp:
+            fp.write(render_config(script_path, input_port, sink.server_address[1]))
+
+        fluent_bit = start_fluent_bit(config_dir, args.fluent_bit, environment=environment)
+        try:
+            conn = wait_for_port(input_port)
+            send_rate = args.send_rate or args.rate_limit * 4
+            started = time.monotonic()
+            with conn:
+                for seq, line in enumerate(lines):
+                    if send_rate and seq % 100 == 0:
+                        time.sleep(max(0.0, started + seq / send_rate - time.monotonic()))
+                    conn.sendall(json.dumps({"seq": seq, "log": line}).encode("utf-8") + b"\n")
+
+            # sampling leaves no exact count to wait for, wait for the sink to go quiet
+            last_count, idle_deadline = -1, time.monotonic() + args.drain_timeout
+            while time.monotonic() < idle_deadline:
+                if len(sink.records) != last_count:
+                    last_count = len(sink.records)
+                    idle_deadline = time.monotonic() + 3
+                time.sleep(0.5)
+        finally:
+            fluent_bit.terminate()
+            fluent_bit.wait()
+            sink.shutdown()
+
+    sent = Counter(bucket(line, filters) for line in lines)
+    kept = Counter()
+    scaled = Counter()
+    for record in sink.records:
+        key = bucket(lines[record["seq"]], filters)
+        kept[key] += 1
+        scaled[key] += record.get("sample_rate", 1)
+
+    total_kept = sum(kept.values())
+    print(f"{len(lines)} lines sent, {total_kept} kept ({total_kept / len(lines):.1%})")
+    results = [
+        check(kept["dropped"] == 0, f"{sent['dropped']} health check lines all dropped"),
+        check(kept["unparsed"] == sent["unparsed"], f"{kept['unparsed']} of {sent['unparsed']} unparsed lines kept"),
+        check(kept["5xx"] == sent["5xx"], f"{kept['5xx']} of {sent['5xx']} 5xx lines kept"),
+    ]
+    if not args.rate_limit:
+        for status_class, ratio in filters["sample"].items():
+            if not sent[status_class]:
+                continue
+            share = kept[status_class] / sent[status_class]
+            results.append(check(abs(share - ratio) <= args.tolerance,
+                                 f"{status_class}: kept {share:.3f}, configured {ratio}"))
+            results.append(check(abs(scaled[status_class] - sent[status_class]) <= sent[status_class] * args.tolerance * 5,
+                                 f"{status_class}: sample_rate re-scales {kept[status_class]} kept lines to "
+                                 f"{scaled[status_class]:.0f} of {sent[status_class]}"))
+    else:
+        per_second = Counter(int(record["date"]) for record in sink.records
+                             if classify(lines[record["seq"]])[1] not in (None, "5xx"))
+        busiest = max(per_second.values(), default=0)
+        results.append(check(busiest <= args.rate_limit,
+                             f"busiest second shipped {busiest} capped lines, limit {args.rate_limit}"))
+        # the cap's share lags a second behind, allow one second of traffic on top
+        capped_sent = sum(sent[c] for c in filters["sample"] if c != "5xx")
+        capped_scaled = sum(scaled[c] for c in filters["sample"] if c != "5xx")
+        slack = capped_sent * args.tolerance * 5 + send_rate
+        results.append(check(abs(capped_scaled - capped_sent) <= slack,
+                             f"sample_rate re-scales {sum(per_second.values())} capped lines to "
+                             f"{capped_scaled:.0f} of {capped_sent}"))
+
+    raise SystemExit(0 if all(results) else 1)
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from botocore.credentials import Credentials  # noqa: E402
+
+from check_index_lifecycle import check  # noqa: E402
+from check_index_rollups import bulk_index  # noqa: E402
+from check_index_mappings import sample_documents  # noqa: E402
+from ecs_elk.index_mappings import render_nginx_mappings  # noqa: E402
+from es_query_client import (  # noqa: E402
+    CognitoCredentials, ESClient, NDJSONWriter, ParquetWriter, export, index_properties,
+)
+
+
+class StubCognitoCredentials(CognitoCredentials):
+    """Short-lived static credentials in place of the identity pool calls."""
+
+    def __init__(self, ttl, refresh_margin):
+        super().__init__("us-east-1", "stub-pool", "stub-client", "stub-identity-pool",
+                         "analyst", "unused", refresh_margin=refresh_margin)
+        self.ttl = ttl
+
+    def _fetch(self):
+        # slow like the two Cognito round trips, so concurrent callers would pile in
+        time.sleep(0.2)
+        return Credentials("AKIDSTUB", "stub-secret", f"token-{self.fetches}"), time.time() + self.ttl
+
+
+def opened_connections(client):
+    status, stats = client.request("GET", "/_nodes/stats/http")
+    return sum(node["http"]["total_opened"] for node in stats["nodes"].values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export sample documents from a local Elasticsearch with sliced scrolls, signed with "
+                    "stubbed identity pool credentials, and check every document comes out once over "
+                    "kept-alive connections. Run e.g. docker run -p 9200:9200 -e discovery.type=single-node "
+                    "-e opendistro_security.disabled=true amazon/opendistro-for-elasticsearch:1.13.2"
+    )
+    parser.add_argument("--endpoint", default="http://localhost:9200")
+    parser.add_argument("--index-name", default="exportcheck")
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    credentials = StubCognitoCredentials(ttl=2.0, refresh_margin=1.0)
+    threads = [threading.Thread(target=credentials.get) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results = [check(credentials.fetches == 1, f"16 concurrent callers fetched credentials {credentials.fetches} time")]
+
+    # the local cluster ignores the signature, the client still signs every request
+    client = ESClient(args.endpoint, "us-east-1", credentials)
+    client.request("DELETE", f"/{args.index_name}")
+    mappings = render_nginx_mappings(strict=False)
+    mappings["properties"]["seq"] = {"type": "long"}
+    client.request("PUT", f"/{args.index_name}",
+                   {"settings": {"number_of_shards": args.shards, "number_of_replicas": 0},
+                    "mappings": mappings})
+
+    docs = []
+    while len(docs) < args.documents:
+        docs.extend(sample_documents(min(5000, args.documents - len(docs))))
+    docs = docs[:args.documents]
+    for n, doc in enumerate(docs):
+        doc["seq"] = n
+        # empty in the first row groups, the Parquet schema still has to type it
+        if n >= len(docs) // 2:
+            doc["sample_rate"] = 10.0
+    for start in range(0, len(docs), 5000):
+        bulk_index(args.endpoint, args.index_name, docs[start:start + 5000])
+
+    before = opened_connections(client)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "export.ndjson")
+        with open(path, "w") as fp:
+            summary = export(client, args.index_name, NDJSONWriter(fp), slices=args.shards,
+                             page_size=args.page_size, report_interval=0)
+        with open(path) as fp:
+            seqs = [json.loads(line)["seq"] for line in fp]
+        print(f"ndjson: {json.dumps(summary)}")
+        opened = opened_connections(client) - before
+
+        results += [
+            check(len(seqs) == args.documents, f"{len(seqs)} of {args.documents} documents exported"),
+            check(len(set(seqs)) == len(seqs), "no document exported twice"),
+            check(opened <= args.shards + 1,
+                  f"{opened} connections opened for {args.documents // args.page_size} pages"),
+            check(credentials.fetches > 1 or summary["seconds"] < credentials.ttl,
+                  f"credentials renewed {credentials.fetches - 1} times as they neared expiry"),
+        ]
+
+        with open(path, "w") as fp:
+            limited = export(client, args.index_name, NDJSONWriter(fp), slices=args.shards,
+                             page_size=args.page_size, max_docs=1234, report_interval=0)
+        with open(path) as fp:
+            results.append(check(sum(1 for _ in fp) == limited["documents"] == 1234,
+                                 "max_docs stops the export at the limit"))
+
+        status, contexts = client.request("GET", "/_nodes/stats/indices/search")
+        open_contexts = sum(node["indices"]["search"]["open_contexts"] for node in contexts["nodes"].values())
+        results.append(check(open_contexts == 0, f"{open_contexts} scroll contexts left open"))
+
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            print("skip\tParquet export, pyarrow is not installed")
+        else:
+            path = os.path.join(workdir, "export.parquet")
+            fields = ["seq", "status", "request", "sample_rate"]
+            writer = ParquetWriter(path, index_properties(client, args.index_name), metadata=True,
+                                   fields=fields, row_group_size=500)
+            export(client, args.index_name, writer, fields=fields, slices=args.shards,
+                   page_size=args.page_size, report_interval=0)
+            table = pyarrow.parquet.read_table(path)
+            sampled = len(docs) - len(docs) // 2
+            results += [
+                check(table.num_rows == args.documents, f"{table.num_rows} Parquet rows"),
+                check({"seq", "_id", "_index"} <= set(table.column_names), "Parquet columns include metadata"),
+                check(str(table.schema.field("sample_rate").type) == "float"
+                      and len(table) - table.column("sample_rate").null_count == sampled,
+                      f"sample_rate typed from the mapping and set on {sampled} rows"),
+            ]
+
+    client.request("DELETE", f"/{args.index_name}")
+    raise SystemExit(0 if all(results) else 1)
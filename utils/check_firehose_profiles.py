@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aws_cdk import core  # noqa: E402
+
+from ecs_elk.firehose_profiles import THROUGHPUT_PROFILES  # noqa: E402
+from ecs_elk.firehose_stack import KinesisFirehoseStack  # noqa: E402
+from ecs_elk.network_stack import NetworkStack  # noqa: E402
+from check_index_lifecycle import check  # noqa: E402
+
+
+ENV = {"account": "123456789012", "region": "ap-northeast-2"}
+
+
+def synth_delivery_stream(profile, **options):
+    """Synthesize the Firehose stack with a profile and return its delivery stream properties."""
+    app = core.App()
+    # lookups fall back to dummy values without a cdk.context.json
+    network = NetworkStack(app, "Network", vpc_id="vpc-check", security_group_id="sg-check", env=ENV)
+    stack = KinesisFirehoseStack(
+        app,
+        "KinesisFirehoseStack",
+        region=ENV["region"],
+        account=ENV["account"],
+        es_domain_name="check-domain",
+        es_index_name="nginx",
+        es_type_name="_doc",
+        throughput_profile=profile,
+        vpc=network.vpc,
+        security_group=network.security_group,
+        env=ENV,
+        **options
+    )
+    template = app.synth().get_stack_by_name(stack.stack_name).template
+    streams = [resource["Properties"] for resource in template["Resources"].values()
+               if resource["Type"] == "AWS::KinesisFirehose::DeliveryStream"]
+    return streams[0]
+
+
+def check_profile(name, settings):
+    es = synth_delivery_stream(name)["ElasticsearchDestinationConfiguration"]
+    s3 = es["S3Configuration"]
+    return [
+        check(es["BufferingHints"] == {"SizeInMBs": settings["es_buffer_size"],
+                                       "IntervalInSeconds": settings["es_buffer_interval"]},
+              f"{name}: ES buffering {settings['es_buffer_size']} MiB / {settings['es_buffer_interval']}s"),
+        check(es["RetryOptions"] == {"DurationInSeconds": settings["retry_duration"]},
+              f"{name}: ES retries for {settings['retry_duration']}s"),
+        check(es["S3BackupMode"] == settings["s3_backup_mode"], f"{name}: {settings['s3_backup_mode']} backed up"),
+        check(s3["BufferingHints"] == {"SizeInMBs": settings["s3_buffer_size"],
+                                       "IntervalInSeconds": settings["s3_buffer_interval"]},
+              f"{name}: S3 buffering {settings['s3_buffer_size']} MiB / {settings['s3_buffer_interval']}s"),
+        check(s3["CompressionFormat"] == settings["s3_compression_format"],
+              f"{name}: backups compressed with {settings['s3_compression_format']}"),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Synthesize the Firehose stack with every throughput profile and check the "
+                    "buffering, retry and compression settings that reach the delivery stream"
+    )
+    parser.add_argument("--print", action="store_true", help="only print the rendered profiles")
+    args = parser.parse_args()
+
+    if args.print:
+        print(json.dumps(THROUGHPUT_PROFILES, indent=2))
+        raise SystemExit(0)
+
+    results = []
+    for name, settings in THROUGHPUT_PROFILES.items():
+        results += check_profile(name, settings)
+
+    overridden = synth_delivery_stream("low-latency", s3_backup_mode="AllDocuments")
+    results.append(check(overridden["ElasticsearchDestinationConfiguration"]["S3BackupMode"] == "AllDocuments",
+                         "s3_backup_mode overrides the profile's backup mode"))
+
+    try:
+        synth_delivery_stream("unknown")
+        results.append(check(False, "an unknown profile is rejected"))
+    except ValueError:
+        results.append(check(True, "an unknown profile is rejected"))
+
+    raise SystemExit(0 if all(results) else 1)
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ecs_elk.index_lifecycle import ISM_POLICY_PATH, render_bootstrap_requests  # noqa: E402
+from es_client import load_bootstrap  # noqa: E402
+
+
+def check(condition, message):
+    print(f"{'ok' if condition else 'FAIL'}\t{message}")
+    return condition
+
+
+def check_alias(send, alias, policy_id):
+    """Write through the alias, roll it over and check the new index is managed against it."""
+    results = []
+    status, aliases = send("GET", f"/_alias/{alias}")
+    write_indices = [index for index, body in (aliases or {}).items()
+                     if body["aliases"][alias].get("is_write_index")] if status == 200 else []
+    results.append(check(len(write_indices) == 1, f"alias {alias} has one write index {write_indices}"))
+
+    status, _ = send("POST", f"/{alias}/_doc?refresh=true", {"message": "lifecycle check"})
+    results.append(check(status == 201, f"documents can be written through {alias}"))
+
+    status, rollover = send("POST", f"/{alias}/_rollover", {"conditions": {"max_docs": 1}})
+    new_index = rollover.get("new_index") if status == 200 else None
+    results.append(check(bool(rollover and rollover.get("rolled_over")), f"{alias} rolls over to {new_index}"))
+
+    if new_index:
+        status, settings = send("GET", f"/{new_index}/_settings")
+        index_settings = settings[new_index]["settings"]["index"] if status == 200 else {}
+        managed = index_settings.get("opendistro", {}).get("index_state_management", {})
+        results.append(check(managed.get("policy_id") == policy_id,
+                             f"template attaches {policy_id} to {new_index}"))
+        # the ISM rollover action fails on an index that is not its alias's write index
+        results.append(check(managed.get("rollover_alias") == alias,
+                             f"template sets rollover alias {alias} on {new_index}"))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Install the rollover lifecycle on a local Elasticsearch and verify it. "
+                    "Run an ISM-enabled image, e.g. "
+                    "docker run -p 9200:9200 -e discovery.type=single-node "
+                    "-e opendistro_security.disabled=true amazon/opendistro-for-elasticsearch:1.8.0"
+    )
+    parser.add_argument("--endpoint", default="http://localhost:9200")
+    parser.add_argument("--index-name", default=os.environ.get("ES_INDEX_NAME", "nginx"))
+    parser.add_argument("--services", nargs="*", default=["nginx-test"],
+                        help="services the es output routes to their own aliases")
+    parser.add_argument("--print", action="store_true", help="only print the rendered requests")
+    args = parser.parse_args()
+
+    requests = render_bootstrap_requests(args.index_name, services=args.services)
+    if args.print:
+        print(json.dumps(requests, indent=2))
+        raise SystemExit(0)
+
+    bootstrap = load_bootstrap()
+    send = bootstrap.make_sender(args.endpoint)
+
+    # apply twice, the custom resource must be safe to re-run on stack updates
+    for _ in range(2):
+        for request in requests:
+            print(f"{request['method']} {request['path']}: {bootstrap.apply_request(send, request)}")
+
+    alias = args.index_name
+    policy_id = f"{alias}-rollover"
+    results = []
+
+    status, _ = send("GET", f"{ISM_POLICY_PATH}/{policy_id}")
+    results.append(check(status == 200, f"ISM policy {policy_id} installed"))
+
+    for checked in [alias] + [f"{alias}-{service}" for service in args.services]:
+        results += check_alias(send, checked, policy_id)
+
+    raise SystemExit(0 if all(results) else 1)
@@ -0,0 +1,86 @@
+import argparse
+import base64
+import json
+import os
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ecs_elk.index_mappings import render_nginx_mappings, render_template_requests  # noqa: E402
+from ecs_elk.slow_logs import SLOW_LOG_THRESHOLDS  # noqa: E402
+from bench_firehose_processor import generate_batch, load_handler as load_processor  # noqa: E402
+from check_index_lifecycle import check  # noqa: E402
+from es_client import load_bootstrap  # noqa: E402
+
+
+def sample_documents(count):
+    processor = load_processor()
+    output = processor.handler(generate_batch(count, failure_ratio=0.1), None)
+    docs = [json.loads(base64.b64decode(record["data"]))
+            for record in output["records"] if record["result"] == "Ok"]
+
+    # raw FireLens envelope, as delivered when the processor is disabled
+    docs.append({
+        "log": '10.0.0.1 - - [10/Oct/2020:13:55:36 +0000] "GET / HTTP/1.1" 200 612 "-" "curl/7.64.1"',
+        "container_name": "nginx-test",
+        "source": "stdout",
+    })
+    return docs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Index sample nginx documents into a local Elasticsearch and check the mapped field types. "
+                    "Run e.g. docker run -p 9200:9200 -e discovery.type=single-node "
+                    "docker.elastic.co/elasticsearch/elasticsearch:7.9.3"
+    )
+    parser.add_argument("--endpoint", default="http://localhost:9200")
+    parser.add_argument("--index-name", default="mappingcheck")
+    parser.add_argument("--documents", type=int, default=500)
+    args = parser.parse_args()
+
+    bootstrap = load_bootstrap()
+    send = bootstrap.make_sender(args.endpoint)
+    index = f"{args.index_name}-000001"
+
+    send("DELETE", f"/{index}")
+    for request in render_template_requests(args.index_name):
+        bootstrap.apply_request(send, request)
+
+    bulk = []
+    for doc in sample_documents(args.documents):
+        bulk.append(json.dumps({"index": {"_index": index}}))
+        bulk.append(json.dumps(doc))
+    request = urllib.request.Request(
+        f"{args.endpoint}/_bulk?refresh=true",
+        data=("\n".join(bulk) + "\n").encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request) as response:
+        result = json.loads(response.read())
+
+    results = [check(not result["errors"], f"{len(bulk) // 2} sample documents indexed without errors")]
+
+    status, mapping = send("GET", f"/{index}/_mapping")
+    actual = mapping[index]["mappings"]["properties"]
+    for field, expected in render_nginx_mappings()["properties"].items():
+        if field in actual:
+            results.append(check(actual[field]["type"] == expected["type"],
+                                 f"{field} mapped as {actual[field]['type']}"))
+    results.append(check(not set(actual) - set(render_nginx_mappings()["properties"]),
+                         "no dynamically added fields"))
+
+    status, _ = send("POST", f"/{index}/_doc", {"unexpected_field": "x"})
+    results.append(check(status == 400, "unknown fields are rejected by the strict mapping"))
+
+    status, settings = send("GET", f"/{index}/_settings")
+    index_settings = settings[index]["settings"]["index"]
+    results.append(check(index_settings.get("codec") == "best_compression", "best_compression codec"))
+    status, flat = send("GET", f"/{index}/_settings?flat_settings=true")
+    results.append(check(all(flat[index]["settings"].get(key) == value for key, value in SLOW_LOG_THRESHOLDS.items()),
+                         "slow log thresholds set, so the slow log metric filters see entries"))
+
+    send("DELETE", f"/{index}")
+    raise SystemExit(0 if all(results) else 1)
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ecs_elk.index_mappings import render_template_requests  # noqa: E402
+from ecs_elk.index_rollups import (  # noqa: E402
+    KIBANA_INDEX_PATTERN_PATH, ROLLUP_JOB_PATH, render_rollup_requests, rollup_index,
+)
+from check_index_lifecycle import check  # noqa: E402
+from es_client import load_bootstrap  # noqa: E402
+from check_index_mappings import sample_documents  # noqa: E402
+
+
+SERVICES = ["nginx-test", "orders", "users"]
+
+
+def bulk_index(endpoint, index, docs):
+    lines = []
+    for doc in docs:
+        lines.append(json.dumps({"index": {"_index": index}}))
+        lines.append(json.dumps(doc))
+    request = urllib.request.Request(
+        f"{endpoint}/_bulk?refresh=true",
+        data=("\n".join(lines) + "\n").encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request) as response:
+        return not json.loads(response.read())["errors"]
+
+
+def summary(send, index):
+    """Doc count, re-scaled line count and request time sum per service and status."""
+    status, response = send("POST", f"/{index}/_search", {
+        "size": 0,
+        "aggs": {
+            "service": {
+                "terms": {"field": "service", "size": 100},
+                "aggs": {
+                    "status": {
+                        "terms": {"field": "status", "size": 100},
+                        "aggs": {
+                            "lines": {"sum": {"field": "sample_rate"}},
+                            "request_time": {"sum": {"field": "request_time"}},
+                        }
+                    }
+                }
+            }
+        }
+    })
+    if status != 200:
+        return {}
+    return {
+        (service["key"], code["key"]): (code["doc_count"], round(code["lines"]["value"], 3),
+                                        round(code["request_time"]["value"], 3))
+        for service in response["aggregations"]["service"]["buckets"]
+        for code in service["status"]["buckets"]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Install the rollup jobs on a local Elasticsearch with index rollups, index sample "
+                    "documents and check the summaries match the raw aggregations. Run e.g. "
+                    "docker run -p 9200:9200 -e discovery.type=single-node "
+                    "-e opendistro_security.disabled=true amazon/opendistro-for-elasticsearch:1.13.2"
+    )
+    parser.add_argument("--endpoint", default="http://localhost:9200")
+    parser.add_argument("--index-name", default="rollupcheck")
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--print", action="store_true", help="only print the rendered requests")
+    args = parser.parse_args()
+
+    requests = render_rollup_requests(args.index_name)
+    if args.print:
+        print(json.dumps(requests, indent=2))
+        raise SystemExit(0)
+
+    bootstrap = load_bootstrap()
+    send = bootstrap.make_sender(args.endpoint)
+    raw_index = f"{args.index_name}-000001"
+    job_ids = [rollup_index(args.index_name, interval) for interval in ("1m", "1h")]
+
+    for job_id in job_ids:
+        send("DELETE", f"{ROLLUP_JOB_PATH}/{job_id}")
+        send("DELETE", f"/{job_id}")
+    send("DELETE", f"/{raw_index}")
+    for request in render_template_requests(args.index_name):
+        bootstrap.apply_request(send, request)
+
+    # complete hours in the past, so every bucket is closed when the jobs run
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+    docs = []
+    for n, doc in enumerate(sample_documents(args.documents)):
+        doc["@timestamp"] = (start + timedelta(seconds=n * 7200 / args.documents)).isoformat()
+        doc["service"] = random.choice(SERVICES)
+        doc["sample_rate"] = random.choice([1.0, 1.0, 10.0])
+        docs.append(doc)
+    results = [check(bulk_index(args.endpoint, raw_index, docs), f"{len(docs)} raw documents indexed")]
+
+    # the deployed schedule and delay would keep a local check waiting for hours
+    for request in requests:
+        if request["path"].startswith(KIBANA_INDEX_PATTERN_PATH):
+            continue
+        request["body"]["rollup"]["schedule"]["interval"].update({"period": 1, "unit": "Minutes"})
+        request["body"]["rollup"]["delay"] = 0
+        # apply twice, the custom resource must be safe to re-run on stack updates
+        for _ in range(2):
+            print(f"{request['method']} {request['path']}: {bootstrap.apply_request(send, request)}")
+
+    expected = summary(send, raw_index)
+    deadline = time.monotonic() + args.timeout
+    for job_id in job_ids:
+        rolled = {}
+        while time.monotonic() < deadline:
+            send("POST", f"/{job_id}/_refresh")
+            rolled = summary(send, job_id)
+            if rolled == expected:
+                break
+            time.sleep(5)
+        status, stats = send("GET", f"/{job_id}/_count")
+        summaries = stats.get("count", 0) if status == 200 else 0
+        results.append(check(rolled == expected,
+                             f"{job_id}: {summaries} summary documents match the raw aggregations"))
+        results.append(check(0 < summaries < len(docs), f"{job_id}: smaller than the raw index"))
+
+    raise SystemExit(0 if all(results) else 1)
@@ -0,0 +1,103 @@
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# the processor reads its output format at import time
+os.environ["OUTPUT_FORMAT"] = "archive"
+
+from ecs_elk.log_archive import (  # noqa: E402
+    PARTITION_KEYS, TIMESTAMP_COLUMN, archive_prefix, render_glue_columns,
+)
+from bench_firehose_processor import generate_batch, load_handler as load_processor  # noqa: E402
+from check_index_lifecycle import check  # noqa: E402
+
+
+PARTITION_PLACEHOLDER_RE = re.compile(r"!\{partitionKeyFromLambda:(\w+)\}")
+
+
+def arrow_type(glue_type):
+    import pyarrow as pa
+
+    if glue_type.startswith("array<"):
+        return pa.list_(arrow_type(glue_type[len("array<"):-1]))
+    return {
+        "timestamp": pa.timestamp("ms"),
+        "string": pa.string(),
+        "smallint": pa.int16(),
+        "bigint": pa.int64(),
+        "float": pa.float32(),
+        "boolean": pa.bool_(),
+    }[glue_type]
+
+
+def render_partition_path(partition_keys):
+    return PARTITION_PLACEHOLDER_RE.sub(lambda m: partition_keys[m.group(1)], archive_prefix())
+
+
+def convert_batch(output, root):
+    """Writes processor output the way Firehose would: one Parquet file per partition prefix."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c["name"], arrow_type(c["type"])) for c in render_glue_columns()])
+    partitions = defaultdict(list)
+    for record in output["records"]:
+        if record["result"] != "Ok":
+            continue
+        doc = json.loads(base64.b64decode(record["data"]))
+        doc[TIMESTAMP_COLUMN] = datetime.strptime(doc[TIMESTAMP_COLUMN], "%Y-%m-%d %H:%M:%S.%f")
+        prefix = render_partition_path(record["metadata"]["partitionKeys"])
+        partitions[prefix].append({c: doc.get(c) for c in schema.names})
+
+    for prefix, rows in partitions.items():
+        os.makedirs(os.path.join(root, prefix), exist_ok=True)
+        table = pa.Table.from_pylist(rows, schema=schema)
+        pq.write_table(table, os.path.join(root, prefix, "part-0000.parquet"), compression="snappy")
+    return schema, partitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a sample batch to partitioned Parquet with the archive schema and check "
+                    "the layout. Needs pyarrow."
+    )
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--failure-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    import pyarrow.dataset as ds
+
+    output = load_processor().handler(generate_batch(args.records, args.failure_ratio), None)
+    results = [check(all("partitionKeys" in r.get("metadata", {}) for r in output["records"]
+                         if r["result"] == "Ok"),
+                     "every record carries partition keys")]
+
+    layout_re = re.compile(r"^nginx/dt=\d{4}-\d{2}-\d{2}/hour=\d{2}/service=[A-Za-z0-9_.-]+/$")
+    with tempfile.TemporaryDirectory() as root:
+        schema, partitions = convert_batch(output, root)
+        results.append(check(all(layout_re.match(prefix) for prefix in partitions),
+                             f"{len(partitions)} prefixes follow nginx/dt=/hour=/service="))
+
+        dataset = ds.dataset(os.path.join(root, "nginx"), format="parquet", partitioning="hive")
+        table = dataset.to_table()
+        written = sum(len(rows) for rows in partitions.values())
+        results.append(check(table.num_rows == written, f"{table.num_rows} rows read back"))
+        results.append(check(all(table.schema.field(c).type == schema.field(c).type for c in schema.names),
+                             "column types match the Glue schema"))
+        results.append(check(set(PARTITION_KEYS) <= set(table.schema.names), "partition columns discovered"))
+
+        rows = table.select([TIMESTAMP_COLUMN, "dt", "hour"]).to_pylist()
+        results.append(check(all(str(r["dt"]) == r[TIMESTAMP_COLUMN].strftime("%Y-%m-%d")
+                                 and int(r["hour"]) == r[TIMESTAMP_COLUMN].hour for r in rows),
+                             "dt and hour partitions match event_time"))
+
+    raise SystemExit(0 if all(results) else 1)
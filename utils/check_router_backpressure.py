@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ecs_elk.firelens import router_environment  # noqa: E402
+from bench_firelens_modes import SAMPLE_LINE, free_port, start_fluent_bit, wait_for_port  # noqa: E402
+from check_index_lifecycle import check  # noqa: E402
+
+
+MEMORY_UNITS = {"B": 1, "KIB": 1024, "MIB": 1024 ** 2, "GIB": 1024 ** 3,
+                "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def to_bytes(size):
+    value, unit = re.match(r"([\d.]+)\s*([A-Za-z]*)", size).groups()
+    return float(value) * MEMORY_UNITS[unit.upper() or "B"]
+
+
+class StallingSink(ThreadingHTTPServer):
+    """Collects sequence numbers; while stalled it hangs requests or answers 503."""
+
+    daemon_threads = True
+
+    def __init__(self, address, stall_mode):
+        super().__init__(address, StallingHandler)
+        self.stall_mode = stall_mode
+        self.released = threading.Event()
+        self.lock = threading.Lock()
+        self.seen = set()
+        self.duplicates = 0
+        self.stalled_requests = 0
+
+
+class StallingHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        sink = self.server
+
+        if not sink.released.is_set():
+            with sink.lock:
+                sink.stalled_requests += 1
+            if sink.stall_mode == "error":
+                self.send_response(503)
+                self.end_headers()
+                return
+            sink.released.wait()
+
+        with sink.lock:
+            for record in json.loads(body):
+                if record["seq"] in sink.seen:
+                    sink.duplicates += 1
+                sink.seen.add(record["seq"])
+
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def render_config(env, input_port, sink_port):
+    """Same service and output settings as the router configs, with the input the router entrypoint writes."""
+    buffering = ("storage.type filesystem" if env["FLB_STORAGE_TYPE"] == "filesystem"
+                 else f"Mem_Buf_Limit {env['FLB_MEM_BUF_LIMIT']}")
+    return f"""[SERVICE]
+    Flush                     {env["FLB_FLUSH"]}
+    Grace                     {env["FLB_GRACE"]}
+    Log_Level                 warn
+    storage.path              {env["FLB_STORAGE_PATH"]}
+    storage.sync              normal
+    storage.checksum          off
+    storage.backlog.mem_limit {env["FLB_BACKLOG_MEM_LIMIT"]}
+    storage.max_chunks_up     {env["FLB_MAX_CHUNKS_UP"]}
+
+[INPUT]
+    Name   tcp
+    Listen 127.0.0.1
+    Port   {input_port}
+    Format json
+    {buffering}
+
+[OUTPUT]
+    Name                     http
+    Match                    *
+    Host                     127.0.0.1
+    Port                     {sink_port}
+    URI                      /stalled
+    Format                   json
+    workers                  {env["FLB_WORKERS"]}
+    Retry_Limit              {env["FLB_RETRY_LIMIT"]}
+    storage.total_limit_size {env["FLB_STORAGE_LIMIT"]}
+"""
+
+
+def memory_bytes(process, container_name):
+    if container_name is None:
+        with open(f"/proc/{process.pid}/status") as fp:
+            rss_kb = next(line.split()[1] for line in fp if line.startswith("VmRSS:"))
+        return int(rss_kb) * 1024
+    usage = subprocess.run(
+        ["docker", "stats", "--no-stream", "--format", "{{.MemUsage}}", container_name],
+        capture_output=True, text=True
+    ).stdout.split("/")[0].strip()
+    return to_bytes(usage) if usage else 0
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stall a local sink behind Fluent Bit with the router buffering settings and check "
+                    "that nothing is lost and memory stays bounded"
+    )
+    parser.add_argument("--mode", default="es", help="output mode whose workers and retry limit to use")
+    parser.add_argument("--storage-type", default="filesystem", choices=["filesystem", "memory"])
+    parser.add_argument("--records", type=int, default=300000)
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--stall-mode", default="hang", choices=["hang", "error"],
+                        help="hang requests like an overloaded ES, or answer 503 and exercise retries")
+    parser.add_argument("--memory-limit-mib", type=float, default=192,
+                        help="peak Fluent Bit memory allowed, around the task's router reservation")
+    parser.add_argument("--fluent-bit", help="local fluent-bit binary; defaults to running the image in docker")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    sink = StallingSink(("127.0.0.1", free_port()), args.stall_mode)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    storage_dir = tempfile.mkdtemp(prefix="flb-storage-")
+    env = router_environment(args.mode, {"storage_type": args.storage_type, "storage_path": storage_dir + "/"})
+    # error mode needs retries to outlast the stall, as the router should in production
+    if args.stall_mode == "error":
+        env["FLB_RETRY_LIMIT"] = "False"
+
+    input_port = free_port()
+    container_name = None if args.fluent_bit else f"flb-backpressure-{uuid.uuid4().hex[:8]}"
+    peak_memory, peak_disk = 0, 0
+    with tempfile.TemporaryDirectory() as config_dir:
+        with open(os.path.join(config_dir, "fluent-bit.conf"), "w") as fp:
+            fp.write(render_config(env, input_port, sink.server_address[1]))
+
+        fluent_bit = start_fluent_bit(config_dir, args.fluent_bit, storage_dir=storage_dir, name=container_name)
+        stop_sampling = threading.Event()
+
+        def sample():
+            global peak_memory, peak_disk
+            while not stop_sampling.wait(0.5):
+                peak_memory = max(peak_memory, memory_bytes(fluent_bit, container_name))
+                peak_disk = max(peak_disk, directory_bytes(storage_dir))
+
+        try:
+            conn = wait_for_port(input_port)
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+
+            # on a timer, a paused memory-buffered input blocks the sender
+            release = threading.Timer(args.stall_seconds, sink.released.set)
+            release.start()
+            with conn:
+                for seq in range(args.records):
+                    conn.sendall(json.dumps({"seq": seq, "log": SAMPLE_LINE}).encode("utf-8") + b"\n")
+            release.join()
+
+            deadline = time.monotonic() + args.drain_timeout
+            while time.monotonic() < deadline and len(sink.seen) < args.records:
+                time.sleep(0.5)
+        finally:
+            stop_sampling.set()
+            fluent_bit.terminate()
+            fluent_bit.wait()
+            sink.released.set()
+            sink.shutdown()
+            shutil.rmtree(storage_dir, ignore_errors=True)
+
+    missing = args.records - len(sink.seen)
+    results = [
+        check(sink.stalled_requests > 0, f"{sink.stalled_requests} requests hit the stalled sink"),
+        check(missing == 0, f"{len(sink.seen)} of {args.records} records delivered, {sink.duplicates} duplicates"),
+        check(peak_memory <= args.memory_limit_mib * 1024 ** 2,
+              f"peak memory {peak_memory / 1024 ** 2:.0f} MiB within {args.memory_limit_mib:.0f} MiB"),
+    ]
+    if args.storage_type == "filesystem":
+        results.append(check(peak_disk > 0, f"backlog spilled to disk, peak {peak_disk / 1024 ** 2:.0f} MiB"))
+
+    raise SystemExit(0 if all(results) else 1)
@@ -0,0 +1,173 @@
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_firelens_modes import SAMPLE_LINE, free_port  # noqa: E402
+from check_index_lifecycle import check  # noqa: E402
+from cleanup import clean_bucket, make_client  # noqa: E402
+from s3_to_es_loader import load, make_bulk_sender  # noqa: E402
+
+
+class BulkStandIn(ThreadingHTTPServer):
+    """_bulk endpoint that stores documents by index and id and pushes back like a busy cluster."""
+
+    daemon_threads = True
+
+    def __init__(self, address, reject_every, item_reject_ratio, seed):
+        super().__init__(address, BulkHandler)
+        self.reject_every = reject_every
+        self.item_reject_ratio = item_reject_ratio
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.largest_bulk = 0
+        self.documents = {}
+        self.writes = 0
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        lines = body.decode("utf-8").splitlines()
+        pairs = list(zip(lines[::2], lines[1::2]))
+
+        with server.lock:
+            server.requests += 1
+            reject = server.reject_every and server.requests % server.reject_every == 0
+            server.largest_bulk = max(server.largest_bulk, len(pairs))
+
+        if reject:
+            self.send_response(429)
+            self.end_headers()
+            return
+
+        items = []
+        with server.lock:
+            for action, source in pairs:
+                meta = json.loads(action)["index"]
+                if server.random.random() < server.item_reject_ratio:
+                    items.append({"index": {"_id": meta["_id"], "status": 429}})
+                    continue
+                server.documents[(meta["_index"], meta["_id"])] = json.loads(source)
+                server.writes += 1
+                items.append({"index": {"_id": meta["_id"], "status": 201}})
+
+        response = json.dumps({"took": 1, "errors": any(i["index"]["status"] > 299 for i in items),
+                               "items": items}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def seed_bucket(s3, bucket, objects, records_per_object, failed_objects):
+    """Backup objects as Firehose writes them, plus elasticsearch-failed/ envelopes."""
+    s3.create_bucket(Bucket=bucket)
+    expected = 0
+    for n in range(objects):
+        key = f"2021/01/{1 + n // 24:02d}/{n % 24:02d}/keehyun-firehose-1-{uuid.uuid4()}.gz"
+        records = "".join(json.dumps({"log": SAMPLE_LINE, "seq": f"{n}-{i}", "container_name": "nginx-test"})
+                          for i in range(records_per_object))
+        s3.put_object(Bucket=bucket, Key=key, Body=gzip.compress(records.encode("utf-8")))
+        expected += records_per_object
+
+    for n in range(failed_objects):
+        key = f"elasticsearch-failed/2021/01/01/{n:02d}/keehyun-firehose-1-{uuid.uuid4()}"
+        lines = []
+        for i in range(records_per_object):
+            doc = {"log": SAMPLE_LINE, "seq": f"failed-{n}-{i}"}
+            lines.append(json.dumps({
+                "attemptsMade": 4,
+                "errorCode": "429",
+                "errorMessage": "es_rejected_execution_exception",
+                "rawData": base64.b64encode(json.dumps(doc).encode("utf-8")).decode("utf-8"),
+                "esDocumentId": f"failed-{n}-{i}",
+                "esIndexName": "nginx_index-2021-01-01-00",
+                "esTypeName": "",
+            }))
+        s3.put_object(Bucket=bucket, Key=key, Body="\n".join(lines).encode("utf-8"))
+        expected += records_per_object
+    return expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay a seeded bucket on an S3 stand-in into a bulk stand-in that answers 429s, "
+                    "interrupt and resume, and check every document lands once. Run an S3 stand-in, "
+                    "e.g. moto_server -p 5000"
+    )
+    parser.add_argument("--endpoint-url", default="http://localhost:5000")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--objects", type=int, default=40)
+    parser.add_argument("--records-per-object", type=int, default=2000)
+    parser.add_argument("--failed-objects", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--reject-every", type=int, default=7, help="answer every Nth bulk with 429")
+    parser.add_argument("--item-reject-ratio", type=float, default=0.01)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    s3 = make_client("s3", args)
+    bucket = f"loader-check-{uuid.uuid4().hex[:8]}"
+    expected = seed_bucket(s3, bucket, args.objects, args.records_per_object, args.failed_objects)
+
+    es = BulkStandIn(("127.0.0.1", free_port()), args.reject_every, args.item_reject_ratio, seed=1)
+    threading.Thread(target=es.serve_forever, daemon=True).start()
+    send = make_bulk_sender(f"http://127.0.0.1:{es.server_address[1]}", sign=False)
+
+    total_objects = args.objects + args.failed_objects
+    with tempfile.TemporaryDirectory() as workdir:
+        checkpoint = os.path.join(workdir, "checkpoint.jsonl")
+        options = {"index": None, "workers": args.workers, "checkpoint_path": checkpoint, "report_interval": 0}
+        # backups need a new index to backfill, failed envelopes carry their own
+        try:
+            load(s3, bucket, send, source="backup", **options)
+            refused = False
+        except ValueError:
+            refused = True
+        first = load(s3, bucket, send, **options)
+        options["index"] = "nginx_index-backfill"
+        second = load(s3, bucket, send, source="backup", max_objects=args.objects // 2, **options)
+        resumed = load(s3, bucket, send, source="all", **options)
+        with open(checkpoint) as fp:
+            checkpointed = sum(1 for line in fp if line.strip())
+
+    es.shutdown()
+    clean_bucket(s3, bucket, report_interval=0)
+
+    for name, summary in (("failed", first), ("first half", second), ("resumed", resumed)):
+        print(f"{name}: {json.dumps(summary)}")
+
+    seqs = [doc["seq"] for doc in es.documents.values()]
+    results = [
+        check(len(es.documents) == expected, f"{len(es.documents)} of {expected} documents indexed"),
+        check(len(set(seqs)) == len(seqs), "no document indexed under two ids"),
+        check(refused, "backup replay without an index refused"),
+        check(checkpointed == total_objects, f"{checkpointed} of {total_objects} objects checkpointed"),
+        check(resumed["skipped_objects"] == first["objects"] + second["objects"],
+              f"resume skipped the {resumed['skipped_objects']} finished objects"),
+        check(sum(s["rejections"] for s in (first, second, resumed)) > 0, "429s were met and retried"),
+        check(es.largest_bulk <= max(s["peak_bulk_documents"] for s in (first, second, resumed)),
+              f"largest bulk {es.largest_bulk} documents within the adaptive size"),
+        check(all(not s["object_errors"] and not s["failed_documents"] for s in (first, second, resumed)),
+              "no object or document errors"),
+    ]
+
+    raise SystemExit(0 if all(results) else 1)
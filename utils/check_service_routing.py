@@ -0,0 +1,49 @@
+import argparse
+import math
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ecs_elk.firelens import delivery_stream_names, service_route  # noqa: E402
+from check_index_lifecycle import check  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Spread a fleet of services over sharded delivery streams and check that no "
+                    "stream goes over its records limit"
+    )
+    parser.add_argument("--services", type=int, default=300)
+    parser.add_argument("--records-per-service", type=float, default=200,
+                        help="average records per second one service logs")
+    parser.add_argument("--stream-records-limit", type=float, default=5000,
+                        help="records per second one DirectPut delivery stream accepts")
+    parser.add_argument("--headroom", type=float, default=0.7,
+                        help="share of the stream limit a shard should use at most")
+    parser.add_argument("--shards", type=int, help="defaults to the count the load needs")
+    args = parser.parse_args()
+
+    services = [f"service-{n:04d}" for n in range(args.services)]
+    total = args.services * args.records_per_service
+    shards = args.shards or math.ceil(total / (args.stream_records_limit * args.headroom))
+    routing = {"delivery_stream_shards": shards}
+
+    load = Counter(service_route(s, "kinesis_firehose", routing)["delivery_stream"] for s in services)
+    busiest = max(load.values()) * args.records_per_service
+    print(f"{args.services} services, {total:.0f} records/s over {shards} streams, "
+          f"busiest {busiest:.0f} records/s")
+
+    results = [
+        check(set(load) == set(delivery_stream_names("keehyun-firehose", shards)), "every stream gets services"),
+        check(all(service_route(s, "kinesis_firehose", routing) == service_route(s, "kinesis_firehose", routing)
+                  for s in services), "routes are stable"),
+        check(busiest <= args.stream_records_limit,
+              f"busiest stream within the {args.stream_records_limit:.0f} records/s limit"),
+        check(len({service_route(s, "es")["index"] for s in services}) == args.services,
+              "every service has its own index with the es output"),
+    ]
+
+    raise SystemExit(0 if all(results) else 1)
@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aws_cdk import core  # noqa: E402
+
+from ecs_elk.ecs_stack import AUTOSCALING_DEFAULTS  # noqa: E402
+from ecs_elk.search_stack import DOMAIN_CAPACITY_DEFAULTS, STORAGE_DEFAULTS  # noqa: E402
+from ecs_elk.throughput_budget import (  # noqa: E402
+    annotate_budget, budget_stages, plan_budget, render_budget_table,
+)
+from check_index_lifecycle import check  # noqa: E402
+
+
+def ecs_capacity(log_output, **overrides):
+    return dict({
+        "log_output": log_output,
+        "max_tasks": AUTOSCALING_DEFAULTS["max_capacity"],
+        "requests_per_target": AUTOSCALING_DEFAULTS["requests_per_target"],
+        "router_cpu": 128,
+        "rate_limit": 0,
+    }, **overrides)
+
+
+def firehose_capacity(**overrides):
+    return dict({"delivery_streams": 1, "source_shards": None}, **overrides)
+
+
+def search_capacity(**overrides):
+    return dict({
+        "data_nodes": DOMAIN_CAPACITY_DEFAULTS["data_nodes"],
+        "data_node_instance_type": DOMAIN_CAPACITY_DEFAULTS["data_node_instance_type"],
+        "volume_throughput": STORAGE_DEFAULTS["volume_throughput"],
+        "replicas": 1,
+    }, **overrides)
+
+
+def by_stage(rows):
+    return {row["stage"]: row for row in rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the synth-time throughput budget over a few deployments")
+    parser.add_argument("--show", action="store_true", help="print each budget table")
+    args = parser.parse_args()
+
+    def budget(peak, ecs, firehose=None, search=None, **options):
+        rows = plan_budget(peak, budget_stages(ecs, firehose or firehose_capacity(),
+                                               search or search_capacity(), **options), **options)
+        if args.show:
+            print(render_budget_table(rows) + "\n")
+        return by_stage(rows)
+
+    defaults = budget(1000, ecs_capacity("kinesis_firehose"))
+    results = [
+        check(list(defaults) == ["ecs scaling", "firelens router", "firehose directput", "elasticsearch"],
+              "the DirectPut output is budgeted router, Firehose and domain"),
+        check(not defaults["ecs scaling"]["fits"],
+              f"10 tasks at 1000 requests/min fall short of 1500/s ({defaults['ecs scaling']['ceiling']:.0f}/s)"),
+        check(defaults["firehose directput"]["bound"] == "bytes", "one delivery stream is bound by its MiB quota"),
+        check(defaults["elasticsearch"]["fits"], "the default domain takes 1500 records/s"),
+    ]
+
+    sharded = budget(1000, ecs_capacity("kinesis_firehose"), firehose_capacity(delivery_streams=4))
+    results.append(check(
+        abs(sharded["firehose directput"]["ceiling"] - 4 * defaults["firehose directput"]["ceiling"]) < 1e-6,
+        "delivery stream shards add up"))
+
+    capped = budget(1000, ecs_capacity("kinesis_firehose", rate_limit=100))
+    results.append(check(capped["firelens router"]["ceiling"] == 1000 and not capped["firelens router"]["fits"],
+                         "the edge filter rate cap bounds the router stage"))
+
+    streams = budget(20000, ecs_capacity("kinesis_streams"), firehose_capacity(source_shards=16))
+    results.append(check(not streams["kinesis source"]["fits"], "16 source shards fall short of 30000/s"))
+
+    results.append(check(list(budget(1000, ecs_capacity("cloudwatch"))) == ["ecs scaling", "firelens router"],
+                         "the CloudWatch output does not budget the domain"))
+
+    try:
+        budget_stages(ecs_capacity("kinesis_streams"), firehose_capacity(), search_capacity())
+        results.append(check(False, "kinesis_streams without a source stream is rejected"))
+    except ValueError:
+        results.append(check(True, "kinesis_streams without a source stream is rejected"))
+
+    app = core.App()
+    stacks = {key: core.Stack(app, f"Budget{key.title()}") for key in ("ecs", "firehose", "search")}
+    annotate_budget(list(defaults.values()), stacks, fail=True)
+    errors = {key: [entry for entry in stack.node.metadata if entry.type == "aws:cdk:error"]
+              for key, stack in stacks.items()}
+    results.append(check(len(errors["ecs"]) == 1 and not errors["firehose"] and not errors["search"],
+                         "only the stack of the short stage gets an error"))
+
+    raise SystemExit(0 if all(results) else 1)
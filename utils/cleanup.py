@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+
+# API limits for a single call
+S3_DELETE_BATCH = 1000
+ECR_DELETE_BATCH = 100
+
+
+class Progress:
+    """Thread-safe counters with a periodic rate line on stderr."""
+
+    def __init__(self, label, interval):
+        self.label = label
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.listed = 0
+        self.deleted = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self._stopping = threading.Event()
+        self._reporter = threading.Thread(target=self._report_loop, daemon=True)
+
+    def start(self):
+        if self.interval:
+            self._reporter.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._reporter.is_alive():
+            self._reporter.join()
+
+    def add(self, listed=0, deleted=0, errors=()):
+        with self.lock:
+            self.listed += listed
+            self.deleted += deleted
+            self.errors.extend(errors)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "target": self.label,
+                "listed": self.listed,
+                "deleted": self.deleted,
+                "errors": len(self.errors),
+                "seconds": round(elapsed, 1),
+                "deleted_per_second": round(self.deleted / elapsed, 1) if elapsed else 0.0,
+            }
+
+    def _report_loop(self):
+        last_deleted, last_time = 0, time.monotonic()
+        while not self._stopping.wait(self.interval):
+            snap = self.snapshot()
+            now = time.monotonic()
+            current = (snap["deleted"] - last_deleted) / (now - last_time)
+            last_deleted, last_time = snap["deleted"], now
+            print(f"{snap['target']}: listed {snap['listed']} deleted {snap['deleted']} "
+                  f"errors {snap['errors']} ({current:.0f}/s now, {snap['deleted_per_second']:.0f}/s avg)",
+                  file=sys.stderr)
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor that blocks submitters once max_pending jobs are queued.
+
+    Keeps listing from running arbitrarily far ahead of deletion on
+    buckets with millions of keys.
+    """
+
+    def __init__(self, workers, max_pending):
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def submit(self, fn, *args):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def make_client(service, args):
+    return boto3.client(
+        service,
+        endpoint_url=args.endpoint_url,
+        region_name=args.region,
+        # one connection per worker plus the listing threads
+        config=Config(max_pool_connections=args.workers * 2,
+                      retries={"max_attempts": 10, "mode": "adaptive"}),
+    )
+
+
+def is_versioned(s3, bucket):
+    return s3.get_bucket_versioning(Bucket=bucket).get("Status") in ("Enabled", "Suspended")
+
+
+def shard_prefixes(s3, bucket, prefix, depth, versioned):
+    """Expands prefix into the common prefixes `depth` delimiter levels below it.
+
+    Firehose backup keys start with YYYY/MM/DD/HH/, so depth 2 or 3 gives
+    one shard per month or day. Keys sitting directly at an expanded level
+    are returned as `leaves`, which the caller lists with the delimiter so
+    the deeper shards are not listed twice.
+    """
+    shards, leaves = [prefix], []
+    # keys left with only noncurrent versions or delete markers are invisible to list_objects_v2
+    paginator = s3.get_paginator("list_object_versions" if versioned else "list_objects_v2")
+    for _ in range(depth):
+        next_level = []
+        for current in shards:
+            children, has_objects = [], False
+            for page in paginator.paginate(Bucket=bucket, Prefix=current, Delimiter="/"):
+                children.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+                has_objects = has_objects or any(
+                    page.get(k) for k in ("Contents", "Versions", "DeleteMarkers")
+                )
+            if has_objects or not children:
+                # keys directly under this prefix, listed without descending
+                leaves.append(current)
+            next_level.extend(children)
+        shards = next_level
+        if not shards:
+            break
+    return shards, leaves
+
+
+def list_s3_targets(s3, bucket, prefix, versioned, delimiter=None):
+    """Yields pages of delete_objects identifiers under prefix."""
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    if delimiter:
+        kwargs["Delimiter"] = delimiter
+    if versioned:
+        # the next page starts at the key and version markers of the last
+        # entry, so a page is only handed out for deletion once the page
+        # after it has been listed
+        previous = None
+        for page in s3.get_paginator("list_object_versions").paginate(**kwargs):
+            entries = page.get("Versions", []) + page.get("DeleteMarkers", [])
+            if previous is not None:
+                yield previous
+            previous = [{"Key": e["Key"], "VersionId": e["VersionId"]} for e in entries]
+        if previous is not None:
+            yield previous
+    else:
+        for page in s3.get_paginator("list_objects_v2").paginate(**kwargs):
+            yield [{"Key": e["Key"]} for e in page.get("Contents", [])]
+
+
+def delete_s3_batch(s3, bucket, objects, progress):
+    try:
+        response = s3.delete_objects(Bucket=bucket, Delete={"Objects": objects, "Quiet": True})
+    except Exception as e:  # noqa: BLE001 - keep the other workers going
+        progress.add(errors=[{"Key": o["Key"], "Message": str(e)} for o in objects])
+        return
+    errors = response.get("Errors", [])
+    progress.add(deleted=len(objects) - len(errors), errors=errors)
+
+
+def clean_bucket(s3, bucket, prefix="", depth=2, workers=16, delete_bucket=True, report_interval=5.0):
+    versioned = is_versioned(s3, bucket)
+    progress = Progress(f"s3://{bucket}/{prefix}", report_interval).start()
+    deleter = BoundedExecutor(workers, max_pending=workers * 4)
+
+    def drain(shard, delimiter=None):
+        pending = []
+        for page in list_s3_targets(s3, bucket, shard, versioned, delimiter):
+            progress.add(listed=len(page))
+            pending.extend(page)
+            while len(pending) >= S3_DELETE_BATCH:
+                deleter.submit(delete_s3_batch, s3, bucket, pending[:S3_DELETE_BATCH], progress)
+                pending = pending[S3_DELETE_BATCH:]
+        if pending:
+            deleter.submit(delete_s3_batch, s3, bucket, pending, progress)
+
+    shards, leaves = shard_prefixes(s3, bucket, prefix, depth, versioned)
+    with ThreadPoolExecutor(max_workers=max(1, workers // 2)) as listers:
+        jobs = [listers.submit(drain, shard) for shard in shards]
+        jobs += [listers.submit(drain, leaf, "/") for leaf in leaves]
+        for job in jobs:
+            job.result()
+    deleter.shutdown()
+    progress.stop()
+
+    summary = progress.snapshot()
+    summary["versioned"] = versioned
+    summary["shards"] = len(shards) + len(leaves)
+    if delete_bucket and not prefix and not progress.errors:
+        s3.delete_bucket(Bucket=bucket)
+        summary["bucket_deleted"] = True
+    summary["error_samples"] = progress.errors[:10]
+    return summary
+
+
+def delete_ecr_batch(ecr, repo_name, image_ids, progress):
+    try:
+        response = ecr.batch_delete_image(repositoryName=repo_name, imageIds=image_ids)
+    except Exception as e:  # noqa: BLE001
+        progress.add(errors=[dict(i, failureReason=str(e)) for i in image_ids])
+        return
+    failures = [f for f in response.get("failures", []) if f.get("failureCode") != "ImageNotFound"]
+    # one entry per tag of a deleted image, counted by digest like the listing
+    deleted = {i["imageDigest"] for i in response.get("imageIds", [])}
+    progress.add(deleted=len(deleted), errors=failures)
+
+
+def clean_repository(ecr, repo_name, workers=8, delete_repository=True, report_interval=5.0):
+    progress = Progress(f"ecr://{repo_name}", report_interval).start()
+    deleter = BoundedExecutor(workers, max_pending=workers * 2)
+
+    # deleting by digest removes every tag of the image and covers untagged ones
+    for page in ecr.get_paginator("list_images").paginate(repositoryName=repo_name):
+        digests = sorted({i["imageDigest"] for i in page.get("imageIds", [])})
+        progress.add(listed=len(digests))
+        for batch in batched([{"imageDigest": d} for d in digests], ECR_DELETE_BATCH):
+            deleter.submit(delete_ecr_batch, ecr, repo_name, batch, progress)
+    deleter.shutdown()
+    progress.stop()
+
+    summary = progress.snapshot()
+    if delete_repository and not progress.errors:
+        ecr.delete_repository(repositoryName=repo_name, force=True)
+        summary["repository_deleted"] = True
+    summary["error_samples"] = progress.errors[:10]
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Empties and deletes the Firehose backup bucket or the ECR repo")
+    parser.add_argument("--endpoint-url", help="local stand-in such as a moto server")
+    parser.add_argument("--region", default=os.environ.get("CDK_REGION"))
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds, 0 disables")
+    parser.add_argument("--output", help="write the summary JSON here")
+    targets = parser.add_subparsers(dest="target", required=True)
+
+    s3_parser = targets.add_parser("s3")
+    s3_parser.add_argument("--bucket", default="firehose-log-storage")
+    s3_parser.add_argument("--prefix", default="", help="only delete under this prefix, keeps the bucket")
+    s3_parser.add_argument("--shard-depth", type=int, default=2,
+                           help="delimiter levels to expand into parallel listings")
+    s3_parser.add_argument("--keep-bucket", action="store_true")
+
+    ecr_parser = targets.add_parser("ecr")
+    ecr_parser.add_argument("--repo-name", default=os.environ.get("REPO_NAME"))
+    ecr_parser.add_argument("--keep-repository", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.target == "s3":
+        result = clean_bucket(
+            make_client("s3", args), args.bucket, prefix=args.prefix, depth=args.shard_depth,
+            workers=args.workers, delete_bucket=not args.keep_bucket,
+            report_interval=args.report_interval,
+        )
+    else:
+        if not args.repo_name:
+            parser.error("--repo-name or REPO_NAME is required")
+        result = clean_repository(
+            make_client("ecr", args), args.repo_name, workers=args.workers,
+            delete_repository=not args.keep_repository,
+            report_interval=args.report_interval,
+        )
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(result, fp, indent=2)
+    sys.exit(1 if result["errors"] else 0)
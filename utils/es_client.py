@@ -0,0 +1,16 @@
+import importlib.util
+import os
+
+
+HANDLER_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "resources", "es_bootstrap", "handler.py"
+)
+
+
+def load_bootstrap():
+    """The bootstrap custom resource's handler, whose make_sender signs requests to the domain."""
+    spec = importlib.util.spec_from_file_location("es_bootstrap", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
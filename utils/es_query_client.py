@@ -0,0 +1,456 @@
+import argparse
+import getpass
+import gzip
+import http.client
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+
+import boto3
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ecs_elk.log_archive import ARRAY_FIELDS  # noqa: E402
+
+
+# a connection the server closed while idle fails on first use, before
+# the request reaches it, so it is safe to resend on a fresh one
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+# pyarrow type factory per mapped field type
+ES_TO_ARROW_TYPES = {
+    # _source keeps dates as they were sent
+    "date": "string",
+    "date_nanos": "string",
+    "ip": "string",
+    "keyword": "string",
+    "text": "string",
+    "byte": "int8",
+    "short": "int16",
+    "integer": "int32",
+    "long": "int64",
+    "half_float": "float32",
+    "float": "float32",
+    "scaled_float": "float64",
+    "double": "float64",
+    "boolean": "bool_",
+}
+
+
+class CognitoCredentials:
+    """Identity pool credentials for a user pool login.
+
+    Credentials are cached until refresh_margin seconds before they expire
+    and shared by every thread. Renewals use the refresh token and only
+    fall back to the password once it is no longer accepted.
+    """
+
+    def __init__(self, region, user_pool_id, client_id, identity_pool_id,
+                 username, password, role_arn=None, refresh_margin=300):
+        self.region = region
+        self.user_pool_id = user_pool_id
+        self.client_id = client_id
+        self.identity_pool_id = identity_pool_id
+        self.username = username
+        self.password = password
+        # only needed for users in several groups, the token carries the preferred role
+        self.role_arn = role_arn
+        self.refresh_margin = refresh_margin
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._expires = 0.0
+        self._refresh_token = None
+        self._identity_id = None
+
+    def get(self):
+        with self._lock:
+            if self._credentials is None or time.time() >= self._expires - self.refresh_margin:
+                self._credentials, self._expires = self._fetch()
+                self.fetches += 1
+            return self._credentials
+
+    def _id_token(self):
+        idp = boto3.client("cognito-idp", region_name=self.region)
+        if self._refresh_token:
+            try:
+                return idp.initiate_auth(
+                    AuthFlow="REFRESH_TOKEN_AUTH",
+                    ClientId=self.client_id,
+                    AuthParameters={"REFRESH_TOKEN": self._refresh_token}
+                )["AuthenticationResult"]["IdToken"]
+            except idp.exceptions.NotAuthorizedException:
+                self._refresh_token = None
+
+        result = idp.initiate_auth(
+            AuthFlow="USER_PASSWORD_AUTH",
+            ClientId=self.client_id,
+            AuthParameters={"USERNAME": self.username, "PASSWORD": self.password}
+        )
+        if "AuthenticationResult" not in result:
+            raise RuntimeError(f"login asks for the {result['ChallengeName']} challenge, "
+                               "sign in to Kibana once to complete it")
+        self._refresh_token = result["AuthenticationResult"]["RefreshToken"]
+        return result["AuthenticationResult"]["IdToken"]
+
+    def _fetch(self):
+        """Return (credentials, expiry as a unix timestamp)."""
+        identity = boto3.client("cognito-identity", region_name=self.region)
+        logins = {f"cognito-idp.{self.region}.amazonaws.com/{self.user_pool_id}": self._id_token()}
+        if self._identity_id is None:
+            self._identity_id = identity.get_id(IdentityPoolId=self.identity_pool_id, Logins=logins)["IdentityId"]
+
+        extra = {"CustomRoleArn": self.role_arn} if self.role_arn else {}
+        creds = identity.get_credentials_for_identity(
+            IdentityId=self._identity_id, Logins=logins, **extra
+        )["Credentials"]
+        return (Credentials(creds["AccessKeyId"], creds["SecretKey"], creds["SessionToken"]),
+                creds["Expiration"].timestamp())
+
+
+class ConnectionPool:
+    """One keep-alive connection to the endpoint per thread."""
+
+    def __init__(self, base_url, timeout=120):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.connection_class = (http.client.HTTPSConnection if parsed.scheme == "https"
+                                 else http.client.HTTPConnection)
+        self.netloc = parsed.netloc
+        self.timeout = timeout
+        self.opened = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.netloc, timeout=self.timeout)
+            with self._lock:
+                self.opened += 1
+            return connection, False
+        return connection, True
+
+    def request(self, method, path, body, headers):
+        """Return (status, content encoding, payload)."""
+        while True:
+            connection, reused = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.getheader("Content-Encoding"), response.read()
+            except Exception as e:
+                connection.close()
+                self._local.connection = None
+                if not (reused and isinstance(e, STALE_CONNECTION_ERRORS)):
+                    raise
+
+
+class ESClient:
+    """SigV4 signed Elasticsearch client over pooled keep-alive connections.
+
+    credentials is anything with a get() returning botocore credentials,
+    usually CognitoCredentials; None sends unsigned requests to a local
+    Elasticsearch. Responses are requested gzip compressed.
+    """
+
+    def __init__(self, endpoint, region=None, credentials=None, timeout=120):
+        self.base_url = endpoint if endpoint.startswith("http") else f"https://{endpoint}"
+        self.region = region
+        self.credentials = credentials
+        self.pool = ConnectionPool(self.base_url, timeout)
+
+    def request(self, method, path, body=None):
+        """Return (status, response) like the bootstrap sender."""
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json", "Accept-Encoding": "gzip"}
+        if self.credentials is not None:
+            aws_request = AWSRequest(method=method, url=self.base_url + path, data=data, headers=headers)
+            SigV4Auth(self.credentials.get(), "es", self.region).add_auth(aws_request)
+            headers = dict(aws_request.headers.items())
+
+        status, encoding, payload = self.pool.request(method, path, data, headers)
+        if encoding == "gzip":
+            payload = gzip.decompress(payload)
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, payload.decode("utf-8", errors="replace")
+
+
+class NDJSONWriter:
+
+    def __init__(self, fp, metadata=False):
+        self.fp = fp
+        self.metadata = metadata
+
+    def write(self, hits):
+        self.fp.write("".join(json.dumps(document(hit, self.metadata)) + "\n" for hit in hits))
+
+    def close(self):
+        self.fp.flush()
+
+
+class ParquetWriter:
+    """Writes row groups of row_group_size documents.
+
+    The schema comes from the index mapping, see index_properties, so a
+    field is typed even when the first documents leave it empty. fields
+    limits it to the exported _source fields; array_fields are lists of
+    their mapped type. Unmapped _source fields are left out.
+    """
+
+    def __init__(self, path, properties, metadata=False, fields=None,
+                 array_fields=ARRAY_FIELDS, row_group_size=50000):
+        # optional, only needed for Parquet exports
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.metadata = metadata
+        self.row_group_size = row_group_size
+        self.array_fields = set(array_fields)
+        self.schema = self._schema(properties, fields)
+        self.rows = []
+        self.writer = None
+
+    def _arrow_type(self, name, mapping):
+        if "properties" in mapping and mapping.get("type", "object") in ("object", "nested"):
+            struct = self.pa.struct([(field, self._arrow_type(f"{name}.{field}", child))
+                                     for field, child in mapping["properties"].items()])
+            return self.pa.list_(struct) if mapping.get("type") == "nested" else struct
+        es_type = mapping.get("type")
+        if es_type not in ES_TO_ARROW_TYPES:
+            raise ValueError(f"No Parquet type for {name} mapped as '{es_type}', leave it out with --fields")
+        return getattr(self.pa, ES_TO_ARROW_TYPES[es_type])()
+
+    def _schema(self, properties, fields):
+        columns = []
+        for name, mapping in properties.items():
+            if fields and not any(fnmatch(name, f) or f.startswith(f"{name}.") for f in fields):
+                continue
+            arrow_type = self._arrow_type(name, mapping)
+            columns.append((name, self.pa.list_(arrow_type) if name in self.array_fields else arrow_type))
+        if self.metadata:
+            columns += [("_index", self.pa.string()), ("_id", self.pa.string())]
+        return self.pa.schema(columns)
+
+    def write(self, hits):
+        for hit in hits:
+            doc = document(hit, self.metadata)
+            for name in self.array_fields:
+                # a single value is indexed the same as a list of one
+                if name in doc and doc[name] is not None and not isinstance(doc[name], list):
+                    doc[name] = [doc[name]]
+            self.rows.append(doc)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self.schema, compression="snappy")
+        self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def index_properties(client, index):
+    """Mapped fields of the indices behind index, merged."""
+    status, response = client.request("GET", f"/{index}/_mapping")
+    if status != 200:
+        raise RuntimeError(f"mapping of {index} returned {status}: {response}")
+    properties = {}
+    for mapping in response.values():
+        properties.update(mapping["mappings"].get("properties", {}))
+    return properties
+
+
+def document(hit, metadata):
+    if not metadata:
+        return hit["_source"]
+    return dict(hit["_source"], _index=hit["_index"], _id=hit["_id"])
+
+
+def scroll_slice(client, index, body, scroll, slice_id, slices, pages, stopping):
+    """Scrolls one slice, putting each page of hits on the pages queue."""
+    body = dict(body)
+    if slices > 1:
+        body["slice"] = {"id": slice_id, "max": slices}
+    status, response = client.request("POST", f"/{index}/_search?scroll={scroll}", body)
+    if status != 200:
+        raise RuntimeError(f"slice {slice_id} search returned {status}: {response}")
+
+    scroll_id = response["_scroll_id"]
+    try:
+        while response["hits"]["hits"] and not stopping.is_set():
+            pages.put(response["hits"]["hits"])
+            status, response = client.request("POST", "/_search/scroll", {"scroll": scroll, "scroll_id": scroll_id})
+            if status != 200:
+                raise RuntimeError(f"slice {slice_id} scroll returned {status}: {response}")
+            scroll_id = response["_scroll_id"]
+    finally:
+        # frees the search contexts now rather than when the scroll times out
+        client.request("DELETE", "/_search/scroll", {"scroll_id": scroll_id})
+
+
+def export(client, index, writer, query=None, fields=None, slices=4, page_size=5000,
+           scroll="5m", max_docs=None, report_interval=10.0):
+    """Sliced scroll over index, one worker per slice, into writer.
+
+    Point in time searches need Elasticsearch 7.10, so every slice scrolls
+    its own consistent view instead. Keep slices at or below the number of
+    primary shards. Returns a summary of the run.
+    """
+    body = {"size": page_size, "sort": ["_doc"], "query": query or {"match_all": {}}}
+    if fields:
+        body["_source"] = fields
+
+    # bounded, so slow writers hold the scrolls back instead of filling memory
+    pages = queue.Queue(maxsize=slices * 2)
+    stopping = threading.Event()
+    written = 0
+    started = last_report = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=slices) as executor:
+        futures = [executor.submit(scroll_slice, client, index, body, scroll, n, slices, pages, stopping)
+                   for n in range(slices)]
+        try:
+            while not all(f.done() for f in futures) or not pages.empty():
+                if any(f.done() and f.exception() for f in futures):
+                    break
+                try:
+                    hits = pages.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if stopping.is_set():
+                    continue
+                if max_docs is not None and written + len(hits) >= max_docs:
+                    hits = hits[:max_docs - written]
+                    stopping.set()
+                writer.write(hits)
+                written += len(hits)
+
+                now = time.monotonic()
+                if report_interval and now - last_report >= report_interval:
+                    last_report = now
+                    print(f"{written} documents ({written / (now - started):,.0f}/s)", file=sys.stderr)
+        finally:
+            stopping.set()
+            # unblock workers waiting on a full queue
+            while not all(f.done() for f in futures):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        for future in futures:
+            future.result()
+
+    writer.close()
+    elapsed = time.monotonic() - started
+    return {
+        "documents": written,
+        "slices": slices,
+        "seconds": round(elapsed, 1),
+        "documents_per_second": round(written / elapsed, 1) if elapsed else 0.0,
+        "connections": client.pool.opened,
+    }
+
+
+def ssm_parameter(name, region):
+    return boto3.client("ssm", region_name=region).get_parameter(Name=name)["Parameter"]["Value"]
+
+
+def make_credentials(args):
+    for attr, parameter in (("user_pool_id", "user-pool-id"), ("client_id", "user-pool-client-id"),
+                            ("identity_pool_id", "identity-pool-id")):
+        if not getattr(args, attr):
+            setattr(args, attr, ssm_parameter(parameter, args.region))
+    password = os.environ.get("ES_PASSWORD") or getpass.getpass(f"password for {args.username}: ")
+    return CognitoCredentials(args.region, args.user_pool_id, args.client_id, args.identity_pool_id,
+                              args.username, password, role_arn=args.role_arn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Query or export the domain signed with Cognito identity pool credentials, "
+                    "the ones Kibana users sign in with"
+    )
+    parser.add_argument("--endpoint", default=os.environ.get("ES_ENDPOINT"),
+                        help="domain endpoint, e.g. the vpc-es-domain-endpoint SSM parameter")
+    parser.add_argument("--region", default=os.environ.get("CDK_REGION"))
+    parser.add_argument("--username", default=os.environ.get("ES_USERNAME"),
+                        help="user pool user, the password is read from ES_PASSWORD or prompted")
+    parser.add_argument("--user-pool-id", default=os.environ.get("USER_POOL_ID"))
+    parser.add_argument("--client-id", default=os.environ.get("USER_POOL_CLIENT_ID"))
+    parser.add_argument("--identity-pool-id", default=os.environ.get("IDENTITY_POOL_ID"))
+    parser.add_argument("--role-arn", help="role to assume when the user is in several groups")
+    parser.add_argument("--unsigned", action="store_true", help="plain requests, for a local Elasticsearch")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search = commands.add_parser("search", help="run one search and print the response")
+    search.add_argument("index")
+    search.add_argument("--body", default="{}", help="search request body as JSON")
+
+    export_parser = commands.add_parser("export", help="stream every matching document out")
+    export_parser.add_argument("index")
+    export_parser.add_argument("--query", help="query DSL as JSON")
+    export_parser.add_argument("-q", "--query-string", help="Lucene query string, e.g. 'status:>=500'")
+    export_parser.add_argument("--fields", help="comma separated _source fields")
+    export_parser.add_argument("--format", default="ndjson", choices=["ndjson", "parquet"])
+    export_parser.add_argument("--output", "-o", default="-", help="file to write, - for stdout (ndjson only)")
+    export_parser.add_argument("--metadata", action="store_true", help="add _index and _id to each document")
+    export_parser.add_argument("--slices", type=int, default=4, help="parallel scroll slices")
+    export_parser.add_argument("--page-size", type=int, default=5000)
+    export_parser.add_argument("--scroll", default="5m", help="keep-alive of each scroll between pages")
+    export_parser.add_argument("--max-docs", type=int)
+    args = parser.parse_args()
+
+    if not args.endpoint:
+        args.endpoint = ssm_parameter("vpc-es-domain-endpoint", args.region)
+    if not args.unsigned and not args.username:
+        parser.error("--username or ES_USERNAME is required for signed requests")
+    client = ESClient(args.endpoint, args.region, None if args.unsigned else make_credentials(args))
+
+    if args.command == "search":
+        status, response = client.request("POST", f"/{args.index}/_search", json.loads(args.body))
+        print(json.dumps(response, indent=2))
+        raise SystemExit(0 if status == 200 else 1)
+
+    if args.query and args.query_string:
+        parser.error("--query and --query-string are exclusive")
+    query = json.loads(args.query) if args.query else None
+    if args.query_string:
+        query = {"query_string": {"query": args.query_string}}
+
+    if args.format == "parquet":
+        if args.output == "-":
+            parser.error("parquet exports need an --output file")
+        writer = ParquetWriter(args.output, index_properties(client, args.index), args.metadata,
+                               fields=args.fields.split(",") if args.fields else None)
+    else:
+        fp = sys.stdout if args.output == "-" else open(args.output, "w")
+        writer = NDJSONWriter(fp, args.metadata)
+
+    summary = export(client, args.index, writer, query=query,
+                     fields=args.fields.split(",") if args.fields else None,
+                     slices=args.slices, page_size=args.page_size, scroll=args.scroll,
+                     max_docs=args.max_docs)
+    if args.format == "ndjson" and args.output != "-":
+        fp.close()
+    print(json.dumps(summary), file=sys.stderr)
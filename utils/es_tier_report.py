@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from es_client import load_bootstrap  # noqa: E402
+
+
+def cat_indices(send, target):
+    status, indices = send("GET", f"/_cat/indices/{target}?format=json&bytes=b&h=index,pri,rep,store.size")
+    if status != 200:
+        return None
+    return indices
+
+
+def summarize(indices):
+    shards = sum(int(i["pri"]) * (1 + int(i["rep"])) for i in indices)
+    size = sum(int(i["store.size"] or 0) for i in indices)
+    return {"indices": len(indices), "shards": shards, "gb": round(size / 1024 ** 3, 2)}
+
+
+def cold_indices(send):
+    indices, pagination_id = [], None
+    while True:
+        path = "/_cold/indices/_search"
+        if pagination_id:
+            path += f"?pagination_id={pagination_id}"
+        status, response = send("GET", path)
+        if status != 200:
+            return None
+        indices.extend(response.get("indices", []))
+        pagination_id = response.get("pagination_id")
+        if not pagination_id or not response.get("indices"):
+            return indices
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report shards and size held by each storage tier")
+    parser.add_argument("--endpoint", default=os.environ.get("ES_ENDPOINT"),
+                        help="domain endpoint, e.g. the vpc-es-domain-endpoint SSM parameter")
+    parser.add_argument("--region", default=os.environ.get("CDK_REGION"))
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if not args.endpoint:
+        args.endpoint = boto3.client("ssm", region_name=args.region).get_parameter(
+            Name="vpc-es-domain-endpoint"
+        )["Parameter"]["Value"]
+
+    bootstrap = load_bootstrap()
+    send = bootstrap.make_sender(args.endpoint, args.region, boto3.Session().get_credentials())
+
+    report = {}
+    hot = cat_indices(send, "_hot")
+    if hot is None:
+        # domains without UltraWarm do not know the _hot/_warm aliases
+        hot = cat_indices(send, "*") or []
+    report["hot"] = summarize(hot)
+
+    warm = cat_indices(send, "_warm")
+    if warm is not None:
+        report["warm"] = summarize(warm)
+
+    cold = cold_indices(send)
+    if cold is not None:
+        report["cold"] = {
+            "indices": len(cold),
+            "shards": 0,
+            "gb": round(sum(int(i.get("size", 0)) for i in cold) / 1024 ** 3, 2),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'tier':<8}{'indices':>10}{'shards':>10}{'GB':>12}")
+        for tier, summary in report.items():
+            print(f"{tier:<8}{summary['indices']:>10}{summary['shards']:>10}{summary['gb']:>12,.2f}")
@@ -0,0 +1,486 @@
+import argparse
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ecs_elk.firehose_profiles import THROUGHPUT_PROFILES  # noqa: E402
+from ecs_elk.firelens import OUTPUT_MODES  # noqa: E402
+from bench_firehose_processor import SAMPLE_AGENTS, load_handler as load_processor  # noqa: E402
+from bench_firelens_modes import free_port, start_fluent_bit, wait_for_port  # noqa: E402
+
+
+PATHS = ["/", "/index.html", "/health", "/favicon.ico", "/static/app.js", "/static/app.css",
+         "/api/orders", "/api/orders/{}", "/api/users/{}", "/api/users/{}/profile",
+         "/api/search", "/api/cart", "/api/cart/{}/items", "/login", "/logout"]
+STATUSES = [200] * 85 + [201] * 3 + [301, 302, 304, 304] + [400, 401, 403, 404, 404, 404] + [500, 502]
+
+
+def zipf_cum_weights(n, s):
+    total, cum_weights = 0.0, []
+    for k in range(1, n + 1):
+        total += 1.0 / (k ** s)
+        cum_weights.append(total)
+    return cum_weights
+
+
+class LogLineGenerator:
+    """Produces nginx combined-log lines with zipf distributed paths and clients."""
+
+    def __init__(self, zipf_s, clients, seed=None):
+        self.random = random.Random(seed)
+        self.paths = PATHS
+        self.path_weights = zipf_cum_weights(len(PATHS), zipf_s)
+        self.clients = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(1, clients + 1)]
+        self.client_weights = zipf_cum_weights(clients, zipf_s)
+        self._ts_second = None
+        self._ts = None
+
+    def timestamp(self):
+        now = int(time.time())
+        if now != self._ts_second:
+            self._ts_second = now
+            self._ts = datetime.fromtimestamp(now, timezone.utc).strftime("%d/%b/%Y:%H:%M:%S %z")
+        return self._ts
+
+    def line(self):
+        path = self.random.choices(self.paths, cum_weights=self.path_weights)[0].format(self.random.randint(1, 100000))
+        client = self.random.choices(self.clients, cum_weights=self.client_weights)[0]
+        return (f'{client} - - [{self.timestamp()}] "GET {path} HTTP/1.1" {self.random.choice(STATUSES)} '
+                f'{self.random.randint(0, 50000)} "-" "{self.random.choice(SAMPLE_AGENTS)}" '
+                f'{self.random.expovariate(50):.3f}')
+
+
+class FirehoseEmulator(ThreadingHTTPServer):
+    """Local stand-in for the delivery stream.
+
+    Accepts PutRecordBatch calls or JSON arrays from the Fluent Bit http
+    output, buffers records with the profile's Elasticsearch buffering
+    hints, optionally runs the log processor, and bulk-indexes into ES
+    with Firehose-like retries on 429s.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, es_endpoint, index_name, profile, processor=None):
+        super().__init__(address, FirehoseHandler)
+        self.es_endpoint = es_endpoint
+        self.index_name = index_name
+        self.buffer_bytes = profile["es_buffer_size"] * 1024 * 1024
+        self.buffer_interval = profile["es_buffer_interval"]
+        self.retry_duration = profile["retry_duration"]
+        self.processor = processor
+
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.buffer_started = None
+        self.received = 0
+        self.indexed = 0
+        self.failed = 0
+        self.rejections = 0
+        self.bulk_latencies = []
+        self.delays = []
+        self.stopping = threading.Event()
+        self.draining = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        self.flusher.start()
+
+    def drain(self):
+        """Flush the partial buffer once traffic stops so the tail does not wait for the interval."""
+        self.draining.set()
+
+    def stop(self):
+        self.stopping.set()
+        self.flusher.join()
+        self.shutdown()
+
+    def backlog(self):
+        with self.lock:
+            return len(self.buffer)
+
+    def put(self, records):
+        with self.lock:
+            if not self.buffer:
+                self.buffer_started = time.monotonic()
+            self.buffer.extend(records)
+            self.buffered_bytes += sum(len(r) for r in records)
+            self.received += len(records)
+
+    def _take_batch(self, force):
+        with self.lock:
+            if not self.buffer:
+                return None
+            full = self.buffered_bytes >= self.buffer_bytes
+            expired = time.monotonic() - self.buffer_started >= self.buffer_interval
+            if not (force or full or expired):
+                return None
+            batch, self.buffer, self.buffered_bytes = self.buffer, [], 0
+            return batch
+
+    def _flush_loop(self):
+        while True:
+            stopping = self.stopping.is_set()
+            batch = self._take_batch(force=stopping or self.draining.is_set())
+            if batch:
+                self._deliver(batch)
+            elif stopping:
+                return
+            else:
+                time.sleep(0.05)
+
+    def _deliver(self, batch):
+        docs = [json.loads(record) for record in batch]
+        if self.processor is not None:
+            event = {"records": [
+                {"recordId": str(i), "data": base64.b64encode(record).decode("utf-8")}
+                for i, record in enumerate(batch)
+            ]}
+            output = self.processor.handler(event, None)
+            docs = [json.loads(base64.b64decode(r["data"]))
+                    for r in output["records"] if r["result"] == "Ok"]
+
+        deadline = time.monotonic() + self.retry_duration
+        backoff = 0.5
+        pending = docs
+        while pending:
+            body = "".join(
+                json.dumps({"index": {"_index": self.index_name}}) + "\n" + json.dumps(doc) + "\n"
+                for doc in pending
+            ).encode("utf-8")
+
+            start = time.monotonic()
+            status, response = self._bulk(body)
+            self.bulk_latencies.append(time.monotonic() - start)
+
+            if status == 200:
+                items = [item["index"] for item in response.get("items", [])]
+                # like Firehose, only documents rejected with 429 are retried
+                retry = [doc for doc, item in zip(pending, items) if item.get("status") == 429]
+                errors = sum(1 for item in items if item.get("status", 200) >= 300 and item.get("status") != 429)
+                now_ms = time.time() * 1000
+                with self.lock:
+                    delivered = [doc for doc, item in zip(pending, items) if item.get("status", 200) < 300]
+                    self.indexed += len(delivered)
+                    self.failed += errors
+                    self.delays.extend(now_ms - doc["gen_ts"] for doc in delivered if "gen_ts" in doc)
+                pending = retry
+                if not pending:
+                    return
+            self.rejections += 1
+            if time.monotonic() + backoff > deadline:
+                with self.lock:
+                    self.failed += len(pending)
+                return
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 8)
+
+    def _bulk(self, body):
+        request = urllib.request.Request(
+            f"{self.es_endpoint}/_bulk",
+            data=body,
+            headers={"Content-Type": "application/x-ndjson"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, {}
+        except urllib.error.URLError:
+            return 503, {}
+
+
+class FirehoseHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = json.loads(body)
+
+        if self.headers.get("X-Amz-Target", "").endswith("PutRecordBatch"):
+            records = [base64.b64decode(r["Data"]) for r in payload["Records"]]
+            response = {"FailedPutCount": 0,
+                        "RequestResponses": [{"RecordId": str(i)} for i in range(len(records))]}
+        else:
+            records = [json.dumps(r).encode("utf-8") for r in payload]
+            response = {}
+
+        self.server.put(records)
+
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpSender:
+    """Bypasses Fluent Bit and posts straight to the emulator."""
+
+    def __init__(self, url, batch_size=500):
+        self.url = url
+        self.batch_size = batch_size
+        self.pending = []
+
+    def send(self, record):
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(self.pending).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        urllib.request.urlopen(request).read()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+
+
+class TcpSender:
+    """Feeds Fluent Bit's tcp input, standing in for the FireLens socket."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def send(self, record):
+        self.conn.sendall(json.dumps(record).encode("utf-8") + b"\n")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.conn.close()
+
+
+def fluent_bit_config(input_port, emulator_port):
+    settings = OUTPUT_MODES["kinesis_firehose"]
+    return f"""[SERVICE]
+    Flush     {settings["flush"]}
+    Grace     {settings["grace"]}
+    Log_Level warn
+
+[INPUT]
+    Name          tcp
+    Listen        127.0.0.1
+    Port          {input_port}
+    Format        json
+    Mem_Buf_Limit {settings["mem_buf_limit"]}
+
+[OUTPUT]
+    Name        http
+    Match       *
+    Host        127.0.0.1
+    Port        {emulator_port}
+    URI         /records
+    Format      json
+    workers     {settings["workers"]}
+    Retry_Limit {settings["retry_limit"]}
+"""
+
+
+def generate(sender, generator, rate, duration, stats):
+    tick = 0.01
+    per_tick = rate * tick
+    owed = 0.0
+    seq = 0
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        tick_start = time.monotonic()
+        owed += per_tick
+        blocked = 0.0
+        while owed >= 1:
+            record = {"log": generator.line(), "gen_ts": time.time() * 1000, "seq": seq,
+                      "container_name": "nginx-loadtest", "source": "stdout"}
+            send_start = time.monotonic()
+            sender.send(record)
+            blocked += time.monotonic() - send_start
+            seq += 1
+            owed -= 1
+        stats["sent"] = seq
+        stats["blocked"] += blocked
+        elapsed = time.monotonic() - tick_start
+        if elapsed < tick:
+            time.sleep(tick - elapsed)
+        else:
+            stats["behind_ticks"] += 1
+    sender.close()
+    stats["send_seconds"] = time.monotonic() - start
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def steady_rate(samples, key):
+    # drop ramp-up and drain, use the middle 80% of the samples
+    trimmed = samples[len(samples) // 10: len(samples) - len(samples) // 10] or samples
+    if len(trimmed) < 2:
+        return 0.0
+    first, last = trimmed[0], trimmed[-1]
+    return (last[key] - first[key]) / (last["t"] - first["t"])
+
+
+def saturated_stage(result, rate):
+    # walk the pipeline in order and return the first stage below 95% of its input
+    if result["generator_records_per_second"] < rate * 0.95 and result["generator_blocked_ratio"] < 0.5:
+        return "generator"
+    if result["generator_records_per_second"] < rate * 0.95:
+        return "fluent-bit"
+    if result["firehose_received_per_second"] < result["generator_records_per_second"] * 0.95:
+        return "fluent-bit"
+    if result["es_rejections"] or result["es_indexed_per_second"] < result["firehose_received_per_second"] * 0.95:
+        return "elasticsearch"
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drive generated nginx traffic through Fluent Bit, a local Firehose emulator and "
+                    "Elasticsearch and report sustained throughput and end-to-end delay. Start ES with "
+                    "e.g. docker build -t es-local resources && docker run -p 9200:9200 "
+                    "-e discovery.type=single-node -e network.publish_host=127.0.0.1 "
+                    "-e transport.publish_host=127.0.0.1 es-local"
+    )
+    parser.add_argument("--rate", type=int, default=2000, help="target records per second")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="skew of the path and client distribution")
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--profile", default="low-latency", choices=sorted(THROUGHPUT_PROFILES))
+    parser.add_argument("--es-endpoint", default="http://localhost:9200")
+    parser.add_argument("--index-name", default="loadtest-e2e")
+    parser.add_argument("--log-processing", action="store_true", help="run the Firehose log processor")
+    parser.add_argument("--fluent-bit", help="local fluent-bit binary; defaults to running the image in docker")
+    parser.add_argument("--skip-fluent-bit", action="store_true", help="post straight to the emulator")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    emulator = FirehoseEmulator(
+        ("127.0.0.1", free_port()),
+        args.es_endpoint.rstrip("/"),
+        args.index_name,
+        THROUGHPUT_PROFILES[args.profile],
+        processor=load_processor() if args.log_processing else None,
+    )
+    emulator.start()
+    emulator_port = emulator.server_address[1]
+
+    fluent_bit = None
+    config_dir = tempfile.TemporaryDirectory()
+    if args.skip_fluent_bit:
+        sender = HttpSender(f"http://127.0.0.1:{emulator_port}/records")
+    else:
+        input_port = free_port()
+        with open(os.path.join(config_dir.name, "fluent-bit.conf"), "w") as fp:
+            fp.write(fluent_bit_config(input_port, emulator_port))
+        fluent_bit = start_fluent_bit(config_dir.name, args.fluent_bit)
+        sender = TcpSender(wait_for_port(input_port))
+
+    stats = {"sent": 0, "blocked": 0.0, "behind_ticks": 0}
+    samples = []
+    generator_thread = threading.Thread(
+        target=generate,
+        args=(sender, LogLineGenerator(args.zipf_s, args.clients, args.seed), args.rate, args.duration, stats)
+    )
+    start = time.monotonic()
+    generator_thread.start()
+
+    drain_deadline = None
+    while True:
+        time.sleep(1)
+        samples.append({
+            "t": time.monotonic() - start,
+            "sent": stats["sent"],
+            "received": emulator.received,
+            "indexed": emulator.indexed,
+            "backlog": emulator.backlog(),
+        })
+        if generator_thread.is_alive():
+            continue
+        if drain_deadline is None:
+            drain_deadline = time.monotonic() + args.drain_timeout
+        if emulator.received >= stats["sent"]:
+            emulator.drain()
+        done = emulator.indexed + emulator.failed >= stats["sent"]
+        if done or time.monotonic() > drain_deadline:
+            break
+
+    emulator.stop()
+    if fluent_bit is not None:
+        fluent_bit.terminate()
+        fluent_bit.wait()
+    config_dir.cleanup()
+
+    generation = [s for s in samples if s["t"] <= args.duration] or samples
+    result = {
+        "config": {
+            "rate": args.rate,
+            "duration": args.duration,
+            "zipf_s": args.zipf_s,
+            "clients": args.clients,
+            "profile": args.profile,
+            "profile_settings": THROUGHPUT_PROFILES[args.profile],
+            "fluent_bit": None if args.skip_fluent_bit else OUTPUT_MODES["kinesis_firehose"],
+            "log_processing": args.log_processing,
+        },
+        "sent": stats["sent"],
+        "received": emulator.received,
+        "indexed": emulator.indexed,
+        "failed": emulator.failed,
+        "lost": stats["sent"] - emulator.indexed - emulator.failed,
+        "generator_records_per_second": round(stats["sent"] / stats["send_seconds"], 1),
+        "generator_blocked_ratio": round(stats["blocked"] / stats["send_seconds"], 3),
+        "firehose_received_per_second": round(steady_rate(generation, "received"), 1),
+        "es_indexed_per_second": round(steady_rate(generation, "indexed"), 1),
+        "es_rejections": emulator.rejections,
+        "es_bulk_latency_p50_ms": round((percentile(emulator.bulk_latencies, 50) or 0) * 1000, 1),
+        "es_bulk_latency_p99_ms": round((percentile(emulator.bulk_latencies, 99) or 0) * 1000, 1),
+        "delay_p50_ms": round(percentile(emulator.delays, 50) or 0, 1),
+        "delay_p99_ms": round(percentile(emulator.delays, 99) or 0, 1),
+        "delay_mean_ms": round(statistics.mean(emulator.delays), 1) if emulator.delays else None,
+        "max_firehose_backlog": max((s["backlog"] for s in samples), default=0),
+        "samples": samples,
+    }
+    result["sustained_records_per_second"] = min(
+        result["generator_records_per_second"],
+        result["firehose_received_per_second"],
+        result["es_indexed_per_second"] or result["firehose_received_per_second"],
+    )
+    result["first_saturated_stage"] = saturated_stage(result, args.rate)
+
+    summary = {k: v for k, v in result.items() if k not in ("samples", "config")}
+    print(json.dumps(summary, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(result, fp, indent=2)
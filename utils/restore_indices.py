@@ -0,0 +1,201 @@
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from es_client import load_bootstrap  # noqa: E402
+
+
+# restored copies must not be rolled over or deleted by the live policies
+IGNORED_INDEX_SETTINGS = [
+    "opendistro.index_state_management.policy_id",
+    "opendistro.index_state_management.rollover_alias",
+    "index.lifecycle.name",
+    "index.lifecycle.rollover_alias",
+]
+# another restore, snapshot or snapshot deletion holds the cluster; every
+# other snapshot_restore_exception, e.g. a name clash with an open index, is final
+BUSY_ERROR_TYPE = "concurrent_snapshot_execution_exception"
+BUSY_RESTORE_REASONS = (
+    "Restore process is already running in this cluster",
+    "cannot restore a snapshot while a snapshot deletion is in-progress",
+)
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp() * 1000 if value else None
+
+
+def is_busy(response):
+    error = response.get("error") if isinstance(response, dict) else None
+    if not isinstance(error, dict):
+        return False
+    for cause in [error] + error.get("root_cause", []):
+        if cause.get("type") == BUSY_ERROR_TYPE:
+            return True
+        if cause.get("type") == "snapshot_restore_exception" and any(
+                reason in cause.get("reason", "") for reason in BUSY_RESTORE_REASONS):
+            return True
+    return False
+
+
+def list_snapshots(send, repository):
+    status, response = send("GET", f"/_snapshot/{repository}/_all")
+    if status != 200:
+        raise SystemExit(f"listing {repository} returned {status}: {response}")
+    return sorted((s for s in response["snapshots"] if s["state"] == "SUCCESS"),
+                  key=lambda s: s["start_time_in_millis"])
+
+
+def plan_restores(snapshots, pattern, since=None, until=None):
+    """Map snapshot name to the indices to restore from it.
+
+    Each matching index comes from the newest snapshot in the window that
+    holds it, so a snapshot is read once however many indices it holds.
+    """
+    latest = {}
+    for snapshot in snapshots:
+        started = snapshot["start_time_in_millis"]
+        if (since and started < since) or (until and started > until):
+            continue
+        for index in fnmatch.filter(snapshot["indices"], pattern):
+            latest[index] = snapshot["snapshot"]
+
+    plan = {}
+    for index, snapshot in sorted(latest.items()):
+        plan.setdefault(snapshot, []).append(index)
+    return plan
+
+
+def tune_recovery(send, max_bytes_per_sec, concurrent_recoveries):
+    """Raise the recovery throttles, return the transient settings to put back."""
+    status, current = send("GET", "/_cluster/settings?flat_settings=true")
+    previous = current.get("transient", {}) if status == 200 else {}
+    wanted = {
+        "indices.recovery.max_bytes_per_sec": max_bytes_per_sec,
+        "cluster.routing.allocation.node_concurrent_recoveries": concurrent_recoveries,
+    }
+    restore = {}
+    for key, value in wanted.items():
+        # managed domains reject some cluster settings, the restore still works
+        status, response = send("PUT", "/_cluster/settings", {"transient": {key: value}})
+        if status == 200:
+            restore[key] = previous.get(key)
+        else:
+            print(f"warning: {key} was not applied ({status}): {response}", file=sys.stderr)
+    return restore
+
+
+def restore_snapshot(send, repository, snapshot, indices, prefix, retries=30, wait=10):
+    body = {
+        "indices": ",".join(indices),
+        "include_global_state": False,
+        # the live write alias stays on the live index
+        "include_aliases": False,
+        "rename_pattern": "(.+)",
+        "rename_replacement": f"{prefix}$1",
+        # primaries only and no refreshes while the files are copied
+        "index_settings": {"index.number_of_replicas": 0, "index.refresh_interval": "-1"},
+        "ignore_index_settings": IGNORED_INDEX_SETTINGS,
+    }
+    for _ in range(retries):
+        status, response = send("POST", f"/_snapshot/{repository}/{snapshot}/_restore", body)
+        if status == 200:
+            return [f"{prefix}{index}" for index in indices]
+        # older clusters run one restore or snapshot at a time
+        if not is_busy(response):
+            raise RuntimeError(f"restore of {snapshot} returned {status}: {response}")
+        time.sleep(wait)
+    raise RuntimeError(f"restore of {snapshot} still blocked after {retries} attempts")
+
+
+def recovery_progress(send, indices):
+    status, rows = send("GET", f"/_cat/recovery/{','.join(indices)}"
+                               f"?format=json&bytes=b&h=index,type,stage,bytes_recovered,bytes_total")
+    if status != 200:
+        return None
+    rows = [row for row in rows if row["type"] == "snapshot"]
+    return {
+        "shards": len(rows),
+        "done": sum(1 for row in rows if row["stage"] == "done"),
+        "bytes_recovered": sum(int(row["bytes_recovered"]) for row in rows),
+        "bytes_total": sum(int(row["bytes_total"]) for row in rows),
+    }
+
+
+def wait_for_recovery(send, indices, report_interval=10.0):
+    started = time.monotonic()
+    while True:
+        time.sleep(report_interval)
+        progress = recovery_progress(send, indices)
+        if progress is None:
+            continue
+        elapsed = time.monotonic() - started
+        rate = progress["bytes_recovered"] / 1024 ** 2 / elapsed
+        print(f"{progress['done']}/{progress['shards']} shards, "
+              f"{progress['bytes_recovered'] / 1024 ** 3:.2f} of {progress['bytes_total'] / 1024 ** 3:.2f} GB, "
+              f"{rate:,.1f} MB/s", file=sys.stderr)
+        if progress["shards"] and progress["done"] == progress["shards"]:
+            return dict(progress, seconds=round(elapsed, 1), mb_per_sec=round(rate, 1))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Restore indices from the snapshot repository in parallel under a prefix, "
+                    "with raised recovery throttles and no replicas until the copy is done"
+    )
+    parser.add_argument("pattern", help="index pattern, e.g. 'nginx_index-2021-01-*'")
+    parser.add_argument("--endpoint", default=os.environ.get("ES_ENDPOINT"),
+                        help="domain endpoint, e.g. the vpc-es-domain-endpoint SSM parameter")
+    parser.add_argument("--region", default=os.environ.get("CDK_REGION"))
+    parser.add_argument("--repository", default="log-snapshots")
+    parser.add_argument("--since", help="oldest snapshot to read, ISO date in UTC")
+    parser.add_argument("--until", help="newest snapshot to read, ISO date in UTC")
+    parser.add_argument("--prefix", default="restored-", help="prepended to the restored index names")
+    parser.add_argument("--workers", type=int, default=4, help="snapshots restored at once")
+    parser.add_argument("--max-bytes-per-sec", default="500mb", help="indices.recovery.max_bytes_per_sec")
+    parser.add_argument("--concurrent-recoveries", type=int, default=4,
+                        help="cluster.routing.allocation.node_concurrent_recoveries")
+    parser.add_argument("--replicas", type=int, default=1, help="replicas to add once restored")
+    parser.add_argument("--dry-run", action="store_true", help="only print the restore plan")
+    args = parser.parse_args()
+
+    if not args.endpoint:
+        args.endpoint = boto3.client("ssm", region_name=args.region).get_parameter(
+            Name="vpc-es-domain-endpoint"
+        )["Parameter"]["Value"]
+
+    bootstrap = load_bootstrap()
+    send = bootstrap.make_sender(args.endpoint, args.region, boto3.Session().get_credentials())
+
+    plan = plan_restores(list_snapshots(send, args.repository), args.pattern,
+                         parse_time(args.since), parse_time(args.until))
+    if not plan:
+        raise SystemExit(f"no snapshot in {args.repository} holds an index matching {args.pattern}")
+    print(json.dumps(plan, indent=2))
+    if args.dry_run:
+        raise SystemExit(0)
+
+    previous = tune_recovery(send, args.max_bytes_per_sec, args.concurrent_recoveries)
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(restore_snapshot, send, args.repository, snapshot, indices, args.prefix)
+                       for snapshot, indices in plan.items()]
+            restored = [index for future in futures for index in future.result()]
+        summary = wait_for_recovery(send, restored)
+    finally:
+        if previous:
+            send("PUT", "/_cluster/settings", {"transient": previous})
+
+    # replicas copy from the local primaries, not from S3
+    send("PUT", f"/{','.join(restored)}/_settings",
+         {"index": {"number_of_replicas": args.replicas, "refresh_interval": None}})
+    print(json.dumps(dict(summary, indices=len(restored)), indent=2))
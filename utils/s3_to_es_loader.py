@@ -0,0 +1,449 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cleanup import BoundedExecutor, make_client  # noqa: E402
+
+
+# Firehose writes failed deliveries under these prefixes, every other key
+# in the backup bucket holds the documents as delivered
+FAILED_PREFIXES = ("elasticsearch-failed/", "processing-failed/")
+HOUR_RE = re.compile(r"(?:^|/)(\d{4})/(\d{2})/(\d{2})/(\d{2})/")
+SNAPPY_FRAME_MAGIC = b"\xff\x06\x00\x00sNaPpY"
+
+# bulk item statuses worth another attempt, everything else is a document error
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class BulkRejected(Exception):
+    pass
+
+
+class AdaptiveBatchSize:
+    """Bulk size in documents shared by every worker.
+
+    Grows additively while bulks go through and halves on a 429, the way
+    the cluster's write queue asks clients to back off.
+    """
+
+    def __init__(self, initial, minimum, maximum, step):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.lock = threading.Lock()
+        self.size = max(minimum, min(initial, maximum))
+        self.peak = self.size
+
+    def current(self):
+        with self.lock:
+            return self.size
+
+    def success(self):
+        with self.lock:
+            self.size = min(self.maximum, self.size + self.step)
+            self.peak = max(self.peak, self.size)
+
+    def rejected(self):
+        with self.lock:
+            self.size = max(self.minimum, self.size // 2)
+
+
+class LoadProgress:
+    """Thread-safe counters with a periodic throughput line on stderr."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.objects = 0
+        self.skipped = 0
+        self.documents = 0
+        self.bytes = 0
+        self.rejections = 0
+        self.failed = []
+        self.started = time.monotonic()
+        self._stopping = threading.Event()
+        self._reporter = threading.Thread(target=self._report_loop, daemon=True)
+
+    def start(self):
+        if self.interval:
+            self._reporter.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._reporter.is_alive():
+            self._reporter.join()
+
+    def add(self, objects=0, skipped=0, documents=0, size=0, rejections=0, failed=()):
+        with self.lock:
+            self.objects += objects
+            self.skipped += skipped
+            self.documents += documents
+            self.bytes += size
+            self.rejections += rejections
+            self.failed.extend(failed)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                "objects": self.objects,
+                "skipped_objects": self.skipped,
+                "documents": self.documents,
+                "megabytes": round(self.bytes / 1024 ** 2, 1),
+                "rejections": self.rejections,
+                "failed_documents": len(self.failed),
+                "seconds": round(elapsed, 1),
+                "documents_per_second": round(self.documents / elapsed, 1) if elapsed else 0.0,
+                "megabytes_per_second": round(self.bytes / 1024 ** 2 / elapsed, 2) if elapsed else 0.0,
+            }
+
+    def _report_loop(self):
+        last_documents, last_time = 0, time.monotonic()
+        while not self._stopping.wait(self.interval):
+            snap = self.snapshot()
+            now = time.monotonic()
+            current = (snap["documents"] - last_documents) / (now - last_time)
+            last_documents, last_time = snap["documents"], now
+            print(f"objects {snap['objects']} documents {snap['documents']} 429s {snap['rejections']} "
+                  f"failed {snap['failed_documents']} ({current:.0f}/s now, "
+                  f"{snap['documents_per_second']:.0f}/s avg, {snap['megabytes_per_second']} MB/s)",
+                  file=sys.stderr)
+
+
+class Checkpoint:
+    """Append-only record of the objects fully acknowledged by the cluster."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as fp:
+                for line in fp:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.done.add((entry["key"], entry["etag"]))
+
+    def __contains__(self, item):
+        return item in self.done
+
+    def add(self, key, etag, documents, failed):
+        with self.lock:
+            self.done.add((key, etag))
+            if not self.path:
+                return
+            with open(self.path, "a") as fp:
+                fp.write(json.dumps({"key": key, "etag": etag, "documents": documents, "failed": failed}) + "\n")
+                fp.flush()
+                os.fsync(fp.fileno())
+
+
+def make_bulk_sender(endpoint, region=None, sign=True):
+    """Return send(body) -> (status, response) posting NDJSON to the _bulk API.
+
+    Requests are SigV4 signed with the default credentials unless sign is
+    off, for local Elasticsearch stand-ins.
+    """
+    base_url = endpoint if endpoint.startswith("http") else f"https://{endpoint}"
+    credentials = None
+    if sign:
+        # only needed against the domain
+        import boto3
+        from botocore.auth import SigV4Auth
+        from botocore.awsrequest import AWSRequest
+
+        credentials = boto3.Session().get_credentials()
+
+    def send(body):
+        headers = {"Content-Type": "application/x-ndjson"}
+        if credentials is not None:
+            aws_request = AWSRequest(method="POST", url=f"{base_url}/_bulk", data=body, headers=headers)
+            SigV4Auth(credentials.get_frozen_credentials(), "es", region).add_auth(aws_request)
+            headers = dict(aws_request.headers.items())
+
+        request = urllib.request.Request(f"{base_url}/_bulk", data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+    return send
+
+
+def decode_object(data):
+    if data[:2] == b"\x1f\x8b":
+        return gzip.decompress(data)
+    if data.startswith(SNAPPY_FRAME_MAGIC):
+        # only the low-latency profile writes Snappy backups
+        import snappy
+
+        return snappy.StreamDecompressor().decompress(data)
+    return data
+
+
+def iter_documents(data, failed):
+    """Yields (document, id, index) from a backup or failed-delivery object.
+
+    Backups are records concatenated without a separator. Failed
+    deliveries are JSON lines whose rawData holds the document and whose
+    esDocumentId and esIndexName say where it was headed.
+    """
+    text = data.decode("utf-8", errors="replace")
+    if failed:
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            envelope = json.loads(line)
+            doc = json.loads(base64.b64decode(envelope["rawData"]))
+            yield doc, envelope.get("esDocumentId"), envelope.get("esIndexName")
+        return
+
+    decoder = json.JSONDecoder()
+    position, end = 0, len(text)
+    while position < end:
+        while position < end and text[position].isspace():
+            position += 1
+        if position == end:
+            break
+        doc, position = decoder.raw_decode(text, position)
+        yield doc, None, None
+
+
+def transform_documents(processor, docs):
+    """Runs backed up FireLens envelopes through the Firehose log processor."""
+    records = [
+        {"recordId": str(n), "data": base64.b64encode(json.dumps(doc).encode("utf-8")).decode("utf-8")}
+        for n, (doc, _, _) in enumerate(docs)
+    ]
+    output = processor.handler({"records": records}, None)["records"]
+    return [
+        (json.loads(base64.b64decode(record["data"])), docs[int(record["recordId"])][1],
+         docs[int(record["recordId"])][2])
+        for record in output if record["result"] == "Ok"
+    ]
+
+
+def hour_of(key):
+    match = HOUR_RE.search(key)
+    return "".join(match.groups()) if match else None
+
+
+def list_objects(s3, bucket, prefixes, source, since=None, until=None):
+    """Yields (key, etag, size) in key order, filtered by source and by the YYYY/MM/DD/HH path."""
+    paginator = s3.get_paginator("list_objects_v2")
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for entry in page.get("Contents", []):
+                key = entry["Key"]
+                failed = key.startswith(FAILED_PREFIXES)
+                if (source == "backup" and failed) or (source == "failed" and not failed):
+                    continue
+                # processing failures never reached the processor's output
+                if key.startswith("processing-failed/") and source != "all":
+                    continue
+                hour = hour_of(key)
+                if hour and ((since and hour < since) or (until and hour > until)):
+                    continue
+                yield key, entry["ETag"].strip('"'), entry["Size"]
+
+
+def render_bulk(actions):
+    lines = []
+    for index, doc_id, doc in actions:
+        lines.append(json.dumps({"index": {"_index": index, "_id": doc_id}}))
+        lines.append(json.dumps(doc, separators=(",", ":")))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def send_batch(send, actions, sizer, progress, max_retries):
+    """Indexes actions, retrying rejected items with backoff. Returns the permanently failed items."""
+    pending = actions
+    for attempt in range(max_retries + 1):
+        status, response = send(render_bulk(pending))
+        if status in RETRY_STATUSES:
+            sizer.rejected()
+            progress.add(rejections=1)
+        elif status >= 300 or not response:
+            raise BulkRejected(f"bulk request returned {status}: {response}")
+        else:
+            retry, failed = [], []
+            for action, item in zip(pending, response["items"]):
+                result = item["index"]
+                if result["status"] < 300:
+                    continue
+                if result["status"] in RETRY_STATUSES:
+                    retry.append(action)
+                else:
+                    failed.append({"_id": action[1], "_index": action[0], "status": result["status"],
+                                   "error": result.get("error")})
+            progress.add(documents=len(pending) - len(retry) - len(failed), failed=failed)
+            if not retry:
+                sizer.success()
+                return failed
+            sizer.rejected()
+            progress.add(rejections=1)
+            pending = retry
+        # full jitter, capped at 30 seconds
+        time.sleep(random.uniform(0, min(30.0, 0.5 * 2 ** attempt)))
+    raise BulkRejected(f"{len(pending)} documents still rejected after {max_retries} retries")
+
+
+def load_object(s3, bucket, key, etag, send, sizer, progress, checkpoint,
+                index=None, processor=None, max_bulk_bytes=10 * 1024 ** 2, max_retries=8):
+    data = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    failed_object = key.startswith(FAILED_PREFIXES)
+    docs = list(iter_documents(decode_object(data), failed_object))
+    # delivery failures already went through the processor
+    if processor is not None and not key.startswith("elasticsearch-failed/"):
+        docs = transform_documents(processor, docs)
+
+    # ids derived from the object make a replay of it overwrite instead of duplicate
+    id_prefix = hashlib.sha1(f"{bucket}/{key}".encode("utf-8")).hexdigest()[:16]
+    actions = []
+    for n, (doc, doc_id, doc_index) in enumerate(docs):
+        target = index or doc_index
+        if target is None:
+            raise ValueError(f"{key}: backup documents need an index")
+        actions.append((target, doc_id or f"{id_prefix}-{n}", doc))
+
+    failed, position = [], 0
+    while position < len(actions):
+        batch, batch_bytes = [], 0
+        for action in actions[position:position + sizer.current()]:
+            size = len(json.dumps(action[2]))
+            if batch and batch_bytes + size > max_bulk_bytes:
+                break
+            batch.append(action)
+            batch_bytes += size
+        failed.extend(send_batch(send, batch, sizer, progress, max_retries))
+        position += len(batch)
+
+    progress.add(objects=1, size=len(data))
+    checkpoint.add(key, etag, len(actions), len(failed))
+    return failed
+
+
+def load(s3, bucket, send, prefixes=("",), source="failed", since=None, until=None,
+         index=None, workers=8, checkpoint_path=None, transform=False,
+         initial_bulk=500, min_bulk=50, max_bulk=5000, bulk_step=100,
+         max_bulk_bytes=10 * 1024 ** 2, max_objects=None, report_interval=5.0):
+    """Replay the objects under ``prefixes`` through the bulk API.
+
+    Failed envelopes keep the id Firehose gave them, so replaying them
+    over the live alias only fills the gaps. Backed up documents get ids
+    derived from their object, which Firehose never used: they are for
+    backfilling a new ``index`` only, into the live alias they would
+    duplicate every document already delivered. With an AllDocuments
+    backup the failed records are in both sources, so ``all`` indexes them
+    twice unless ``index`` is new as well.
+    """
+    if source != "failed" and index is None:
+        raise ValueError(f"source '{source}' replays backed up documents and needs a new index to backfill")
+    processor = None
+    if transform:
+        from bench_firehose_processor import load_handler
+
+        processor = load_handler()
+
+    checkpoint = Checkpoint(checkpoint_path)
+    sizer = AdaptiveBatchSize(initial_bulk, min_bulk, max_bulk, bulk_step)
+    progress = LoadProgress(report_interval).start()
+    # objects are read whole, keep only a few queued per worker
+    loader = BoundedExecutor(workers, max_pending=workers)
+    errors = []
+
+    def run(key, etag):
+        try:
+            load_object(s3, bucket, key, etag, send, sizer, progress, checkpoint,
+                        index=index, processor=processor, max_bulk_bytes=max_bulk_bytes)
+        except Exception as e:  # noqa: BLE001 - the object stays out of the checkpoint
+            errors.append({"Key": key, "Message": str(e)})
+
+    submitted = 0
+    for key, etag, _ in list_objects(s3, bucket, prefixes, source, since, until):
+        if (key, etag) in checkpoint:
+            progress.add(skipped=1)
+            continue
+        if max_objects is not None and submitted >= max_objects:
+            break
+        loader.submit(run, key, etag)
+        submitted += 1
+    loader.shutdown()
+    progress.stop()
+
+    summary = progress.snapshot()
+    summary["object_errors"] = len(errors)
+    summary["peak_bulk_documents"] = sizer.peak
+    summary["final_bulk_documents"] = sizer.current()
+    summary["error_samples"] = errors[:10]
+    summary["failed_samples"] = progress.failed[:10]
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay Firehose S3 backups and failed deliveries into Elasticsearch through the bulk API"
+    )
+    parser.add_argument("--bucket", default="firehose-log-storage")
+    parser.add_argument("--prefix", action="append", help="key prefix to load, repeatable; defaults to the bucket")
+    parser.add_argument("--source", default="failed", choices=["failed", "backup", "all"],
+                        help="elasticsearch-failed/ envelopes, backed up documents or both; "
+                             "backup and all are for backfilling a new --index only")
+    parser.add_argument("--since", help="first hour to load, YYYYMMDDHH from the key path")
+    parser.add_argument("--until", help="last hour to load, YYYYMMDDHH from the key path")
+    parser.add_argument("--es-endpoint", required=True, help="domain endpoint or a local http:// stand-in")
+    parser.add_argument("--index", help="target index, required with backup and all and never the live alias; "
+                                        "failed envelopes default to their own")
+    parser.add_argument("--transform", action="store_true",
+                        help="run backed up FireLens envelopes through the Firehose log processor, "
+                             "e.g. to re-index into a new mapping")
+    parser.add_argument("--endpoint-url", help="S3 stand-in such as a moto server")
+    parser.add_argument("--region", default=os.environ.get("CDK_REGION"))
+    parser.add_argument("--no-sign", action="store_true", help="send unsigned requests, implied for http://")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--bulk-documents", type=int, default=500, help="starting bulk size")
+    parser.add_argument("--min-bulk-documents", type=int, default=50)
+    parser.add_argument("--max-bulk-documents", type=int, default=5000)
+    parser.add_argument("--max-bulk-mb", type=float, default=10, help="the domain's HTTP payload limit or lower")
+    parser.add_argument("--checkpoint", help="JSON lines file of finished objects, resumed from when it exists")
+    parser.add_argument("--max-objects", type=int, help="stop after this many objects")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds, 0 disables")
+    parser.add_argument("--output", help="write the summary JSON here")
+    args = parser.parse_args()
+    if args.source != "failed" and not args.index:
+        parser.error(f"--source {args.source} needs --index, a new index to backfill into")
+
+    sender = make_bulk_sender(args.es_endpoint, args.region,
+                              sign=not (args.no_sign or args.es_endpoint.startswith("http://")))
+    result = load(
+        make_client("s3", args), args.bucket, sender,
+        prefixes=args.prefix or [""], source=args.source, since=args.since, until=args.until,
+        index=args.index, workers=args.workers, checkpoint_path=args.checkpoint, transform=args.transform,
+        initial_bulk=args.bulk_documents, min_bulk=args.min_bulk_documents, max_bulk=args.max_bulk_documents,
+        max_bulk_bytes=int(args.max_bulk_mb * 1024 ** 2), max_objects=args.max_objects,
+        report_interval=args.report_interval,
+    )
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(result, fp, indent=2)
+    sys.exit(1 if result["object_errors"] or result["failed_documents"] else 0)